@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_portfolio.settings")
+# Serve the async versions of the summary/dashboard views (see projects/async_views.py)
+os.environ.setdefault("ASYNC_VIEWS", "True")
 
 application = get_asgi_application()
@@ -40,12 +40,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Full-text search and trigram lookups
     'rest_framework',         # For DRF
     'corsheaders',            # For CORS
     'projects.apps.ProjectsConfig', # the app 
 ]
 
 MIDDLEWARE = [
+    'projects.querybudget.QueryBudgetMiddleware', # Query counts per request (first, so every query counts)
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'corsheaders.middleware.CorsMiddleware', # For CORS
@@ -87,9 +89,56 @@ DATABASES = {
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
         'HOST': os.getenv('DATABASE_HOST'),
         'PORT': os.getenv('DATABASE_PORT'),
+        # Seconds to keep connections open (0: one per request). Under ASGI the async dashboard
+        # views only run their queries concurrently when this isn't 0 (see projects/async_views.py).
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '0')),
     }
 }
 
+# Async summary/dashboard views (projects/async_views.py); asgi.py turns this on
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default. Use a backend shared by all processes (file, database, redis)
+# when import_projects runs separately from the server, so its writes invalidate the server's cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Response cache of the summary and dashboard views (see projects/caching.py)
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300')),
+    'STALE_WHILE_REVALIDATE': int(os.getenv('RESPONSE_CACHE_STALE_WHILE_REVALIDATE', '30')),
+}
+
+# AI insights (see projects/insights.py). BACKEND: 'gemini', 'stub' (offline) or a dotted class path
+AI_INSIGHTS = {
+    'BACKEND': os.getenv('AI_INSIGHTS_BACKEND', 'gemini'),
+    'MODEL': os.getenv('AI_INSIGHTS_MODEL', 'gemini-1.5-flash'),
+    'TTL': int(os.getenv('AI_INSIGHTS_TTL', str(6 * 60 * 60))),
+    'STREAM_TIMEOUT': float(os.getenv('AI_INSIGHTS_STREAM_TIMEOUT', '60')),
+    'STUB_DELAY': float(os.getenv('AI_INSIGHTS_STUB_DELAY', '0')),
+}
+
+# Per-process name -> id cache for the lookup tables (see projects/lookups.py)
+LOOKUP_NAME_CACHE = {
+    'MAX_SIZE': int(os.getenv('LOOKUP_NAME_CACHE_MAX_SIZE', '10000')),
+}
+
+# Per-request query counting and N+1 detection (see projects/querybudget.py)
+QUERY_BUDGET = {
+    # Unset: on with DEBUG only, since it normalizes the SQL of every query
+    'ENABLED': os.getenv('QUERY_BUDGET_ENABLED').lower() == 'true' if os.getenv('QUERY_BUDGET_ENABLED') else None,
+    'HEADERS': DEBUG, # X-Query-Count / X-Query-Repeated / X-Query-Budget response headers
+    'REPEAT_THRESHOLD': 3,
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,11 +1,12 @@
 from django.contrib import admin
-from .models import Country, LeadOrgUnit, Theme, Donor, Project
+from .models import Country, LeadOrgUnit, Theme, Donor, Project, ImportCheckpoint
 
 # Basic registration
 admin.site.register(Country)
 admin.site.register(LeadOrgUnit)
 admin.site.register(Theme)
 admin.site.register(Donor)
+admin.site.register(ImportCheckpoint)
 # admin.site.register(Project) 
 
 # Customized Admin for Project (optional but recommended)
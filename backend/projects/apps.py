@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ProjectsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "projects"
+
+    def ready(self):
+        # Connect the signal handlers that keep the dashboard rollup tables and the
+        # search documents current, and outdate the cached summary/dashboard responses
+        from . import rollups, caching, search  # noqa: F401
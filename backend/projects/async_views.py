@@ -0,0 +1,249 @@
+# projects/async_views.py
+
+"""
+Async versions of the summary and dashboard views, served under ASGI.
+
+Django's async ORM (`aget()`, `acount()`, ...) hands every query of a request
+to the same thread, so independent queries still run one after the other.
+gather_queries() instead runs each query function in a worker thread of its
+own, and so on a database connection of its own, and awaits them together:
+the KPIs' four queries and the bundle's two take about as long as the
+slowest one. Meanwhile the event loop keeps serving other requests.
+
+The query functions and payload helpers are the sync views' (projects/views.py),
+so the JSON is byte-identical. urls.py routes to these views when the
+ASYNC_VIEWS setting is on. asgi.py turns it on by default, while WSGI keeps
+the sync views.
+
+Each worker thread needs a database connection of its own. The queries only
+run concurrently when those connections persist: CONN_MAX_AGE
+(DATABASE_CONN_MAX_AGE) not 0, or a connection pool (OPTIONS['pool']).
+Otherwise each query would open and close a connection, so gather_queries()
+runs them one after the other on a single connection. The event loop
+still serves other requests meanwhile.
+
+AIInsightStreamView (/api/projects/insights/stream/) is async under WSGI too,
+but only ASGI sends its events as they come; WSGI buffers the whole stream.
+"""
+
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+from .caching import acache_response
+from .insights import (
+    InsightUnavailable,
+    build_prompt,
+    fingerprint,
+    get_backend,
+    get_config as get_insights_config,
+    insight_inputs,
+    is_fresh,
+    stored_insight,
+    stream_insight,
+)
+from .views import (
+    KPI_COUNT_ROLLUPS,
+    DashboardBundleView,
+    DashboardKPIsView,
+    ProjectCountByCountryView,
+    ProjectCountByLeadOrgUnitView,
+    ProjectCountByThemeView,
+    ValueByCountryView,
+    ValueByLeadOrgView,
+    ValueByThemeView,
+    WorldMapProjectDataView,
+    active_count,
+    country_project_counts,
+    kpis_payload,
+    lead_org_unit_project_counts,
+    portfolio_totals,
+    theme_project_counts,
+    value_by_country_data,
+    value_by_lead_org_data,
+    value_by_theme_data,
+)
+
+
+# --- Concurrent queries ---
+
+def _in_worker(function):
+    @functools.wraps(function)
+    def run():
+        try:
+            return function()
+        finally:
+            # Worker threads outlive requests; apply CONN_MAX_AGE to their connections like request_finished does
+            close_old_connections()
+    return run
+
+
+def connections_persist(alias=DEFAULT_DB_ALIAS):
+    settings_dict = connections[alias].settings_dict
+    return settings_dict['CONN_MAX_AGE'] != 0 or bool(settings_dict.get('OPTIONS', {}).get('pool'))
+
+
+async def gather_queries(*functions):
+    """
+    Results of the (sync, independent) query functions: run concurrently in worker
+    threads when database connections persist, else in turn in one thread.
+    """
+    if not connections_persist():
+        return await sync_to_async(lambda: [function() for function in functions])()
+    return await asyncio.gather(*(sync_to_async(_in_worker(function), thread_sensitive=False)() for function in functions))
+
+
+class AsyncDataView(View):
+    """
+    Read-only async JSON view. Subclasses implement `async get_data(request)`,
+    which returns the response data or raises a DRF APIException. The data is
+    rendered with DRF's JSONRenderer, like the sync APIViews.
+    """
+    http_method_names = ['get', 'head', 'options']
+    renderer = JSONRenderer()
+
+    async def get(self, request, *args, **kwargs):
+        request.query_params = request.GET # As on DRF requests, for the sync views' helpers
+        try:
+            data = await self.get_data(request, *args, **kwargs)
+        except APIException as exc:
+            return self.render({'detail': exc.detail}, exc.status_code)
+        response = self.render(data)
+        if getattr(self, 'cache_outcome', None):
+            response['X-Cache'] = self.cache_outcome.upper()
+        return response
+
+    async def get_data(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def render(self, data, status=200):
+        return HttpResponse(self.renderer.render(data), status=status, content_type='application/json')
+
+
+# --- Summary views ---
+
+class AsyncProjectCountByCountryView(AsyncDataView):
+    """Aggregates project counts by country."""
+    query_budget = ProjectCountByCountryView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(country_project_counts)
+        return data
+
+class AsyncProjectCountByLeadOrgUnitView(AsyncDataView):
+    """Aggregates project counts by lead organization unit."""
+    query_budget = ProjectCountByLeadOrgUnitView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(lead_org_unit_project_counts)
+        return data
+
+class AsyncProjectCountByThemeView(AsyncDataView):
+    """Aggregates project counts by theme."""
+    query_budget = ProjectCountByThemeView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(theme_project_counts)
+        return data
+
+class AsyncWorldMapProjectDataView(AsyncDataView):
+    """Provides data for the world map (project count by country)."""
+    query_budget = WorldMapProjectDataView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(functools.partial(country_project_counts, ordering=('country__name',)))
+        return data
+
+
+# --- Dashboard views ---
+
+class AsyncDashboardKPIsView(AsyncDataView):
+    """Provides key performance indicators for the dashboard; the four rollup queries run concurrently."""
+    query_budget = DashboardKPIsView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        totals, *unique_counts = await gather_queries(
+            portfolio_totals, *(functools.partial(active_count, rollup_model) for rollup_model in KPI_COUNT_ROLLUPS),
+        )
+        return kpis_payload(totals, *unique_counts)
+
+class AsyncValueByCountryView(AsyncDataView):
+    """Aggregates total PAG value by country and splits into single vs combined/regional."""
+    query_budget = ValueByCountryView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(value_by_country_data)
+        return data
+
+class AsyncValueByLeadOrgView(AsyncDataView):
+    """Aggregates total PAG value by lead organization unit."""
+    query_budget = ValueByLeadOrgView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(value_by_lead_org_data)
+        return data
+
+class AsyncValueByThemeView(AsyncDataView):
+    """Aggregates total PAG value by theme."""
+    query_budget = ValueByThemeView.query_budget
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        data, = await gather_queries(value_by_theme_data)
+        return data
+
+class AsyncDashboardBundleView(AsyncDataView):
+    """DashboardBundleView with its rollup UNION and totals row queried concurrently."""
+    query_budget = DashboardBundleView.query_budget
+    bundle = DashboardBundleView()
+
+    @acache_response
+    async def get_data(self, request, *args, **kwargs):
+        sections = self.bundle.get_sections(request)
+        dimensions = self.bundle.get_dimensions(sections)
+        queries = [lambda: list(self.bundle.rollup_rows(dimensions))]
+        if 'kpis' in sections:
+            queries.append(portfolio_totals)
+        rows, *totals = await gather_queries(*queries)
+        return self.bundle.build(sections, dimensions, rows, totals[0] if totals else None)
+
+
+# --- AI insight stream ---
+
+class AIInsightStreamView(AsyncDataView):
+    """
+    Streams the AI insight as server-sent events while the model writes it (see
+    projects/insights.py). `?timeout=` (seconds) shortens STREAM_TIMEOUT.
+    Closing the connection drops the model's stream.
+    """
+    query_budget = 3 # Portfolio totals, top countries, top themes
+
+    async def get(self, request, *args, **kwargs):
+        limit = get_insights_config()['STREAM_TIMEOUT']
+        timeout = request.GET.get('timeout')
+        if timeout is not None:
+            try:
+                timeout = float(timeout)
+            except ValueError:
+                timeout = 0
+            if not 0 < timeout:
+                return self.render({'detail': "'timeout' must be a positive number of seconds."}, 400)
+            timeout = min(timeout, limit)
+
+        backend = get_backend()
+        prompt, stored = await gather_queries(lambda: build_prompt(insight_inputs()), stored_insight)
+        if not is_fresh(stored, fingerprint(prompt, backend)):
+            try:
+                backend.check_available()
+            except InsightUnavailable as e:
+                return self.render({'error': str(e)}, 503)
+
+        response = StreamingHttpResponse(stream_insight(prompt, backend, timeout), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no' # Keep nginx from holding the events back
+        return response
@@ -0,0 +1,282 @@
+# projects/bulk.py
+
+"""
+Bulk create, partial update and delete of projects at /api/projects/bulk/:
+
+    POST   [{...project...}, ...]            -> 201, one result per item
+    PATCH  [{"id": 1, ...fields...}, ...]   -> 200
+    DELETE {"ids": [1, 2, ...]}             -> 200
+
+Items take the same fields as ProjectSerializer (names for the lookups via
+the *_input fields). Every item is validated first. If any is invalid,
+nothing is written and the response (400) says which ones and why.
+Otherwise the whole batch is applied in one transaction:
+- lookup names are resolved for all items at once (projects/lookups.py);
+- projects are written with bulk_create/bulk_update or a single delete;
+- the through tables are rewritten in bulk;
+- the rollups, search documents and response cache are updated once for
+  the batch, not per row.
+"""
+
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+from rest_framework.validators import UniqueValidator
+
+from . import caching, rollups
+from .importing import split_names
+from .lookups import resolve_names
+from .models import Project, Country, LeadOrgUnit, Theme, Donor
+from .search import refresh_search_documents
+from .serializers import ProjectSerializer
+
+MAX_ITEMS = 1000
+
+# Name input field -> (Project field, lookup model, many)
+LOOKUP_INPUTS = {
+    'country_name_input': ('country', Country, False),
+    'lead_org_unit_name_input': ('lead_org_unit', LeadOrgUnit, False),
+    'themes_input': ('themes', Theme, True),
+    'donors_input': ('donors', Donor, True),
+}
+
+
+class BulkItemSerializer(ProjectSerializer):
+    """
+    ProjectSerializer validation without the per-item uniqueness query on
+    project_id_excel; check_unique_excel_ids() does that for the whole batch.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        field = fields['project_id_excel']
+        self.unique_message = next(
+            (validator.message for validator in field.validators if isinstance(validator, UniqueValidator)), None,
+        )
+        field.validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+        return fields
+
+
+def is_id(value):
+    # bool is an int subclass: {"id": true} must not address project 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class BulkInvalid(Exception):
+    def __init__(self, results):
+        super().__init__(results)
+        self.results = results
+
+
+# --- Validation ---
+
+def validate_items(items, instances=None):
+    """
+    Validated data per item (partial when `instances`, a list matching `items`, is given).
+    Raises BulkInvalid with a result per item if any item is invalid.
+    """
+    serializers = [
+        BulkItemSerializer(instances[index] if instances else None, data=item, partial=instances is not None)
+        for index, item in enumerate(items)
+    ]
+    errors = {index: serializer.errors for index, serializer in enumerate(serializers) if not serializer.is_valid()}
+    valid = [serializer.validated_data if index not in errors else None for index, serializer in enumerate(serializers)]
+    for index, message in check_unique_excel_ids(valid, instances, serializers[0].unique_message if serializers else None).items():
+        errors.setdefault(index, {}).setdefault('project_id_excel', []).append(message)
+    if errors:
+        raise BulkInvalid([
+            {'index': index, 'status': 'invalid', 'errors': errors[index]} if index in errors else {'index': index, 'status': 'valid'}
+            for index in range(len(items))
+        ])
+    return valid
+
+
+def check_unique_excel_ids(validated, instances, message):
+    """
+    index -> error for the items setting a project_id_excel that another project
+    keeps, or that more than one project of the batch would end up with.
+    """
+    final = {}
+    for index, data in enumerate(validated):
+        if data is not None and 'project_id_excel' in data:
+            value = data['project_id_excel']
+        else:
+            value = instances[index].project_id_excel if instances else None
+        if value:
+            final[index] = value
+    if not final:
+        return {}
+    taken = set(
+        Project.objects.filter(project_id_excel__in=set(final.values()))
+        .exclude(pk__in=[instance.pk for instance in instances or []])
+        .values_list('project_id_excel', flat=True)
+    )
+    counts = Counter(final.values())
+    errors = {}
+    for index, value in final.items():
+        if validated[index] is None or 'project_id_excel' not in validated[index]:
+            continue # Not changed by this item
+        if value in taken:
+            errors[index] = message or 'project with this project id excel already exists.'
+        elif counts[value] > 1:
+            errors[index] = 'Repeated in this batch.'
+    return errors
+
+
+# --- Lookup names ---
+
+def resolve_lookups(validated):
+    """
+    Pops the *_input fields of every item. Returns, per item, {Project field: id,
+    None or [ids]} for the inputs that were given ('' clears).
+    """
+    inputs = [{name: data.pop(name) for name in LOOKUP_INPUTS if data.get(name) is not None} for data in validated]
+    ids = {}
+    for input_name, (field, model, many) in LOOKUP_INPUTS.items():
+        names = []
+        for item in inputs:
+            if input_name in item:
+                names.extend(split_names(item[input_name]) if many else [item[input_name].strip()] if item[input_name].strip() else [])
+        ids[input_name] = resolve_names(model, names)
+
+    resolved = []
+    for item in inputs:
+        values = {}
+        for input_name, value in item.items():
+            field, model, many = LOOKUP_INPUTS[input_name]
+            if many:
+                values[field] = list(dict.fromkeys(ids[input_name][name.lower()] for name in split_names(value)))
+            else:
+                values[field] = ids[input_name][value.strip().lower()] if value.strip() else None
+        resolved.append(values)
+    return resolved
+
+
+def set_many(projects, resolved):
+    """Replace the theme/donor links of the projects whose item gave them (one delete + one insert per table)."""
+    for field, column in (('themes', 'theme_id'), ('donors', 'donor_id')):
+        through = getattr(Project, field).through
+        changed = [(project, values[field]) for project, values in zip(projects, resolved) if field in values]
+        if not changed:
+            continue
+        through.objects.filter(project_id__in=[project.pk for project, ids in changed]).delete()
+        through.objects.bulk_create([
+            through(project_id=project.pk, **{column: related_id}) for project, ids in changed for related_id in ids
+        ])
+
+
+def finish(project_ids, before):
+    """Rollups, search documents and cache generation for a written batch."""
+    rollups.apply_project_changes(before, rollups.project_states(project_ids))
+    refresh_search_documents(Project.objects.filter(pk__in=project_ids))
+    caching.bump_generation_on_commit()
+
+
+# --- Operations ---
+
+def bulk_create_projects(items):
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ParseError(f'Item {index} must be an object.')
+    validated = validate_items(items)
+    with transaction.atomic(), rollups.suspended():
+        resolved = resolve_lookups(validated)
+        projects = []
+        for data, values in zip(validated, resolved):
+            fields = dict(data)
+            for field in ('country', 'lead_org_unit'):
+                if field in values:
+                    fields[f'{field}_id'] = values[field]
+            projects.append(Project(**fields))
+        Project.objects.bulk_create(projects)
+        set_many(projects, resolved)
+        finish([project.pk for project in projects], {})
+    return [{'index': index, 'status': 'created', 'id': project.pk} for index, project in enumerate(projects)]
+
+
+def bulk_update_projects(items):
+    ids = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not is_id(item.get('id')):
+            raise ParseError(f"Item {index} needs an integer 'id'.")
+        ids.append(item['id'])
+    if len(set(ids)) != len(ids):
+        raise ParseError('Each project may appear only once per batch.')
+
+    with transaction.atomic(), rollups.suspended():
+        instances = Project.objects.select_for_update().in_bulk(ids)
+        missing = [index for index, pk in enumerate(ids) if pk not in instances]
+        if missing:
+            raise BulkInvalid([
+                {'index': index, 'status': 'not_found'} if index in missing else {'index': index, 'status': 'valid'}
+                for index in range(len(items))
+            ])
+        projects = [instances[pk] for pk in ids]
+        validated = validate_items([{key: value for key, value in item.items() if key != 'id'} for item in items], projects)
+        before = rollups.project_states(ids)
+
+        resolved = resolve_lookups(validated)
+        now = timezone.now()
+        fields = {'updated_at', 'source_fingerprint'}
+        for project, data, values in zip(projects, validated, resolved):
+            for attr, value in data.items():
+                setattr(project, attr, value)
+                fields.add(attr)
+            for field in ('country', 'lead_org_unit'):
+                if field in values:
+                    setattr(project, f'{field}_id', values[field])
+                    fields.add(field)
+            # Like ProjectSerializer.update: no longer the imported source row
+            project.source_fingerprint = None
+            project.updated_at = now
+        Project.objects.bulk_update(projects, sorted(fields), batch_size=500)
+        set_many(projects, resolved)
+        finish(ids, before)
+    return [{'index': index, 'status': 'updated', 'id': pk} for index, pk in enumerate(ids)]
+
+
+def bulk_delete_projects(ids):
+    if not all(is_id(pk) for pk in ids):
+        raise ParseError("'ids' must be a list of integers.")
+    with transaction.atomic(), rollups.suspended():
+        before = rollups.project_states(ids)
+        Project.objects.filter(pk__in=list(before)).delete()
+        rollups.apply_project_changes(before, {})
+        caching.bump_generation_on_commit()
+    return [{'index': index, 'status': 'deleted' if pk in before else 'not_found', 'id': pk} for index, pk in enumerate(ids)]
+
+
+class BulkProjectMixin:
+    """Adds the `bulk/` endpoint (see the module docstring) to the project viewset."""
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        data = request.data
+        if request.method == 'DELETE':
+            items = data.get('ids') if isinstance(data, dict) else data
+        else:
+            items = data
+        if not isinstance(items, list):
+            raise ParseError("Send a JSON list of items (for DELETE, {'ids': [...]}).")
+        if len(items) > MAX_ITEMS:
+            raise ParseError(f'At most {MAX_ITEMS} items per request.')
+
+        try:
+            if request.method == 'POST':
+                return Response({'results': bulk_create_projects(items)}, status=status.HTTP_201_CREATED)
+            if request.method == 'PATCH':
+                return Response({'results': bulk_update_projects(items)}, status=status.HTTP_200_OK)
+            return Response({'results': bulk_delete_projects(items)}, status=status.HTTP_200_OK)
+        except BulkInvalid as invalid:
+            return Response(
+                {'detail': 'No changes were applied; see the invalid items.', 'results': invalid.results},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except IntegrityError as e:
+            # e.g. two projects swapping their project_id_excel in one batch
+            return Response({'detail': f'No changes were applied: {e}'.strip()}, status=status.HTTP_409_CONFLICT)
@@ -0,0 +1,311 @@
+# projects/caching.py
+
+"""
+Response cache for the read-only summary and dashboard views, and
+conditional GET (ETag / Last-Modified) support for the model viewsets.
+
+Entries are tagged with the portfolio "generation", a counter kept in the cache
+that every Project/lookup/m2m write and every import bumps. An entry is fresh
+while its generation is current and it is younger than TIMEOUT. With
+STALE_WHILE_REVALIDATE > 0, an outdated entry younger than that many seconds
+is still served while a single background thread recomputes it.
+
+Configured with the RESPONSE_CACHE setting; the cache backend is
+CACHES[RESPONSE_CACHE['ALIAS']]. The generation has to be visible to every
+process that writes (including `manage.py import_projects`), so use a shared
+backend (file, database, memcached, redis) outside of development.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Max
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from . import rollups
+from .models import Project, Country, LeadOrgUnit, Theme, Donor
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300, # Seconds an entry of the current generation is served without recomputing
+    'STALE_WHILE_REVALIDATE': 0, # Seconds an outdated entry may still be served during a refresh
+    'KEY_PREFIX': 'projects-response',
+}
+
+COUNTERS = ['hits', 'misses', 'stale']
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+def get_cache():
+    return caches[get_config()['ALIAS']]
+
+
+def _key(*parts):
+    return ':'.join([get_config()['KEY_PREFIX'], *map(str, parts)])
+
+
+# --- Generation ---
+
+def get_generation():
+    cache = get_cache()
+    # Start from the clock, so a generation lost to eviction is never reused by older entries.
+    cache.add(_key('generation'), int(time.time() * 1000), timeout=None)
+    return cache.get(_key('generation'))
+
+
+def bump_generation():
+    """Outdate every cached response. Safe to call often: it is a single counter increment."""
+    cache = get_cache()
+    try:
+        return cache.incr(_key('generation'))
+    except ValueError: # Key missing (evicted or never set)
+        cache.add(_key('generation'), int(time.time() * 1000), timeout=None)
+        return cache.get(_key('generation'))
+
+
+def bump_generation_on_commit():
+    # After the commit, so a concurrent request can't cache the old data under the new generation.
+    transaction.on_commit(bump_generation)
+
+
+# --- Counters ---
+
+def _count(counter):
+    cache = get_cache()
+    key = _key('stats', counter)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass # Evicted between add and incr; losing one count is fine
+
+
+def get_stats():
+    """Hit/miss/stale counters (since the cache was last cleared) and the current generation."""
+    cache = get_cache()
+    values = cache.get_many([_key('stats', counter) for counter in COUNTERS])
+    stats = {counter: values.get(_key('stats', counter), 0) for counter in COUNTERS}
+    served = sum(stats.values())
+    stats['hit_ratio'] = round((stats['hits'] + stats['stale']) / served, 3) if served else None
+    stats['generation'] = get_generation()
+    return stats
+
+
+# --- Cached computation ---
+
+def cached(name, compute, timeout=None, stale_while_revalidate=None):
+    """
+    Returns (value, outcome) for the entry `name`, where outcome is 'hit', 'stale' or 'miss'.
+    `compute()` produces the value on a miss, or in a background thread for a stale hit.
+    """
+    config = get_config()
+    timeout = config['TIMEOUT'] if timeout is None else timeout
+    stale_while_revalidate = config['STALE_WHILE_REVALIDATE'] if stale_while_revalidate is None else stale_while_revalidate
+    cache = get_cache()
+    key = _key('entry', name)
+    generation = get_generation()
+    entry = cache.get(key)
+    now = time.time()
+
+    if entry is not None:
+        age = now - entry['created_at']
+        if entry['generation'] == generation and age < timeout:
+            _count('hits')
+            return entry['value'], 'hit'
+        if age < timeout + stale_while_revalidate and stale_while_revalidate > 0:
+            _count('stale')
+            # Only one refresh per entry at a time; the lock expires in case the refresh dies.
+            if cache.add(_key('refreshing', name), 1, timeout=max(int(timeout), 30)):
+                threading.Thread(
+                    target=_refresh, args=(key, name, compute, generation, timeout + stale_while_revalidate), daemon=True,
+                ).start()
+            return entry['value'], 'stale'
+
+    _count('misses')
+    value = compute()
+    _store(key, value, generation, timeout + stale_while_revalidate)
+    return value, 'miss'
+
+
+def _store(key, value, generation, ttl):
+    get_cache().set(key, {'generation': generation, 'created_at': time.time(), 'value': value}, timeout=ttl)
+
+
+def _refresh(key, name, compute, generation, ttl):
+    try:
+        _store(key, compute(), generation, ttl)
+    finally:
+        get_cache().delete(_key('refreshing', name))
+        close_old_connections() # This thread's own database connection
+
+
+class _NotCacheable(Exception):
+    pass
+
+
+def cache_response(get):
+    """
+    Decorator for the get() method of an APIView: caches the data of successful
+    responses per view and query string, and adds an X-Cache header (HIT, STALE
+    or MISS). The view may set `cache_timeout` / `cache_stale_while_revalidate`
+    (seconds) to override the RESPONSE_CACHE defaults.
+    """
+    @functools.wraps(get)
+    def cached_get(self, request, *args, **kwargs):
+        query = '&'.join(f'{key}={value}' for key, value in sorted(request.query_params.items()))
+        name = f'{type(self).__name__}:{query}'
+        uncached = []
+
+        def compute():
+            response = get(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                uncached.append(response) # Errors are returned as they are, never cached
+                raise _NotCacheable
+            return response.data
+
+        try:
+            data, outcome = cached(
+                name, compute,
+                getattr(self, 'cache_timeout', None), getattr(self, 'cache_stale_while_revalidate', None),
+            )
+        except _NotCacheable:
+            return uncached[0]
+        response = Response(data)
+        response['X-Cache'] = outcome.upper()
+        return response
+    return cached_get
+
+
+async def acached(name, compute, timeout=None, stale_while_revalidate=None):
+    """
+    cached() for async code: `compute` is a coroutine function. The cache calls run in
+    a worker thread, which hands the computation back to the event loop on a miss.
+    """
+    def run():
+        try:
+            return cached(name, async_to_sync(compute), timeout, stale_while_revalidate)
+        finally:
+            # The view's sync queries run in this worker thread too, on a connection of its own
+            close_old_connections()
+
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+def acache_response(get):
+    """
+    cache_response for the async get() of an AsyncDataView (projects/async_views.py),
+    which returns the response data; errors are raised and so never cached.
+    """
+    @functools.wraps(get)
+    async def cached_get(self, request, *args, **kwargs):
+        query = '&'.join(f'{key}={value}' for key, value in sorted(request.GET.items()))
+        name = f'{type(self).__name__}:{query}'
+
+        async def compute():
+            return await get(self, request, *args, **kwargs)
+
+        data, outcome = await acached(
+            name, compute, getattr(self, 'cache_timeout', None), getattr(self, 'cache_stale_while_revalidate', None),
+        )
+        self.cache_outcome = outcome
+        return data
+    return cached_get
+
+
+# --- Conditional GET ---
+
+class ConditionalGetMixin:
+    """
+    Strong ETag headers for the list and retrieve actions of a viewset, computed
+    with one aggregate query (row count and newest `updated_at`, or highest pk for
+    the lookup tables, which have no `updated_at`) over the filtered queryset plus
+    the portfolio generation. The generation changes on every write, including
+    lookup renames that only change the nested names. A matching If-None-Match
+    gets a 304 before the page is fetched or serialized.
+
+    Retrieved projects also get Last-Modified. Lists don't: deleting a row other
+    than the newest leaves their newest `updated_at` unchanged.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional_get(
+            request, queryset, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (ValueError, TypeError, ValidationError):
+            return super().retrieve(request, *args, **kwargs) # e.g. /api/projects/abc/: get_object_or_404 gives the 404
+        return self._conditional_get(
+            request, queryset, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+    def _conditional_get(self, request, queryset, get_response):
+        has_updated_at = any(field.name == 'updated_at' for field in queryset.model._meta.concrete_fields)
+        stats = queryset.order_by().aggregate(count=Count('pk'), last=Max('updated_at' if has_updated_at else 'pk'))
+        if not stats['count'] and self.action == 'retrieve':
+            return get_response() # The 404
+
+        # The host is part of the payload (pagination links), so it is part of the ETag.
+        validators = [
+            type(self).__name__, self.action, request.build_absolute_uri('/'), sorted(request.query_params.lists()),
+            stats['count'], stats['last'], get_generation(),
+        ]
+        etag = '"%s"' % hashlib.sha256(repr(validators).encode('utf-8')).hexdigest()[:32]
+        last_modified = None
+        if has_updated_at and stats['last'] and self.action == 'retrieve':
+            last_modified = int(stats['last'].timestamp()) # HTTP dates have whole seconds
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Let browsers keep the payload, but always revalidate it with the validators above
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+# --- Invalidation ---
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=LeadOrgUnit)
+@receiver(post_delete, sender=LeadOrgUnit)
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+@receiver(post_save, sender=Donor)
+@receiver(post_delete, sender=Donor)
+def bump_generation_on_write(sender, **kwargs):
+    # Bulk writes (import_projects) run with the rollup handlers suspended and bump once per chunk.
+    if not rollups.is_suspended():
+        bump_generation_on_commit()
+
+
+@receiver(m2m_changed, sender=Project.themes.through)
+@receiver(m2m_changed, sender=Project.donors.through)
+def bump_generation_on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and not rollups.is_suspended():
+        bump_generation_on_commit()
@@ -0,0 +1,133 @@
+# projects/exporting.py
+
+"""
+Streaming export of the project list: /api/projects/export/?format=csv|ndjson.
+
+The export takes the same `?search=`, `?ordering=` and `?fields=` /
+`?exclude=` parameters as the list, without pagination. It streams instead
+of building the whole file:
+- the rows come from a server-side cursor (`.iterator(chunk_size=...)`)
+  over ProjectListReader's values() query (see projects/readers.py);
+- each chunk of rows gets one query per requested M2M and is written out
+  before the next one is read.
+
+Memory therefore stays at about one chunk, and the header (CSV) goes out
+before the first query runs.
+
+Rows are the list's JSON objects. In NDJSON that is one object per line. In
+CSV the nested country/lead org unit become their name and the theme/donor
+lists their names joined with "; " (names may themselves contain commas).
+"""
+
+import csv
+import io
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .readers import ProjectListReader
+
+EXPORT_CHUNK_SIZE = 2000
+LIST_SEPARATOR = '; '
+
+
+# Renderers only select the format through content negotiation (`?format=` or
+# the Accept header); the export view streams the body itself.
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=JSONEncoder).encode() # Only errors get here
+
+
+class NDJSONRenderer(CSVRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+# --- Rows ---
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_chunks(reader, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Lists of represented projects of `queryset`, each read and represented on its own."""
+    rows = reader.values_queryset(queryset).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        yield reader.represent(chunk)
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, dict):
+        return value.get('name', '')
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(item.get('name', '') for item in value)
+    return value
+
+
+# --- Streams ---
+
+def csv_stream(reader, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    names = [name for name, field in reader.output]
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(names)
+    yield flush()
+    for chunk in export_chunks(reader, queryset, chunk_size):
+        for row in chunk:
+            writer.writerow([csv_cell(row[name]) for name in names])
+        yield flush()
+
+
+def ndjson_stream(reader, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for chunk in export_chunks(reader, queryset, chunk_size):
+        yield ''.join(encoder.encode(row) + '\n' for row in chunk)
+
+
+STREAMS = {
+    'csv': (csv_stream, 'text/csv; charset=utf-8'),
+    'ndjson': (ndjson_stream, 'application/x-ndjson; charset=utf-8'),
+}
+
+
+class ProjectExportMixin:
+    """Adds the `export/` endpoint (see the module docstring) to the project viewset."""
+    export_chunk_size = EXPORT_CHUNK_SIZE
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        export_format = request.accepted_renderer.format
+        fieldset = self.get_fieldset() if hasattr(self, 'get_fieldset') else None
+        reader = ProjectListReader(fieldset, self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset())
+
+        stream, content_type = STREAMS[export_format]
+        response = StreamingHttpResponse(stream(reader, queryset, self.export_chunk_size), content_type=content_type)
+        filename = f'projects-{timezone.localdate():%Y%m%d}.{export_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
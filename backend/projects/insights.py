@@ -0,0 +1,437 @@
+# projects/insights.py
+
+"""
+AI-generated portfolio insights, stored and refreshed in the background.
+
+Generating an insight takes seconds, while the numbers it is based on rarely
+change. The prompt inputs (totals, top countries and top themes, read from
+the rollup tables in three queries) are fingerprinted, and the generated
+insight is stored in the response cache backend (see projects/caching.py)
+with the fingerprint of its inputs. A request:
+- gets the stored insight right away, marked `stale` when its fingerprint no
+  longer matches the current inputs or it is older than TTL;
+- in that case (or when there is none yet) starts a generation in a
+  background thread. A lock in the cache makes this single-flight: concurrent
+  requests, in this process or another, never generate the same insight twice;
+- gets a 202 while the very first insight is being generated.
+
+A failed generation is recorded and not retried for RETRY_AFTER seconds.
+
+stream_insight() serves /api/projects/insights/stream/ instead. It sends the
+insight as server-sent events while the model writes it, so the first words
+show up after the model's time to first token rather than after the whole
+generation. It is an async generator, so it streams under ASGI. The model's
+stream is dropped when the client disconnects or STREAM_TIMEOUT passes.
+
+The model is behind a backend class, chosen with AI_INSIGHTS['BACKEND']:
+'gemini' (Google Gemini, needs GEMINI_API_KEY), 'stub' (offline and
+deterministic, for development and tests) or the dotted path of a class with
+the same interface: `name`, `model`, check_available(), generate(prompt) and
+stream(prompt), an iterator of text chunks.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import caching
+from .models import CountryRollup, PortfolioRollup, ThemeRollup
+
+DEFAULTS = {
+    'BACKEND': 'gemini',
+    'MODEL': 'gemini-1.5-flash',
+    'TTL': 6 * 60 * 60, # Seconds before an insight is regenerated even if its inputs didn't change
+    'RETRY_AFTER': 60, # Seconds before a failed generation is tried again
+    'LOCK_TIMEOUT': 120, # Longest a generation may hold the single-flight lock
+    'STREAM_TIMEOUT': 60, # Seconds a streamed generation may take in all
+    'STUB_DELAY': 0, # Seconds the stub backend takes per insight (spread over its chunks when streaming)
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'AI_INSIGHTS', {})}
+
+
+class InsightUnavailable(Exception):
+    """The configured backend can't generate insights (missing key or library)."""
+
+
+class InsightError(Exception):
+    """A generation failed."""
+
+
+# --- Backends ---
+
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+    print("Warning: 'google-generativeai' library not found. AI insights will not be available.")
+
+if not GEMINI_API_KEY:
+    print("Warning: GEMINI_API_KEY not found. AI insights will not be available.")
+elif genai:
+    try:
+        genai.configure(api_key=GEMINI_API_KEY)
+    except Exception as e:
+        print(f"Error configuring Gemini API: {e}. AI insights will not be available.")
+        GEMINI_API_KEY = None
+else:
+    print("Warning: GEMINI_API_KEY is set, but 'google-generativeai' library is missing. AI insights cannot be initialized.")
+    GEMINI_API_KEY = None
+
+
+class GeminiBackend:
+    name = 'gemini'
+
+    def __init__(self, config):
+        self.model = config['MODEL']
+
+    def check_available(self):
+        if not GEMINI_API_KEY or not genai:
+            raise InsightUnavailable('AI service is not configured or unavailable.')
+
+    def generate(self, prompt):
+        response = genai.GenerativeModel(self.model).generate_content(prompt)
+        if response and hasattr(response, 'text') and response.text:
+            return response.text
+        if response and response.candidates and response.candidates[0].content.parts[0].text:
+            return response.candidates[0].content.parts[0].text
+        raise InsightError('AI service returned no insight. Content may be blocked or response structure unexpected.')
+
+    def stream(self, prompt):
+        response = genai.GenerativeModel(self.model).generate_content(prompt, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError: # A chunk without text parts (e.g. only safety ratings)
+                continue
+            if text:
+                yield text
+
+
+class StubBackend:
+    """Offline backend: restates the prompt's figures, after STUB_DELAY seconds."""
+    name = 'stub'
+
+    def __init__(self, config):
+        self.model = 'stub'
+        self.delay = float(config['STUB_DELAY'])
+
+    def check_available(self):
+        pass
+
+    def generate(self, prompt):
+        return ''.join(self.stream(prompt))
+
+    def stream(self, prompt):
+        count = re.search(r'Overall Project Count: (.+)', prompt)
+        value = re.search(r'Total PAG Value: (.+)', prompt)
+        items = re.findall(r'^- (.+): (\d+) projects$', prompt, re.MULTILINE)
+        if count and value:
+            lines = [f'The portfolio has {count.group(1)} projects with a total PAG value of {value.group(1)}.']
+        else: # The prompt's wording changed; still answer, without the totals
+            lines = ['The portfolio totals could not be read from the prompt.']
+        if items:
+            lines.append('Largest by project count: ' + ', '.join(f'{name} ({projects})' for name, projects in items) + '.')
+        # One chunk per word, like a model writing
+        chunks = re.findall(r'\S+\s*', '\n'.join(lines))
+        for chunk in chunks:
+            time.sleep(self.delay / len(chunks))
+            yield chunk
+
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'stub': StubBackend,
+}
+
+
+def get_backend():
+    config = get_config()
+    backend_class = BACKENDS.get(config['BACKEND']) or import_string(config['BACKEND'])
+    return backend_class(config)
+
+
+# --- Prompt ---
+
+def insight_inputs():
+    """The figures the insight is about, from the rollup tables."""
+    totals = PortfolioRollup.objects.filter(pk=PortfolioRollup.GLOBAL_PK).first() or PortfolioRollup()
+    return {
+        'total_projects_count': totals.project_count,
+        'total_pag_value': totals.pag_value,
+        'country_counts': list(
+            CountryRollup.objects.filter(project_count__gt=0)
+            .order_by('-project_count', 'country__name').values_list('country__name', 'project_count')[:10]
+        ),
+        'theme_counts': list(
+            ThemeRollup.objects.filter(project_count__gt=0)
+            .order_by('-project_count', 'theme__name').values_list('theme__name', 'project_count')[:10]
+        ),
+    }
+
+
+def build_prompt(inputs):
+    country_list_str = "\n".join([f"- {name}: {count} projects" for name, count in inputs['country_counts']]) if inputs['country_counts'] else "No data available for top countries."
+    theme_list_str = "\n".join([f"- {name}: {count} projects" for name, count in inputs['theme_counts']]) if inputs['theme_counts'] else "No data available for top themes."
+
+    return f"""
+Analyze the following project data from UN-Habitat and provide a concise summary of key insights and trends.
+
+Overall Project Count: {inputs['total_projects_count']}
+Total PAG Value: {inputs['total_pag_value']}
+
+Top 10 Countries by Project Count:
+{country_list_str}
+
+Top 10 Themes by Project Count:
+{theme_list_str}
+
+Based on this data, highlight:
+- The overall scale of the project portfolio and total value.
+- Key geographic areas of focus.
+- Dominant thematic areas.
+- Any notable patterns or observations.
+
+Keep the summary concise and easy to understand, suitable for a dashboard display.
+"""
+
+
+def fingerprint(prompt, backend):
+    """Identifies what an insight was generated from: the prompt, the backend and its model."""
+    return hashlib.sha256(f'{backend.name}\0{backend.model}\0{prompt}'.encode('utf-8')).hexdigest()
+
+
+# --- Storage and generation ---
+
+def _key(name):
+    return f"{caching.get_config()['KEY_PREFIX']}:ai-insight:{name}"
+
+
+def stored_insight():
+    """The last generated insight: {'insight', 'fingerprint', 'generated_at' (epoch), 'backend'}, or None."""
+    return caching.get_cache().get(_key('latest'))
+
+
+def acquire_lock():
+    """The single-flight lock for generations: a token for release_lock(), or None while another one holds it."""
+    token = uuid.uuid4().hex
+    return token if caching.get_cache().add(_key('lock'), token, timeout=get_config()['LOCK_TIMEOUT']) else None
+
+
+def release_lock(token):
+    """
+    Release the lock if `token` still holds it. A generation that ran past LOCK_TIMEOUT
+    must not delete the lock another one took since (the cache API has no atomic
+    compare-and-delete, which leaves a much smaller window).
+    """
+    cache = caching.get_cache()
+    if cache.get(_key('lock')) == token:
+        cache.delete(_key('lock'))
+
+
+def store_insight(insight, key, backend):
+    stored = {'insight': insight, 'fingerprint': key, 'generated_at': time.time(), 'backend': backend.name}
+    cache = caching.get_cache()
+    cache.set(_key('latest'), stored, timeout=None)
+    cache.delete(_key('error'))
+    return stored
+
+
+def record_error(error, key):
+    print(f"An error occurred while generating AI insights: {error}")
+    caching.get_cache().set(
+        _key('error'), {'message': str(error), 'fingerprint': key, 'at': time.time()}, timeout=get_config()['RETRY_AFTER'],
+    )
+
+
+def generate_insight(prompt, backend):
+    """
+    Generate and store the insight for `prompt`, unless another generation holds
+    the lock. Returns True when this call did the generation.
+    """
+    token = acquire_lock()
+    if token is None:
+        return False
+    key = fingerprint(prompt, backend)
+    try:
+        store_insight(backend.generate(prompt), key, backend)
+    except Exception as e:
+        record_error(e, key)
+    finally:
+        release_lock(token)
+    return True
+
+
+def recent_error(key):
+    """The recorded failure of the last generation for `key`, until RETRY_AFTER has passed (the entry expires)."""
+    error = caching.get_cache().get(_key('error'))
+    return error if error and error['fingerprint'] == key else None
+
+
+def refresh_in_background(prompt, backend):
+    """Start a generation in a daemon thread, unless one is running or the last one just failed."""
+    error = recent_error(fingerprint(prompt, backend))
+    if error:
+        return error
+    if caching.get_cache().get(_key('lock')) is None:
+        threading.Thread(target=generate_insight, args=(prompt, backend), daemon=True).start()
+    return None
+
+
+def current_insight():
+    """
+    (payload, status code) for the insights endpoint. Raises InsightUnavailable when the
+    backend isn't configured and nothing was generated before.
+    """
+    backend = get_backend()
+    prompt = build_prompt(insight_inputs())
+    key = fingerprint(prompt, backend)
+    stored = stored_insight()
+    if is_fresh(stored, key):
+        return _payload(stored, stale=False, refreshing=False), 200
+
+    try:
+        backend.check_available()
+    except InsightUnavailable:
+        if stored is None:
+            raise
+        return _payload(stored, stale=True, refreshing=False), 200 # The last insight is better than none
+
+    error = refresh_in_background(prompt, backend)
+    if stored is not None:
+        return _payload(stored, stale=True, refreshing=error is None), 200
+    if error is not None:
+        return {'error': f"An error occurred while processing AI insights: {error['message']}"}, 500
+    return {'insight': None, 'refreshing': True, 'detail': 'The insight is being generated; try again shortly.'}, 202
+
+
+def is_fresh(stored, key):
+    return (
+        stored is not None and stored['fingerprint'] == key
+        and time.time() - stored['generated_at'] < get_config()['TTL']
+    )
+
+
+def _payload(stored, stale, refreshing):
+    return {
+        'insight': stored['insight'],
+        'generated_at': datetime.fromtimestamp(stored['generated_at'], tz=timezone.utc).isoformat(),
+        'backend': stored['backend'],
+        'stale': stale,
+        'refreshing': refreshing,
+    }
+
+
+# --- Streaming ---
+
+_END = object()
+WAIT_POLL_INTERVAL = 0.5
+
+
+def sse_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class _Upstream:
+    """
+    A backend's chunk iterator, advanced from worker threads. close() waits for a
+    chunk being read to arrive, then closes the iterator, which drops the model call.
+    """
+
+    def __init__(self, iterator):
+        self.iterator = iter(iterator)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def next(self):
+        with self.lock:
+            return _END if self.closed else next(self.iterator, _END)
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                getattr(self.iterator, 'close', lambda: None)()
+
+    def close_in_background(self):
+        # Not awaited: it may have to wait for the model's next chunk, and the client is gone
+        threading.Thread(target=self.close, daemon=True).start()
+
+
+async def stream_insight(prompt, backend, timeout=None):
+    """
+    Async generator of server-sent events for the insight of `prompt`: 'chunk'
+    events ({"text"}) as the model writes, then 'done' (the insights endpoint's
+    payload) or 'error' ({"error"}). A fresh stored insight is sent as a single
+    chunk. While another generation holds the lock, a 'waiting' event is sent
+    and its result follows once stored.
+    """
+    timeout = get_config()['STREAM_TIMEOUT'] if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    key = fingerprint(prompt, backend)
+    in_thread = lambda function: sync_to_async(function, thread_sensitive=False) # Cache calls may block
+
+    stored = await in_thread(stored_insight)()
+    if is_fresh(stored, key):
+        yield sse_event('chunk', {'text': stored['insight']})
+        yield sse_event('done', _payload(stored, stale=False, refreshing=False))
+        return
+
+    error = await in_thread(recent_error)(key)
+    if error:
+        yield sse_event('error', {'error': f"An error occurred while processing AI insights: {error['message']}"})
+        return
+
+    token = await in_thread(acquire_lock)()
+    if token is None:
+        yield sse_event('waiting', {'detail': 'The insight is being generated by another request.'})
+        while loop.time() < deadline:
+            await asyncio.sleep(WAIT_POLL_INTERVAL)
+            stored = await in_thread(stored_insight)()
+            if stored is not None and stored['fingerprint'] == key:
+                yield sse_event('chunk', {'text': stored['insight']})
+                yield sse_event('done', _payload(stored, stale=False, refreshing=False))
+                return
+        yield sse_event('error', {'error': f'No insight within {timeout} seconds.'})
+        return
+
+    upstream = _Upstream(backend.stream(prompt))
+    parts = []
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            chunk = await asyncio.wait_for(in_thread(upstream.next)(), remaining)
+            if chunk is _END:
+                break
+            parts.append(chunk)
+            yield sse_event('chunk', {'text': chunk})
+        if not ''.join(parts).strip():
+            raise InsightError('AI service returned no insight. Content may be blocked or response structure unexpected.')
+        stored = await in_thread(store_insight)(''.join(parts), key, backend)
+        yield sse_event('done', _payload(stored, stale=False, refreshing=False))
+    except asyncio.TimeoutError:
+        yield sse_event('error', {'error': f'No complete insight within {timeout} seconds.'})
+    except Exception as e:
+        await in_thread(record_error)(e, key)
+        yield sse_event('error', {'error': f"An error occurred while processing AI insights: {e}"})
+    finally:
+        # Also reached when the client disconnects (the response task is cancelled)
+        upstream.close_in_background()
+        await in_thread(release_lock)(token)
@@ -0,0 +1,179 @@
+# projects/lookups.py
+
+"""
+Resolution of lookup names (countries, lead org units, themes, donors) to ids
+for the project write paths.
+
+Names match case-insensitively, like the `get_or_create(name__iexact=...)` the
+serializer used to run once per name. resolve_names() handles all the names of
+one model in one go:
+- names seen recently are served from a bounded per-process cache;
+- the others are matched with one `LOWER(name) IN (...)` query, backed by the
+  expression indexes on the lookup tables;
+- names still missing are created with one conflict-safe bulk INSERT
+  (ON CONFLICT DO NOTHING) and read back, so concurrent requests adding the
+  same name both end up with the same row.
+
+The cache holds positive matches only. Any write to a lookup table (rename,
+delete) clears it in this process and, through a version counter in the
+response cache backend (see projects/caching.py), in the other processes on
+their next resolution.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching
+from .importing import new_lookup
+from .models import Country, LeadOrgUnit, Theme, Donor
+
+DEFAULTS = {
+    'MAX_SIZE': 10000, # Cached names over all lookup models; the least recently used go first
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LOOKUP_NAME_CACHE', {})}
+
+
+class LookupNameCache:
+    """LRU map of (model label, lower-cased name) -> id, safe to share between threads."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, model, names):
+        """Lower-cased name -> id for the cached `names` (lower-cased)."""
+        found = {}
+        with self._lock:
+            for name in names:
+                key = (model._meta.label, name)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[name] = self._entries[key]
+        return found
+
+    def set_many(self, model, ids):
+        with self._lock:
+            for name, pk in ids.items():
+                key = (model._meta.label, name)
+                self._entries[key] = pk
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def sync(self, version):
+        """Drop everything when the shared version moved on (a lookup write elsewhere)."""
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+name_cache = LookupNameCache(get_config()['MAX_SIZE'])
+
+
+# --- Shared version ---
+
+def _version_key():
+    return f"{caching.get_config()['KEY_PREFIX']}:lookup-names-version"
+
+
+def get_version():
+    cache = caching.get_cache()
+    # Start from the clock, like the response cache generation
+    cache.add(_version_key(), int(time.time() * 1000), timeout=None)
+    return cache.get(_version_key())
+
+
+def invalidate():
+    """Outdate the cached names in every process."""
+    name_cache.clear()
+    cache = caching.get_cache()
+    try:
+        cache.incr(_version_key())
+    except ValueError: # Key missing (evicted or never set)
+        cache.add(_version_key(), int(time.time() * 1000), timeout=None)
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=LeadOrgUnit)
+@receiver(post_delete, sender=LeadOrgUnit)
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+@receiver(post_save, sender=Donor)
+@receiver(post_delete, sender=Donor)
+def invalidate_on_lookup_write(sender, created=False, **kwargs):
+    if created:
+        return # A new row can't make a cached match wrong
+    name_cache.clear()
+    # Again after the commit, in case a concurrent request cached the old row meanwhile
+    transaction.on_commit(invalidate)
+
+
+# --- Resolution ---
+
+def resolve_names(model, names):
+    """
+    Lower-cased (str.lower()) name -> id for `names` (stripped, non-empty), creating
+    the missing ones. When only the case differs, the first spelling is the one created.
+    """
+    wanted = {}
+    for name in names:
+        wanted.setdefault(name.lower(), name)
+    if not wanted:
+        return {}
+    name_cache.sync(get_version())
+    ids = name_cache.get_many(model, wanted)
+    missing = [name for name in wanted if name not in ids]
+    if not missing:
+        return ids
+
+    # LOWER() in the database can disagree with str.lower() (non-ASCII names, C collation); keys it
+    # doesn't share with `wanted` are left out and those names are matched exactly below.
+    fetched = {name: pk for name, pk in _fetch(model, missing).items() if name in wanted}
+    created = [wanted[name] for name in missing if name not in fetched]
+    if created:
+        model.objects.bulk_create([new_lookup(model, name) for name in created], ignore_conflicts=True)
+        # Read back by the unique name itself, so every name gets its id whatever LOWER() does
+        fetched.update((name.lower(), pk) for name, pk in model.objects.filter(name__in=created).values_list('name', 'pk'))
+    ids.update(fetched)
+    # Only once committed: rows created (or read) inside a transaction that is rolled back must not be cached
+    transaction.on_commit(lambda: name_cache.set_many(model, fetched))
+    return ids
+
+
+def _fetch(model, lower_names):
+    """Lower-cased name -> id of the existing rows; the oldest row wins if several differ only in case."""
+    ids = {}
+    rows = (
+        model.objects.annotate(lower_name=Lower('name'))
+        .filter(lower_name__in=lower_names).order_by('pk').values_list('lower_name', 'pk')
+    )
+    for lower_name, pk in rows:
+        ids.setdefault(lower_name, pk)
+    return ids
+
+
+def resolve_name(model, name):
+    """Id for one name (created if missing), or None for a blank one."""
+    name = name.strip()
+    return resolve_names(model, [name])[name.lower()] if name else None
@@ -0,0 +1,65 @@
+# backend/projects/management/commands/benchmark_project_lists.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from projects.fieldsets import load_fieldset, parse_fieldset
+from projects.readers import ProjectListReader
+from projects.serializers import ProjectSerializer
+from projects.views import project_list_queryset
+
+class Command(BaseCommand):
+    help = (
+        'Compares list serialization throughput of ProjectSerializer(many=True) and the '
+        'values()-based ProjectListReader on the same pages, and checks that their JSON is identical.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Projects per page (default: 100).')
+        parser.add_argument('--pages', type=int, default=20, help='Pages to serialize per round (default: 20).')
+        parser.add_argument('--rounds', type=int, default=3, help='Rounds per implementation; the best is reported (default: 3).')
+        parser.add_argument('--fields', help='Comma-separated fieldset, as with ?fields= (default: all fields).')
+
+    def handle(self, *args, **options):
+        page_size, pages = options['page_size'], options['pages']
+        fieldset = parse_fieldset({'fields': options['fields']}, ProjectSerializer) if options['fields'] else None
+        queryset = project_list_queryset().order_by('-created_at', '-id')
+        if fieldset is not None:
+            queryset = load_fieldset(queryset, ProjectSerializer, fieldset)
+        offsets = range(0, page_size * pages, page_size)
+        renderer = JSONRenderer()
+        context = {'fieldset': fieldset}
+
+        def serializer_pages():
+            return [
+                renderer.render(ProjectSerializer(queryset[offset:offset + page_size], many=True, context=context).data)
+                for offset in offsets
+            ]
+
+        reader = ProjectListReader(fieldset)
+        rows = reader.values_queryset(queryset)
+
+        def reader_pages():
+            return [renderer.render(reader.represent(rows[offset:offset + page_size])) for offset in offsets]
+
+        results = {}
+        for label, run in (('ProjectSerializer', serializer_pages), ('ProjectListReader', reader_pages)):
+            best = None
+            for _ in range(options['rounds']):
+                start = time.perf_counter()
+                output = run()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = (best, output)
+
+        if results['ProjectSerializer'][1] != results['ProjectListReader'][1]:
+            raise CommandError('The two implementations produced different JSON.')
+
+        projects = min(queryset.count(), page_size * pages)
+        self.stdout.write(f'{projects} projects in pages of {page_size} (queries included, best of {options["rounds"]}):')
+        for label, (elapsed, output) in results.items():
+            self.stdout.write(f'  {label:<18} {elapsed * 1000:8.1f} ms  {projects / elapsed:9.0f} projects/s')
+        speedup = results['ProjectSerializer'][0] / results['ProjectListReader'][0]
+        self.stdout.write(self.style.SUCCESS(f'Identical JSON; the reader is {speedup:.1f}x faster.'))
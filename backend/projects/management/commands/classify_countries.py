@@ -0,0 +1,21 @@
+# backend/projects/management/commands/classify_countries.py
+
+from django.core.management.base import BaseCommand
+
+from projects.models import Country
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored single/combined classification of every country from its name.'
+
+    def handle(self, *args, **options):
+        changed = []
+        for country in Country.objects.only('id', 'name', 'classification').iterator():
+            classification = Country.classify(country.name)
+            if country.classification != classification:
+                country.classification = classification
+                changed.append(country)
+        Country.objects.bulk_update(changed, ['classification'], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated the classification of {len(changed)} countries.'))
+        for key, label in Country.CLASSIFICATION_CHOICES:
+            self.stdout.write(f'{label}: {Country.objects.filter(classification=key).count()}')
@@ -1,20 +1,33 @@
 # backend/projects/management/commands/import_projects.py
 
 import csv
+import json
+import multiprocessing
+import os
+from collections import deque
+
+import django
 from django.core.management.base import BaseCommand, CommandError
-from django.utils.text import slugify # Useful if you need slugs, not strictly needed here
-from django.utils import timezone # For handling dates/datetimes
-from decimal import Decimal, InvalidOperation # For DecimalField
+from django.db import connections, transaction
 
-# Import your models
-from projects.models import Project, Country, LeadOrgUnit, Theme, Donor
+# Import your models and the shared import helpers
+from projects.models import Project, ImportCheckpoint
+from projects import caching, rollups
+from projects.importing import (
+    HEADER_MAPPING, BulkProjectWriter, CopyProjectWriter, ImportProfiler, cell_text, count_lines, file_sha256,
+    extra_cells_message, open_source, parse_frame, parse_row, parse_shard, shard_offsets, source_format, text_limits,
+)
 
 class Command(BaseCommand):
-    help = 'Imports projects from a CSV file.'
+    help = 'Imports projects from a CSV, Excel (.xlsx) or Parquet/Arrow file.'
 
     def add_arguments(self, parser):
-        # Add a command line argument to specify the path to the CSV file
-        parser.add_argument('csv_file', type=str, help='The path to the CSV file to import')
+        # Add a command line argument to specify the path to the source file
+        parser.add_argument(
+            'csv_file', type=str,
+            help='The path to the file to import. The format follows the extension: .xlsx/.xlsm (first sheet), '
+                 '.parquet/.pq, .arrow/.feather, anything else is read as CSV.',
+        )
 
         # Optional: Add an argument to clear existing data before importing
         parser.add_argument(
@@ -22,15 +35,123 @@ class Command(BaseCommand):
             action='store_true', # This makes it a flag (no value needed)
             help='Clear existing project data before importing',
         )
+        parser.add_argument(
+            '--chunk-size', '--batch-size',
+            dest='chunk_size',
+            type=int,
+            default=1000,
+            help='Number of rows written and committed per chunk (default: 1000)',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue after the last committed chunk of a previous run of the same file',
+        )
+        parser.add_argument(
+            '--rejects',
+            type=str,
+            default=None,
+            help='Path of the CSV file that receives row errors (default: <csv_file>.rejects.csv)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes parsing the file in parallel byte-range shards (default: 1, no pool). '
+                 'CSV only; requires one record per line, i.e. no line breaks inside quoted cells.',
+        )
+        parser.add_argument(
+            '--columnar',
+            action='store_true',
+            help='CSV only: parse each chunk as a pandas DataFrame with vectorized column operations',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='PostgreSQL only: load each chunk with COPY into a staging table and merge it with set-based SQL. '
+                 'Use a large --chunk-size (e.g. 50000) for full refreshes.',
+        )
+        parser.add_argument(
+            '--delete-missing',
+            action='store_true',
+            help='After a complete import, delete projects whose ProjectID no longer appears in the file '
+                 '(projects without a ProjectID are never deleted)',
+        )
+        parser.add_argument(
+            '--profile',
+            nargs='?',
+            const='',
+            default=None,
+            metavar='JSON_PATH',
+            help='Report wall time, rows/sec, SQL queries and peak memory per import phase. '
+                 'The JSON report is written to JSON_PATH (default: <csv_file>.profile.json)',
+        )
+        parser.add_argument(
+            '--sample-rows',
+            type=int,
+            default=None,
+            help='Stop after this many rows; with --profile, the report estimates the time for the whole file',
+        )
 
     def handle(self, *args, **options):
         csv_file_path = options['csv_file']
         clear_data = options['clear']
+        chunk_size = options['chunk_size']
+        resume = options['resume']
+        workers = options['workers']
+        use_copy = options['copy']
+        columnar = options['columnar']
+        delete_missing = options['delete_missing']
+        sample_rows = options['sample_rows']
+        profile_path = options['profile']
+        rejects_path = options['rejects'] or f'{csv_file_path}.rejects.csv'
+        file_format = source_format(csv_file_path)
+
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be a positive integer.')
+        if workers < 1:
+            raise CommandError('--workers must be a positive integer.')
+        if columnar and workers > 1:
+            raise CommandError('--columnar cannot be combined with --workers.')
+        if file_format != 'csv' and (columnar or workers > 1):
+            # Typed sources are already parsed column by column by their reader.
+            raise CommandError('--columnar and --workers only apply to CSV files.')
+        if sample_rows is not None and sample_rows < 1:
+            raise CommandError('--sample-rows must be a positive integer.')
+        if sample_rows and delete_missing:
+            raise CommandError('--delete-missing cannot be combined with --sample-rows.')
+        if clear_data and resume:
+            raise CommandError('--clear cannot be combined with --resume.')
+        if use_copy and connections['default'].vendor != 'postgresql':
+            raise CommandError('--copy requires a PostgreSQL database.')
+        if not os.path.isfile(csv_file_path):
+            raise CommandError(f'File not found at "{csv_file_path}"')
+
+        # --- Checkpoint lookup (the file is identified by its content hash) ---
+        file_hash = file_sha256(csv_file_path)
+        checkpoint = ImportCheckpoint.objects.filter(file_hash=file_hash).first()
+        if resume and checkpoint and checkpoint.completed:
+            self.stdout.write(self.style.SUCCESS(f'"{csv_file_path}" was already imported completely. Nothing to resume.'))
+            return
+        if resume and checkpoint:
+            self.stdout.write(self.style.WARNING(f'Resuming after row {checkpoint.last_row}.'))
+        else:
+            if resume:
+                self.stdout.write(self.style.WARNING('No checkpoint found for this file, starting from the first row.'))
+            checkpoint, _ = ImportCheckpoint.objects.update_or_create(
+                file_hash=file_hash,
+                defaults={
+                    'file_name': os.path.basename(csv_file_path),
+                    'last_row': 0, 'imported_count': 0, 'skipped_count': 0, 'completed': False,
+                },
+            )
+        resume_after = checkpoint.last_row
 
         # --- Optional: Clear existing data ---
         if clear_data:
             self.stdout.write(self.style.WARNING('Clearing existing project data...'))
-            Project.objects.all().delete()
+            with rollups.suspended(): # Rebuilt once at the end instead of per deleted project
+                Project.objects.all().delete()
             # Optionally clear related models if you are re-importing everything
             # Country.objects.all().delete()
             # LeadOrgUnit.objects.all().delete()
@@ -40,333 +161,323 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(f'Attempting to import data from "{csv_file_path}"'))
 
+        self.error_count = 0
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+        self.profiler = ImportProfiler(enabled=profile_path is not None)
+        self.profiler.start()
+        # Stopped on every path: an enabled profiler hooks the connection and runs tracemalloc
         try:
-            with open(csv_file_path, mode='r', encoding='utf-8') as csvfile:
-                # Use DictReader to read rows as dictionaries with header names as keys
-                reader = csv.DictReader(csvfile)
-
-                # --- Add this line to print the headers the script is reading ---
-                self.stdout.write(f"Headers read from CSV: {reader.fieldnames}")
-                # -------------------------------------------------------------
-
-                # --- Map CSV Headers to Model Fields ---
-                # IMPORTANT: These values MUST match the EXACT headers in your CSV file
-                # as read by csv.DictReader.
-                header_mapping = {
-                    'title': 'Project Title', # Matches 'Project Title' from df.info()
-                    'project_id_excel': 'ProjectID', # Matches 'ProjectID' from df.info()
-                    'paas_code': 'PAAS Code', # Matches 'PAAS Code' from df.info()
-                    'status': 'Approval Status', # Matches 'Approval Status' from df.info()
-                    'fund': 'Fund', # Matches 'Fund' from df.info()
-                    'country': 'Country(ies)', # Matches 'Country(ies)' from df.info()
-                    'lead_org_unit': 'Lead Org Unit', # Matches 'Lead Org Unit' from df.info()
-                    'themes': 'Theme(s)', # Matches 'Theme(s)' from df.info()
-                    'donors': 'Donor(s)', # Matches 'Donor(s)' from df.info()
-                    # Removed 'approval_date' mapping as it's not in df.info()
-                    'start_date': 'Start Date', # Matches 'Start Date' from df.info()
-                    'end_date': 'End Date', # Matches 'End Date' from df.info()
-                    # Removed 'budget_amount' mapping temporarily for debugging
-                    # 'budget_amount': 'Budget Amount', # Matches 'Budget Amount' from df.info()
-                    'pag_value': 'PAG Value', # Matches 'PAG Value' from df.info()
-                    'total_expenditure': 'Total Expenditure', # Matches 'Total Expenditure' from df.info()
-                    'total_contribution': 'Total Contribution', # Matches 'Total Contribution' from df.info()
-                    'total_contribution_expenditure_diff': 'Total Contribution - Total Expenditure', # Matches 'Total Contribution - Total Expenditure' from df.info()
-                    'total_psc': 'Total PSC', # Matches 'Total PSC' from df.info()
-                    # Add mappings for any other fields from your model if they are in the CSV
-                    # 'description': 'Description', # Example if you have a Description column
-                }
-
-                # --- Validate Headers ---
-                csv_headers = reader.fieldnames
-                required_headers_in_csv = [
-                    csv_key for model_field, csv_key in header_mapping.items()
-                ]
-                missing_headers = [
-                     csv_key for csv_key in required_headers_in_csv
-                     if csv_key not in csv_headers
-                ]
-
-                if missing_headers:
-                    raise CommandError(f"Missing required CSV headers: {', '.join(missing_headers)}")
-
-                # You might also want to check for unexpected headers if strict
-                # unexpected_headers = [header for header in csv_headers if header not in header_mapping.values()]
-                # if unexpected_headers:
-                #     self.stdout.write(self.style.WARNING(f"Unexpected headers found: {', '.join(unexpected_headers)}"))
-
-
-                imported_count = 0
-                skipped_count = 0
-                errors = []
-
-                # --- Iterate through CSV rows ---
-                for row_num, row in enumerate(reader, start=1):
-                    try:
-                        # Access data using the mapped CSV header names
-                        # Use .get() with default to avoid KeyError if header is unexpectedly missing (should be caught by validation)
-                        title = row.get(header_mapping.get('title'), '').strip()
-                        project_id_excel = row.get(header_mapping.get('project_id_excel'), '').strip() or None # Use None for blank
-                        paas_code = row.get(header_mapping.get('paas_code'), '').strip() or None
-                        status = row.get(header_mapping.get('status'), '').strip() or 'Approved' # Default status if missing or blank
-                        fund = row.get(header_mapping.get('fund'), '').strip() or None
-                        # description = row.get(header_mapping.get('description'), '').strip() or '' # Example for description
-
-                        # Handle Date fields
-                        # Get date strings using .get() - approval_date_str will be '' if header not mapped
-                        approval_date_str = row.get(header_mapping.get('approval_date'), '').strip() # This will be '' now
-                        start_date_str = row.get(header_mapping.get('start_date'), '').strip()
-                        end_date_str = row.get(header_mapping.get('end_date'), '').strip()
-
-                        # Convert date strings to Django DateField objects
-                        # IMPORTANT: Adjust the date format parsing (%Y-%m-%d) based on your CSV format
-                        # Pandas datetime64[ns] saved to CSV might be in ISO format or another string.
-                        # Example formats: '%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y'
-                        # Check your CSV or original dataframe output for the exact format.
-                        # If dates are like '2023-10-27 00:00:00+00:00', you'll need a more complex parser or string slicing.
-                        # Assuming simpleYYYY-MM-DD for now.
-                        date_format = '%Y-%m-%d' # Adjust this if your CSV date format is different
-
-                        approval_date = None
-                        if approval_date_str: # This check will now correctly evaluate to False if the header wasn't mapped
-                            try:
-                                # Attempt to parse the date string
-                                # If your dates have time/timezone, you might need to parse as datetime first
-                                approval_date = timezone.datetime.strptime(approval_date_str, date_format).date()
-                            except ValueError:
-                                errors.append(f"Row {row_num}: Invalid approval date format '{approval_date_str}'. Expected '{date_format}'.")
-                                approval_date = None # Set to None if invalid
-
-
-                        start_date = None
-                        if start_date_str:
-                             try:
-                                start_date = timezone.datetime.strptime(start_date_str, date_format).date()
-                             except ValueError:
-                                errors.append(f"Row {row_num}: Invalid start date format '{start_date_str}'. Expected '{date_format}'.")
-                                start_date = None
-
-                        end_date = None
-                        if end_date_str:
-                             try:
-                                end_date = timezone.datetime.strptime(end_date_str, date_format).date()
-                             except ValueError:
-                                errors.append(f"Row {row_num}: Invalid end date format '{end_date_str}'. Expected '{date_format}'.")
-                                end_date = None
-
-
-                        # Handle Monetary (Decimal) fields
-                        # Convert string to Decimal, handle potential errors
-                        # Get monetary strings using .get()
-                        # budget_amount_str will be '' now as header is not mapped
-                        budget_amount_str = row.get(header_mapping.get('budget_amount'), '').strip()
-                        pag_value_str = row.get(header_mapping.get('pag_value'), '').strip()
-                        total_expenditure_str = row.get(header_mapping.get('total_expenditure'), '').strip()
-                        total_contribution_str = row.get(header_mapping.get('total_contribution'), '').strip()
-                        total_contribution_expenditure_diff_str = row.get(header_mapping.get('total_contribution_expenditure_diff'), '').strip()
-                        total_psc_str = row.get(header_mapping.get('total_psc'), '').strip()
-
-                        budget_amount = None
-                        if budget_amount_str: # This check will now correctly evaluate to False
-                            try:
-                                # Remove any currency symbols or commas if present before converting
-                                cleaned_amount_str = budget_amount_str.replace('$', '').replace(',', '')
-                                budget_amount = Decimal(cleaned_amount_str)
-                            except InvalidOperation:
-                                errors.append(f"Row {row_num}: Invalid budget amount format '{budget_amount_str}'.")
-                                budget_amount = None
-                            except ValueError: # Catch potential errors from replace if input is not string
-                                 errors.append(f"Row {row_num}: Invalid budget amount format '{budget_amount_str}'.")
-                                 budget_amount = None
-
-
-                        pag_value = None
-                        if pag_value_str:
-                            try:
-                                cleaned_amount_str = pag_value_str.replace('$', '').replace(',', '')
-                                pag_value = Decimal(cleaned_amount_str)
-                            except InvalidOperation:
-                                errors.append(f"Row {row_num}: Invalid PAG value format '{pag_value_str}'.")
-                                pag_value = None
-                            except ValueError:
-                                 errors.append(f"Row {row_num}: Invalid PAG value format '{pag_value_str}'.")
-                                 pag_value = None
-
-
-                        total_expenditure = None
-                        if total_expenditure_str:
-                            try:
-                                cleaned_amount_str = total_expenditure_str.replace('$', '').replace(',', '')
-                                total_expenditure = Decimal(cleaned_amount_str)
-                            except InvalidOperation:
-                                errors.append(f"Row {row_num}: Invalid total expenditure format '{total_expenditure_str}'.")
-                                total_expenditure = None
-                            except ValueError:
-                                errors.append(f"Row {row_num}: Invalid total expenditure format '{total_expenditure_str}'.")
-                                total_expenditure = None
-
-                        total_contribution = None
-                        if total_contribution_str:
-                            try:
-                                cleaned_amount_str = total_contribution_str.replace('$', '').replace(',', '')
-                                total_contribution = Decimal(cleaned_amount_str)
-                            except InvalidOperation:
-                                errors.append(f"Row {row_num}: Invalid total contribution format '{total_contribution_str}'.")
-                                total_contribution = None
-                            except ValueError:
-                                errors.append(f"Row {row_num}: Invalid total contribution format '{total_contribution_str}'.")
-                                total_contribution = None
-
-
-                        total_contribution_expenditure_diff = None
-                        if total_contribution_expenditure_diff_str:
-                            try:
-                                cleaned_amount_str = total_contribution_expenditure_diff_str.replace('$', '').replace(',', '')
-                                total_contribution_expenditure_diff = Decimal(cleaned_amount_str)
-                            except InvalidOperation:
-                                errors.append(f"Row {row_num}: Invalid total contribution expenditure diff format '{total_contribution_expenditure_diff_str}'.")
-                                total_contribution_expenditure_diff = None
-                            except ValueError:
-                                errors.append(f"Row {row_num}: Invalid total contribution expenditure diff format '{total_contribution_expenditure_diff_str}'.")
-                                total_contribution_expenditure_diff = None
-
-
-                        total_psc = None
-                        if total_psc_str:
-                            try:
-                                cleaned_amount_str = total_psc_str.replace('$', '').replace(',', '')
-                                total_psc = Decimal(cleaned_amount_str)
-                            except InvalidOperation:
-                                errors.append(f"Row {row_num}: Invalid total PSC format '{total_psc_str}'.")
-                                total_psc = None
-                            except ValueError:
-                                errors.append(f"Row {row_num}: Invalid total PSC format '{total_psc_str}'.")
-                                total_psc = None
-
-
-                        # --- Handle Related Objects (Get or Create) ---
-                        # For ForeignKey fields (Country, LeadOrgUnit)
-                        country_name = row.get(header_mapping.get('country'), '').strip()
-                        country_obj = None
-                        if country_name:
-                            # Get or create the Country object
-                            # Using get_or_create is safe and avoids duplicates
-                            country_obj, created = Country.objects.get_or_create(name=country_name)
-                            if created:
-                                self.stdout.write(self.style.SUCCESS(f"Created new Country: {country_name}"))
-
-
-                        lead_org_unit_name = row.get(header_mapping.get('lead_org_unit'), '').strip()
-                        lead_org_unit_obj = None
-                        if lead_org_unit_name:
-                            lead_org_unit_obj, created = LeadOrgUnit.objects.get_or_create(name=lead_org_unit_name)
-                            if created:
-                                self.stdout.write(self.style.SUCCESS(f"Created new Lead Org Unit: {lead_org_unit_name}"))
-
-
-                        # For ManyToMany fields (Themes, Donors)
-                        # Split comma-separated names and get/create objects
-                        themes_string = row.get(header_mapping.get('themes'), '').strip()
-                        theme_objects = []
-                        if themes_string:
-                            # Split by comma, strip whitespace, filter out empty strings
-                            theme_names = [name.strip() for name in themes_string.split(',') if name.strip()]
-                            for theme_name in theme_names:
-                                theme_obj, created = Theme.objects.get_or_create(name=theme_name)
-                                if created:
-                                    self.stdout.write(self.style.SUCCESS(f"Created new Theme: {theme_name}"))
-                                theme_objects.append(theme_obj)
-
-
-                        donors_string = row.get(header_mapping.get('donors'), '').strip()
-                        donor_objects = []
-                        if donors_string:
-                            # Split by comma, strip whitespace, filter out empty strings
-                            donor_names = [name.strip() for name in donors_string.split(',') if name.strip()]
-                            for donor_name in donor_names:
-                                donor_obj, created = Donor.objects.get_or_create(name=donor_name)
-                                if created:
-                                    self.stdout.write(self.style.SUCCESS(f"Created new Donor: {donor_name}"))
-                                donor_objects.append(donor_obj)
-
-
-                        # --- Create or Update Project Instance ---
-                        # Use update_or_create based on project_id_excel if it exists, otherwise create
-                        # Check if project_id_excel is not None and not an empty string after stripping
-                        lookup_project_id_excel = project_id_excel if project_id_excel else None
-
-                        if not title:
-                            errors.append(f"Row {row_num}: Skipping project due to missing title.")
-                            skipped_count += 1
-                            continue # Skip this row if title is missing
-
-                        # Prepare data dictionary for Project instance
-                        project_data = {
-                            'title': title,
-                            'project_id_excel': lookup_project_id_excel, # Use the cleaned ID for data
-                            'paas_code': paas_code,
-                            'status': status,
-                            'fund': fund,
-                            'country': country_obj, # Assign the Country object or None
-                            'lead_org_unit': lead_org_unit_obj, # Assign the LeadOrgUnit object or None
-                            'approval_date': approval_date, # This will be None if the column wasn't in CSV
-                            'start_date': start_date,
-                            'end_date': end_date,
-                            'budget_amount': budget_amount, # This will be None now
-                            'pag_value': pag_value,
-                            'total_expenditure': total_expenditure,
-                            'total_contribution': total_contribution,
-                            'total_contribution_expenditure_diff': total_contribution_expenditure_diff,
-                            'total_psc': total_psc,
-                            # created_at and updated_at are auto-handled
-                        }
-
-                        # Use update_or_create if project_id_excel is available for lookup
-                        if lookup_project_id_excel:
-                            project_instance, created = Project.objects.update_or_create(
-                                project_id_excel=lookup_project_id_excel, # Lookup based on cleaned excel ID
-                                defaults=project_data # Data to create or update with
-                            )
-                            if created:
-                                self.stdout.write(self.style.SUCCESS(f"Created Project: {title} (Excel ID: {lookup_project_id_excel})"))
-                            else:
-                                self.stdout.write(self.style.SUCCESS(f"Updated Project: {title} (Excel ID: {lookup_project_id_excel})"))
+            rows_processed = 0
+            total_rows = None
+            try:
+                # Errors are streamed to the rejects file rather than collected in memory.
+                # A resumed run appends to the rejects of the interrupted one.
+                with open_source(csv_file_path, chunk_size) as (csv_headers, reader, total_rows), \
+                     open(rejects_path, mode='a' if resume_after else 'w', encoding='utf-8', newline='') as rejects_file:
+                    self.stdout.write(f"Headers read from {file_format} file: {csv_headers}")
+
+                    # --- Validate Headers ---
+                    missing_headers = [
+                         csv_key for csv_key in HEADER_MAPPING.values()
+                         if csv_key not in csv_headers
+                    ]
+                    if missing_headers:
+                        raise CommandError(f"Missing required headers: {', '.join(missing_headers)}")
+
+                    self.rejects = csv.writer(rejects_file)
+                    self.csv_headers = csv_headers
+                    if not resume_after:
+                        self.rejects.writerow(['Row', 'Error'] + csv_headers)
+
+                    # Both writers take a chunk of parsed records; the ORM one preloads the lookup tables into memory
+                    writer = CopyProjectWriter(self.profiler) if use_copy else BulkProjectWriter(self.profiler)
+                    chunk = []
+                    chunk_skipped = 0
+
+                    if columnar:
+                        parsed_rows = self._parse_columnar(csv_file_path, csv_headers, chunk_size, resume_after)
+                    elif workers > 1:
+                        parsed_rows = self._parse_in_workers(csv_file_path, csv_headers, workers)
+                    else:
+                        parsed_rows = self._parse_in_process(reader, resume_after)
+
+                    # --- Stream through the parsed rows, committing every `chunk_size` rows ---
+                    for row_num, record, row_errors, row in parsed_rows:
+                        if row_num <= resume_after:
+                            continue # Already committed by a previous run
+
+                        for message in row_errors:
+                            self._reject(row_num, f"Row {row_num}: {message}", row, csv_headers)
+                        if record is None:
+                            chunk_skipped += 1
                         else:
-                            # If no excel ID for lookup, just create a new project
-                            project_instance = Project.objects.create(**project_data)
-                            self.stdout.write(self.style.SUCCESS(f"Created Project: {title} (No Excel ID for lookup)"))
-
-
-                        # --- Handle ManyToMany Relationships ---
-                        # For ManyToMany fields, you need to set them *after* the instance is created/updated
-                        project_instance.themes.set(theme_objects) # Use set() to replace existing themes
-                        project_instance.donors.set(donor_objects) # Use set() to replace existing donors
-
-
-                        imported_count += 1
-
-                        # Optional: Save the instance if you made changes after create/update,
-                        # but update_or_create with defaults usually handles this.
-                        # project_instance.save()
+                            chunk.append((row_num, record, row))
+
+                        if len(chunk) + chunk_skipped >= chunk_size:
+                            self._commit_chunk(writer, checkpoint, chunk, chunk_skipped, row_num)
+                            chunk = []
+                            chunk_skipped = 0
+
+                        rows_processed += 1
+                        if rows_processed == sample_rows:
+                            break
+
+                    if chunk or chunk_skipped:
+                        self._commit_chunk(writer, checkpoint, chunk, chunk_skipped, row_num)
+
+            except CommandError:
+                raise
+            except Exception as e:
+                # Catch errors during file opening or reader initialization
+                raise CommandError(f'An error occurred while reading "{csv_file_path}": {e}')
+
+            if sample_rows and rows_processed == sample_rows:
+                # Partial run: `--resume` continues after the sample.
+                self.stdout.write(self.style.WARNING(f'Stopped after the {sample_rows}-row sample.'))
+            else:
+                checkpoint.completed = True
+                checkpoint.save(update_fields=['completed', 'updated_at'])
+
+            if delete_missing:
+                with self.profiler.phase('delete'):
+                    self.counts['deleted'] = self._delete_missing(csv_file_path, chunk_size)
+
+            # The writers bypass model signals, so recompute the dashboard rollups in one pass.
+            # A run that changed nothing leaves them (and every cached response and ETag) alone;
+            # a resumed run rebuilds them anyway, since the interrupted one never got here.
+            changed = self.counts['inserted'] or self.counts['updated'] or self.counts['deleted']
+            if changed or clear_data or resume_after:
+                with self.profiler.phase('rollups'):
+                    rollups.rebuild_rollups()
+                caching.bump_generation()
+        finally:
+            self.profiler.stop()
 
+        self.stdout.write(self.style.SUCCESS('--- Import Summary ---'))
+        self.stdout.write(self.style.SUCCESS(f'Successfully imported/updated {checkpoint.imported_count} projects.'))
+        self.stdout.write(self.style.SUCCESS(
+            'This run: {inserted} inserted, {updated} updated, {unchanged} unchanged, {deleted} deleted.'.format(**self.counts)
+        ))
+        for key, created in writer.created_lookups.items():
+            if created:
+                self.stdout.write(self.style.SUCCESS(f'Created {created} new {key.replace("_", " ")} entries.'))
+        if checkpoint.skipped_count > 0:
+             self.stdout.write(self.style.WARNING(f'Skipped {checkpoint.skipped_count} rows due to errors.'))
+        if self.error_count:
+            self.stdout.write(self.style.ERROR(f'{self.error_count} errors were written to "{rejects_path}".'))
+
+        if self.profiler.enabled:
+            estimated_rows = None
+            if sample_rows:
+                if total_rows is None:
+                    # The line count is an upper bound on the CSV rows (header, quoted line breaks).
+                    total_rows = count_lines(csv_file_path) - 1
+                estimated_rows = max(total_rows - resume_after, 0)
+            report = self.profiler.report(rows_processed, estimated_rows)
+            report['file'] = csv_file_path
+            report['options'] = {
+                'chunk_size': chunk_size, 'workers': workers, 'columnar': columnar, 'copy': use_copy,
+                'sample_rows': sample_rows,
+            }
+            profile_path = profile_path or f'{csv_file_path}.profile.json'
+            with open(profile_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self._write_profile_summary(report, profile_path)
+
+    def _write_profile_summary(self, report, profile_path):
+        """Human-readable version of the profile report."""
+        self.stdout.write(self.style.SUCCESS('--- Import Profile ---'))
+        self.stdout.write(
+            f"{report['rows']} rows in {report['wall_seconds']:.2f}s ({report['rows_per_second'] or 0:.0f} rows/s), "
+            f"{report['queries']} queries, peak traced memory {report['peak_memory_bytes'] / 1024 ** 2:.1f} MB"
+        )
+        self.stdout.write(f"{'phase':<12}{'seconds':>10}{'share':>8}{'queries':>10}{'peak MB':>10}")
+        for name, phase in report['phases'].items():
+            self.stdout.write(
+                f"{name:<12}{phase['seconds']:>10.3f}{(phase['share'] or 0) * 100:>7.1f}%"
+                f"{phase['queries']:>10}{phase['peak_memory_bytes'] / 1024 ** 2:>10.1f}"
+            )
+        if 'estimated_total_seconds' in report:
+            self.stdout.write(self.style.WARNING(
+                f"Estimated full import: ~{report['estimated_total_rows']} rows in "
+                f"~{report['estimated_total_seconds']}s (extrapolated from the sample)."
+            ))
+        self.stdout.write(f'Profile report written to "{profile_path}".')
+
+    def _parse_in_process(self, reader, resume_after):
+        """Yields (row_num, record, errors, row) for each CSV row, parsed in this process."""
+        rows = iter(reader)
+        row_num = 0
+        while True:
+            with self.profiler.phase('read'):
+                row = next(rows, None)
+            if row is None:
+                return
+            row_num += 1
+            if row_num <= resume_after:
+                yield row_num, None, [], row # Skipped by the caller without parsing
+                continue
+            if None in row: # csv.DictReader keeps the cells beyond the header under None
+                header_count = len(row) - 1
+                yield row_num, None, [extra_cells_message(header_count, header_count + len(row[None]))], row
+                continue
+            with self.profiler.phase('parse'):
+                try:
+                    record, row_errors = parse_row(row)
+                except Exception as e:
+                    # Catch any other unexpected errors during row processing
+                    record, row_errors = None, [f"Error processing row - {e}"]
+            yield row_num, record, row_errors, row
+
+    def _parse_columnar(self, csv_file_path, csv_headers, chunk_size, resume_after):
+        """
+        Yields the same tuples as _parse_in_process, reading the file as DataFrames of
+        `chunk_size` rows (all cells as strings) and parsing each one with parse_frame.
+        Chunks that were fully committed by a previous run are not parsed again.
+        """
+        bad_lines = deque()
+
+        def keep_bad_line(cells):
+            # A record with more cells than the header stays in the frame as a row of None
+            # (which no parsed cell can be), so the rows after it keep their numbers.
+            bad_lines.append(cells)
+            return [None] * len(csv_headers)
+
+        with self.profiler.phase('read'):
+            import pandas as pd
+
+            # Only the python engine hands bad lines to a callable; the C engine stops the whole import.
+            frames = pd.read_csv(
+                csv_file_path, dtype=str, keep_default_na=False, na_filter=False,
+                encoding='utf-8', chunksize=chunk_size, engine='python', on_bad_lines=keep_bad_line,
+            )
+        first_row_num = 1
+        while True:
+            with self.profiler.phase('read'):
+                frame = next(frames, None)
+            if frame is None:
+                return
+            bad_rows = frame.iloc[:, 0].isna().to_numpy().nonzero()[0]
+            bad_cells = [bad_lines.popleft() for _ in bad_rows]
+            if first_row_num + len(frame) - 1 > resume_after:
+                with self.profiler.phase('parse'):
+                    # Records with fewer cells than the header have None for the missing ones.
+                    results = parse_frame(frame.fillna(''), first_row_num)
+                for pos, cells in zip(bad_rows, bad_cells):
+                    row_num = first_row_num + pos
+                    message = extra_cells_message(len(csv_headers), len(cells))
+                    results[pos] = (row_num, None, [message], dict(zip(csv_headers, cells)))
+                yield from results
+            first_row_num += len(frame)
+
+    def _parse_in_workers(self, csv_file_path, csv_headers, workers):
+        """
+        Yields the same tuples as _parse_in_process, but the parsing runs in a pool of
+        `workers` processes, one byte-range shard per task. Results are consumed in
+        file order (this process stays the only database writer) and at most two
+        shards per worker are in flight, so memory stays bounded.
+        """
+        with open(csv_file_path, 'rb') as f:
+            f.readline() # Header line
+            data_start = f.tell()
+        shards = deque(shard_offsets(csv_file_path, data_start))
+
+        # Read the column widths parse_row checks against here, so forked children inherit them.
+        text_limits()
+        # Don't share the open database connection with forked children.
+        connections.close_all()
+        # django.setup is needed where the pool uses spawn instead of fork (Windows/macOS).
+        with multiprocessing.Pool(workers, initializer=django.setup) as pool:
+            pending = deque()
+            rows_before = 0
+            while shards or pending:
+                while shards and len(pending) < workers * 2:
+                    pending.append(pool.apply_async(parse_shard, (csv_file_path, csv_headers) + shards.popleft()))
+                # Time spent waiting here is parsing that the workers haven't finished yet.
+                with self.profiler.phase('parse'):
+                    row_count, results = pending.popleft().get()
+                for shard_row_num, record, row_errors, row in results:
+                    yield rows_before + shard_row_num, record, row_errors, row
+                rows_before += row_count
+
+    def _reject(self, row_num, message, row=None, headers=()):
+        """Appends one error (and the offending source row, if known) to the rejects file."""
+        self.error_count += 1
+        values = [row.get(header, '') for header in headers] if row else []
+        self.rejects.writerow([row_num, message] + values)
+
+    def _commit_chunk(self, writer, checkpoint, chunk, skipped, last_row):
+        """
+        Writes one chunk of (row_num, record, row) entries and advances the checkpoint
+        in the same transaction, so a crash never leaves the checkpoint ahead of (or
+        behind) the data. Rows the database rejects are isolated by _write_rows and
+        reported in the rejects file; the rest of the chunk is still committed.
+        """
+        first_row = checkpoint.last_row + 1
+        with transaction.atomic():
+            counts, rejected = self._write_rows(writer, chunk)
+            with self.profiler.phase('checkpoint'):
+                self._advance(checkpoint, last_row, sum(counts.values()), skipped + rejected)
+        for key, count in counts.items():
+            self.counts[key] += count
+        if counts['inserted'] or counts['updated']:
+            # Cached summary/dashboard responses no longer match the data
+            caching.bump_generation()
+        self.stdout.write(
+            f"Committed rows {first_row}-{last_row} "
+            f"({counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged)."
+        )
 
-                    except Exception as e:
-                        # Catch any other unexpected errors during row processing
-                        errors.append(f"Row {row_num}: Error processing row - {e}")
-                        skipped_count += 1
-                        # Continue processing other rows
-
-        except FileNotFoundError:
-            raise CommandError(f'CSV file not found at "{csv_file_path}"')
+    def _write_rows(self, writer, rows):
+        """
+        Writes (row_num, record, row) entries in a savepoint. If the database rejects
+        them, the savepoint is rolled back and each half is written on its own, down to
+        single rows, which are rejected. A chunk with k bad rows costs about
+        k * log2(chunk size) extra writes. Returns (counts, rejected row count).
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if not rows:
+            return counts, 0
+        # Lookup rows the writer creates here are gone again if the savepoint is rolled back
+        lookups = writer.snapshot()
+        try:
+            with transaction.atomic():
+                return writer.write([record for row_num, record, row in rows]), 0
         except Exception as e:
-            # Catch errors during file opening or DictReader initialization
-            raise CommandError(f'An error occurred during CSV reading: {e}')
-
-
-        self.stdout.write(self.style.SUCCESS('--- Import Summary ---'))
-        self.stdout.write(self.style.SUCCESS(f'Successfully imported/updated {imported_count} projects.'))
-        if skipped_count > 0:
-             self.stdout.write(self.style.WARNING(f'Skipped {skipped_count} rows due to errors.'))
-        if errors:
-            self.stdout.write(self.style.ERROR('--- Errors Encountered ---'))
-            for error_msg in errors:
-                self.stdout.write(self.style.ERROR(error_msg))
+            writer.restore(lookups)
+            if len(rows) == 1:
+                row_num, record, row = rows[0]
+                self._reject(row_num, f"Row {row_num}: Rejected by the database - {str(e).strip()}", row, self.csv_headers)
+                return counts, 1
+        middle = len(rows) // 2
+        rejected = 0
+        for half in (rows[:middle], rows[middle:]):
+            half_counts, half_rejected = self._write_rows(writer, half)
+            for key, count in half_counts.items():
+                counts[key] += count
+            rejected += half_rejected
+        return counts, rejected
+
+    def _delete_missing(self, csv_file_path, batch_size):
+        """
+        Deletes projects whose project_id_excel is not in the file. Every ProjectID
+        present in the file counts, even on rows that were rejected, so a bad row
+        never deletes its project. Returns the number of projects deleted.
+        """
+        with open_source(csv_file_path, batch_size) as (headers, rows, total_rows):
+            file_ids = {cell_text(row.get(HEADER_MAPPING['project_id_excel'])) for row in rows}
+        missing_ids = [
+            pk for pk, excel_id in Project.objects.exclude(project_id_excel=None).values_list('id', 'project_id_excel').iterator()
+            if excel_id not in file_ids
+        ]
+        deleted = 0
+        with transaction.atomic(), rollups.suspended():
+            for start in range(0, len(missing_ids), batch_size):
+                deleted += Project.objects.filter(id__in=missing_ids[start:start + batch_size]).delete()[1].get('projects.Project', 0)
+        return deleted
+
+    def _advance(self, checkpoint, last_row, imported, skipped):
+        checkpoint.last_row = last_row
+        checkpoint.imported_count += imported
+        checkpoint.skipped_count += skipped
+        checkpoint.save(update_fields=['last_row', 'imported_count', 'skipped_count', 'updated_at'])
@@ -0,0 +1,14 @@
+# backend/projects/management/commands/rebuild_rollups.py
+
+from django.core.management.base import BaseCommand
+
+from projects.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Recomputes the dashboard rollup tables from the Project table.'
+
+    def handle(self, *args, **options):
+        counts = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt rollups: {countries} countries, {lead_org_units} lead org units, {themes} themes, and the portfolio totals.'.format(**counts)
+        ))
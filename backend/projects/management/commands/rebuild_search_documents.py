@@ -0,0 +1,34 @@
+# backend/projects/management/commands/rebuild_search_documents.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from projects.models import Project
+from projects.search import refresh_search_documents
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search document of every project (e.g. after the search fields changed).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of projects updated per transaction (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be a positive integer.')
+
+        ids = list(Project.objects.order_by('id').values_list('id', flat=True))
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            # Id ranges keep each UPDATE on an index range scan
+            with transaction.atomic():
+                updated += refresh_search_documents(Project.objects.filter(id__gte=batch[0], id__lte=batch[-1]))
+            self.stdout.write(f'Updated {updated} of {len(ids)} projects.')
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the search documents of {updated} projects.'))
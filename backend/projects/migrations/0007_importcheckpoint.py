@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-17 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0006_project_total_contribution_expenditure_diff"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "file_hash",
+                    models.CharField(
+                        help_text="SHA-256 of the source file contents.",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                ("file_name", models.CharField(max_length=500)),
+                (
+                    "last_row",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Last data row (1-based) whose chunk was committed.",
+                    ),
+                ),
+                ("imported_count", models.PositiveIntegerField(default=0)),
+                ("skipped_count", models.PositiveIntegerField(default=0)),
+                ("completed", models.BooleanField(default=False)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0007_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="source_fingerprint",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True
+            ),
+        ),
+    ]
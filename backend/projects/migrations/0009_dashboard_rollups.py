@@ -0,0 +1,192 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+AMOUNT_FIELDS = ['pag_value', 'total_expenditure', 'total_contribution']
+ROLLUP_FIELDS = ['project_count', 'pag_value_count'] + AMOUNT_FIELDS
+
+
+def build_rollups(apps, schema_editor):
+    """rollups.rebuild_rollups() on the historical models, so the dashboard starts from the existing projects."""
+    Project = apps.get_model('projects', 'Project')
+
+    def aggregates(prefix=''):
+        return {
+            'project_count': Count(f'{prefix}id'),
+            'pag_value_count': Count(f'{prefix}pag_value'),
+            **{field: Sum(f'{prefix}{field}') for field in AMOUNT_FIELDS},
+        }
+
+    def rollups(model_name, key, rows):
+        model = apps.get_model('projects', model_name)
+        model.objects.bulk_create(model(**{key: row[key]}, **{field: row[field] or 0 for field in ROLLUP_FIELDS}) for row in rows)
+
+    rollups('CountryRollup', 'country_id',
+            Project.objects.filter(country__isnull=False).values('country_id').annotate(**aggregates()).order_by())
+    rollups('LeadOrgUnitRollup', 'lead_org_unit_id',
+            Project.objects.filter(lead_org_unit__isnull=False).values('lead_org_unit_id').annotate(**aggregates()).order_by())
+    rollups('ThemeRollup', 'theme_id',
+            Project.themes.through.objects.values('theme_id').annotate(**aggregates('project__')).order_by())
+    totals = Project.objects.aggregate(**aggregates())
+    PortfolioRollup = apps.get_model('projects', 'PortfolioRollup')
+    PortfolioRollup.objects.create(pk=1, **{field: totals[field] or 0 for field in ROLLUP_FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0008_project_source_fingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CountryRollup",
+            fields=[
+                ("project_count", models.IntegerField(default=0)),
+                (
+                    "pag_value_count",
+                    models.IntegerField(
+                        default=0, help_text="Projects with a PAG value (not NULL)."
+                    ),
+                ),
+                (
+                    "pag_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_expenditure",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_contribution",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "country",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rollup",
+                        serialize=False,
+                        to="projects.country",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="LeadOrgUnitRollup",
+            fields=[
+                ("project_count", models.IntegerField(default=0)),
+                (
+                    "pag_value_count",
+                    models.IntegerField(
+                        default=0, help_text="Projects with a PAG value (not NULL)."
+                    ),
+                ),
+                (
+                    "pag_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_expenditure",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_contribution",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "lead_org_unit",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rollup",
+                        serialize=False,
+                        to="projects.leadorgunit",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="PortfolioRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("project_count", models.IntegerField(default=0)),
+                (
+                    "pag_value_count",
+                    models.IntegerField(
+                        default=0, help_text="Projects with a PAG value (not NULL)."
+                    ),
+                ),
+                (
+                    "pag_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_expenditure",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_contribution",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="ThemeRollup",
+            fields=[
+                ("project_count", models.IntegerField(default=0)),
+                (
+                    "pag_value_count",
+                    models.IntegerField(
+                        default=0, help_text="Projects with a PAG value (not NULL)."
+                    ),
+                ),
+                (
+                    "pag_value",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_expenditure",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "total_contribution",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=24),
+                ),
+                (
+                    "theme",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rollup",
+                        serialize=False,
+                        to="projects.theme",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
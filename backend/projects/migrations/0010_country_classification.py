@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:14
+
+from django.db import migrations, models
+
+
+# Country.COMBINED_REGEX when this migration was written, frozen so later changes to it don't alter the migration
+COMBINED_REGEX = 'GLOBAL|Regional|,|United Nations Organization'
+
+
+def classify_countries(apps, schema_editor):
+    Country = apps.get_model('projects', 'Country')
+    # 'single' is the column default; iregex is `~*`, as in the COPY import loader
+    Country.objects.filter(name__iregex=COMBINED_REGEX).update(classification='combined')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0009_dashboard_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="country",
+            name="classification",
+            field=models.CharField(
+                choices=[
+                    ("single", "Single country"),
+                    ("combined", "Combined/regional/global"),
+                ],
+                db_index=True,
+                default="single",
+                editable=False,
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(classify_countries, migrations.RunPython.noop),
+    ]
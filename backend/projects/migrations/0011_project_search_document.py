@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_documents(apps, schema_editor):
+    """
+    projects.search.search_document() as it was when this migration was written,
+    on the historical models, so later changes to the document don't alter it.
+    """
+    Project = apps.get_model('projects', 'Project')
+
+    def lookup_name(model_name, field):
+        model = apps.get_model('projects', model_name)
+        return Subquery(model.objects.filter(pk=OuterRef(field)).values('name')[:1])
+
+    def m2m_names(relation, name_field):
+        through = getattr(Project, relation).through
+        return Subquery(
+            through.objects.filter(project_id=OuterRef('pk')).order_by().values('project_id').annotate(
+                names=StringAgg(f'{name_field}__name', ' ')
+            ).values('names')
+        )
+
+    document = (
+        SearchVector('title', 'project_id_excel', 'paas_code', weight='A', config='simple')
+        + SearchVector(
+            lookup_name('Country', 'country_id'), lookup_name('LeadOrgUnit', 'lead_org_unit_id'),
+            m2m_names('themes', 'theme'), m2m_names('donors', 'donor'),
+            weight='B', config='simple',
+        )
+        + SearchVector('fund', 'status', weight='C', config='simple')
+    )
+    Project.objects.order_by().update(search_document=document)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0010_country_classification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="search_document",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        # Before the index, so it is built once over the filled column
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="project",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_document"], name="project_search_document_gin"
+            ),
+        ),
+    ]
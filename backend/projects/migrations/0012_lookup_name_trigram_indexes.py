@@ -0,0 +1,47 @@
+"""
+Trigram GIN indexes on UPPER(name) of the lookups for the suggest endpoints.
+
+Only created where the pg_trgm extension is available; without it the
+suggestions fall back to unindexed substring matching (see projects/search.py).
+Creating the extension needs a role allowed to do so (any database owner on
+PostgreSQL 13+, where pg_trgm is a trusted extension).
+"""
+
+from django.db import migrations
+
+LOOKUP_MODELS = ['Country', 'LeadOrgUnit', 'Theme', 'Donor']
+
+
+def _index_name(model):
+    return f'{model._meta.db_table}_name_trgm'
+
+
+def create_trigram_indexes(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for model_name in LOOKUP_MODELS:
+            model = apps.get_model('projects', model_name)
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {_index_name(model)} ON {model._meta.db_table} USING gin (UPPER(name) gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    # The extension is left installed; other apps may use it.
+    with schema_editor.connection.cursor() as cursor:
+        for model_name in LOOKUP_MODELS:
+            cursor.execute(f'DROP INDEX IF EXISTS {_index_name(apps.get_model("projects", model_name))}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0011_project_search_document"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
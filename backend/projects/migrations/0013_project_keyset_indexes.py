@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0012_lookup_name_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(
+                fields=["created_at", "id"], name="project_created_keyset"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(fields=["title", "id"], name="project_title_keyset"),
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(fields=["status", "id"], name="project_status_keyset"),
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(
+                fields=["country", "created_at", "id"], name="project_country_keyset"
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-17 04:33
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("projects", "0013_project_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="country",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"), name="country_name_lower"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="donor",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"), name="donor_name_lower"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="leadorgunit",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="leadorgunit_name_lower",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="theme",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"), name="theme_name_lower"
+            ),
+        ),
+    ]
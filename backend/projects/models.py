@@ -1,22 +1,61 @@
-from django.db import models
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.core.exceptions import ValidationError
 
 class Country(models.Model):
+    SINGLE = 'single'
+    COMBINED = 'combined'
+    CLASSIFICATION_CHOICES = [
+        (SINGLE, 'Single country'),
+        (COMBINED, 'Combined/regional/global'),
+    ]
+    # Define patterns to identify combined/regional/global entries (case-insensitive)
+    # Added a pattern for "United Nations Organization" as it's also a non-geographic entity
+    COMBINED_PATTERNS = [
+        r'GLOBAL',
+        r'Regional',
+        r',', # Assuming entries with commas are multi-country
+        r'United Nations Organization' # Added pattern for this specific entry
+    ]
+    # Also valid as a PostgreSQL regular expression (for `name ~* COMBINED_REGEX` in raw SQL)
+    COMBINED_REGEX = '|'.join(COMBINED_PATTERNS)
+
     name = models.CharField(max_length=150, unique=True) # Increased max_length for potentially longer country names
     # Consider adding a country code if available/useful e.g. K_CODE = models.CharField(max_length=3, unique=True, null=True, blank=True)
+    # Derived from the name on save (and by import_projects / the classify_countries command)
+    classification = models.CharField(max_length=10, choices=CLASSIFICATION_CHOICES, default=SINGLE, db_index=True, editable=False)
 
     class Meta:
         verbose_name_plural = "Countries" # Correct pluralization in Django admin
+        # Case-insensitive name matching (see projects/lookups.py)
+        indexes = [models.Index(Lower('name'), name='country_name_lower')]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def classify(cls, name):
+        """'combined' for multi-country, regional and global entries, else 'single'."""
+        return cls.COMBINED if re.search(cls.COMBINED_REGEX, name, re.IGNORECASE) else cls.SINGLE
+
+    def save(self, *args, **kwargs):
+        self.classification = self.classify(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'classification'}
+        super().save(*args, **kwargs)
+
 class LeadOrgUnit(models.Model):
     name = models.CharField(max_length=255, unique=True) # Increased max_length
     description = models.TextField(blank=True, null=True) # Optional description
 
     class Meta:
         verbose_name_plural = "Lead Org Units"
+        indexes = [models.Index(Lower('name'), name='leadorgunit_name_lower')]
 
     def __str__(self):
         return self.name
@@ -25,12 +64,19 @@ class Theme(models.Model):
     name = models.CharField(max_length=255, unique=True) # Increased max_length for longer theme names like "Urban Land, Legislation & Governance"
     description = models.TextField(blank=True, null=True) # Optional description
 
+    class Meta:
+        indexes = [models.Index(Lower('name'), name='theme_name_lower')]
+
     def __str__(self):
         return self.name
     
 class Donor(models.Model):
     name = models.CharField(max_length=255, unique=True) # Increased max_length for longer donor names
     # Add other donor details if needed
+
+    class Meta:
+        indexes = [models.Index(Lower('name'), name='donor_name_lower')]
+
     def __str__(self):
         return self.name
 
@@ -87,12 +133,27 @@ class Project(models.Model):
     total_contribution = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True) # From sample
     total_psc = models.DecimalField(max_digits=19, decimal_places=2, null=True, blank=True) # From sample
 
+    # SHA-256 of the normalized source row, set by import_projects to skip rows that didn't change.
+    # Cleared on API edits so the next import re-applies the source values.
+    source_fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    # Full-text search document (title, IDs, fund, status and the lookup names), kept current by projects/search.py
+    search_document = SearchVectorField(null=True, editable=False)
+
     # Audit Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at', 'title'] # Default ordering
+        indexes = [
+            GinIndex(fields=['search_document'], name='project_search_document_gin'),
+            # Keyset pagination (projects/pagination.py): sort key + id, and the filtered listings
+            models.Index(fields=['created_at', 'id'], name='project_created_keyset'),
+            models.Index(fields=['title', 'id'], name='project_title_keyset'),
+            models.Index(fields=['status', 'id'], name='project_status_keyset'),
+            models.Index(fields=['country', 'created_at', 'id'], name='project_country_keyset'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.project_id_excel or 'N/A'})"
@@ -116,6 +177,12 @@ class Project(models.Model):
             raise ValidationError({'end_date': 'End date cannot be before the start date.'})
         # Add other model-level validations here
 
+    def save(self, *args, **kwargs):
+        # One transaction from pre_save to post_save: the rollup handlers (projects/rollups.py)
+        # lock the stored row in pre_save, so concurrent saves of a project apply their deltas in turn.
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
     # def save(self, *args, **kwargs):
     #     # If you were storing total_contribution_expenditure_diff, you'd calculate it here:
     #     # if self.total_contribution is not None and self.total_expenditure is not None:
@@ -123,3 +190,62 @@ class Project(models.Model):
     #     # else:
     #     #    self.total_contribution_expenditure_diff = None
     #     super().save(*args, **kwargs)
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of an `import_projects` run, one row per source file (identified by content hash).
+    Updated in the same transaction as each committed chunk so `--resume` can restart after a crash.
+    """
+    file_hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the source file contents.")
+    file_name = models.CharField(max_length=500)
+    last_row = models.PositiveIntegerField(default=0, help_text="Last data row (1-based) whose chunk was committed.")
+    imported_count = models.PositiveIntegerField(default=0)
+    skipped_count = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} (row {self.last_row}{', completed' if self.completed else ''})"
+
+# --- Dashboard Rollups ---
+# Pre-aggregated project counts and amounts for the dashboard views, maintained
+# incrementally by the signal handlers in projects/rollups.py. Bulk writes that bypass
+# signals (import_projects, QuerySet.update) must be followed by `manage.py rebuild_rollups`.
+
+class RollupBase(models.Model):
+    # Plain IntegerFields: a delta applied to a stale row must not fail the project save.
+    project_count = models.IntegerField(default=0)
+    pag_value_count = models.IntegerField(default=0, help_text="Projects with a PAG value (not NULL).")
+    pag_value = models.DecimalField(max_digits=24, decimal_places=2, default=0) # Sums, so more digits than the Project fields
+    total_expenditure = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+    total_contribution = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+class CountryRollup(RollupBase):
+    country = models.OneToOneField(Country, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+
+    def __str__(self):
+        return f"{self.country}: {self.project_count} projects"
+
+class LeadOrgUnitRollup(RollupBase):
+    lead_org_unit = models.OneToOneField(LeadOrgUnit, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+
+    def __str__(self):
+        return f"{self.lead_org_unit}: {self.project_count} projects"
+
+class ThemeRollup(RollupBase):
+    theme = models.OneToOneField(Theme, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+
+    def __str__(self):
+        return f"{self.theme}: {self.project_count} projects"
+
+class PortfolioRollup(RollupBase):
+    """Totals over all projects; a single row with pk=1."""
+    GLOBAL_PK = 1
+
+    def __str__(self):
+        return f"All projects: {self.project_count}"
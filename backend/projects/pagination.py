@@ -0,0 +1,248 @@
+# projects/pagination.py
+
+"""
+Pagination for the project listings.
+
+Page-number pagination (`?page=`) stays the default. `?pagination=cursor`
+(or any `?cursor=`) switches to keyset pagination: instead of COUNT(*) plus an
+OFFSET scan, each page continues from the sort key of the last row of the
+previous one, so page 1000 costs the same as page 1.
+
+The cursor is opaque (base64 JSON of that sort key) and follows the queryset's
+ordering after OrderingFilter, e.g. `-created_at`, `?ordering=title` or the
+`?search=` rank, with the primary key added as the tie-breaker.
+"""
+
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _json_value(value):
+    # Full precision: DjangoJSONEncoder would cut datetimes to milliseconds, which breaks ties.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# --- Standard Pagination Configuration ---
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on the full sort key: the next page is
+    `WHERE (key) after (last row's key) ORDER BY key LIMIT page_size + 1`.
+
+    Unlike rest_framework's CursorPagination (which positions on the first
+    ordering field and skips ties with an OFFSET), rows with equal values, such
+    as the many projects sharing a status, cost nothing extra to page through.
+    The response has `next`, `previous` and `results`; there is no `count`.
+
+    Pages cost the same at any depth when an index starts with the sort key
+    (see Project.Meta.indexes); orderings through a join (`country__name`)
+    still work but sort the remaining rows.
+    """
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = StandardResultsSetPagination.page_size_query_param
+    max_page_size = StandardResultsSetPagination.max_page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(queryset)
+        values, self.reverse = self.decode_cursor(request)
+
+        ordering = [self.order_term(field, descending != self.reverse) for field, descending, nullable in self.keys]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            try:
+                queryset = queryset.filter(self.after(values))
+            except (ValidationError, TypeError, ValueError):
+                # Values that don't fit the key fields: decode_cursor only checked the cursor's shape
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    # --- Sort key ---
+
+    def get_keys(self, queryset):
+        """[(field path, descending, nullable), ...] from the queryset's ordering, ending with the pk."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        keys = []
+        for term in ordering:
+            if not isinstance(term, str):
+                raise ParseError('Cursor pagination only supports ordering by model fields.')
+            descending = term.startswith('-')
+            field = 'pk' if term.lstrip('-') == 'id' else term.lstrip('-')
+            if field in (key[0] for key in keys):
+                continue
+            # Annotations are taken as non-null: the one ordered by is the search rank, set on every matching row
+            nullable = False if field in queryset.query.annotations else self.is_nullable(queryset.model, field)
+            keys.append((field, descending, nullable))
+        if not keys or keys[-1][0] != 'pk':
+            # The pk makes the key unique; same direction as the last field, so one index covers both.
+            keys = [key for key in keys if key[0] != 'pk']
+            keys.append(('pk', keys[-1][1] if keys else False, False))
+        return keys
+
+    @staticmethod
+    def is_nullable(model, path):
+        if path == 'pk':
+            return False
+        nullable = False
+        for name in path.split('__'):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ParseError(f"Cursor pagination can't order by '{path}'; pass ?ordering= with a model field.")
+            nullable = nullable or field.null
+            model = field.related_model
+        return nullable
+
+    @staticmethod
+    def order_term(field, descending):
+        # PostgreSQL puts NULLs last ascending and first descending, so the reverse order is exact.
+        return f'-{field}' if descending else field
+
+    @staticmethod
+    def row_value(row, field):
+        if isinstance(row, dict): # A values() row
+            return row['id' if field == 'pk' else field]
+        if field == 'pk':
+            return row.pk
+        value = row
+        for name in field.split('__'):
+            value = getattr(value, name, None)
+            if value is None:
+                return None
+        return value
+
+    def after(self, values):
+        """Rows strictly after `values` in the (possibly reversed) key order."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (field, descending, nullable), value in zip(self.keys, values):
+            condition |= equal & self.beyond(field, descending != self.reverse, nullable, value)
+            equal &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+
+        # A plain bound on the leading field lets the index scan start at the cursor.
+        field, descending, nullable = self.keys[0]
+        if values[0] is not None and not nullable:
+            condition &= Q(**{f'{field}__lte' if descending != self.reverse else f'{field}__gte': values[0]})
+        return condition
+
+    @staticmethod
+    def beyond(field, descending, nullable, value):
+        if value is None:
+            # NULLs are last ascending (nothing follows them) and first descending
+            return Q(**{f'{field}__isnull': False}) if descending else Q(pk__in=[])
+        condition = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+        if nullable and not descending:
+            condition |= Q(**{f'{field}__isnull': True})
+        return condition
+
+    # --- Cursors ---
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = cursor['v'], bool(cursor.get('r'))
+            if not isinstance(values, list) or len(values) != len(self.keys):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, row, reverse):
+        values = [self.row_value(row, field) for field, descending, nullable in self.keys]
+        payload = json.dumps({'v': values, 'r': 1 if reverse else 0}, default=_json_value, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[0], True))
+
+
+class ProjectPagination(StandardResultsSetPagination):
+    """
+    Page-number pagination unless the request asks for cursors with
+    `?pagination=cursor` or carries a `?cursor=` from a previous response.
+    """
+    mode_query_param = 'pagination'
+    cursor_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if request.query_params.get(self.mode_query_param) == 'cursor' or self.cursor_class.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_class()
+            self.display_page_controls = False
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,247 @@
+# projects/querybudget.py
+
+"""
+Per-request SQL query instrumentation.
+
+QueryBudgetMiddleware counts the queries each request runs (through a
+database execute wrapper, so it works with DEBUG off; queries the request
+runs in other threads, such as the concurrent ones of projects/async_views.py,
+count too) and groups them by
+"shape": the SQL with parameters, literals and IN lists collapsed. A shape run
+REPEAT_THRESHOLD or more times in one request is almost always an N+1.
+
+The middleware is on with DEBUG, or when QUERY_BUDGET['ENABLED'] is set.
+
+- With HEADERS on (default: DEBUG), responses carry X-Query-Count,
+  X-Query-Time-Ms, X-Query-Repeated and, when the view declares one,
+  X-Query-Budget.
+- Views declare a budget for GET/HEAD requests with a `query_budget` class
+  attribute; requests over it are logged as warnings.
+- Per-endpoint statistics (per process, since startup) are served by
+  QueryStatsView and returned by get_stats().
+
+For tests, projects/testing.py has helpers that fail when an endpoint goes
+over its budget.
+"""
+
+import contextvars
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': None, # None: follow DEBUG (every query's shape is normalized with regexes)
+    'HEADERS': None, # None: follow DEBUG
+    'REPEAT_THRESHOLD': 3, # Runs of one shape in a request that count as repeated
+}
+
+
+def get_config():
+    config = {**DEFAULTS, **getattr(settings, 'QUERY_BUDGET', {})}
+    for name in ('ENABLED', 'HEADERS'):
+        if config[name] is None:
+            config[name] = settings.DEBUG
+    return config
+
+
+# --- Recording ---
+
+_IN_LIST = re.compile(r'%s(\s*,\s*%s)+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(\.\d+)?\b')
+# django.contrib.postgres looks up the hstore/citext type OIDs once per process, on the first connection
+_SETUP_QUERY = re.compile(r'^SELECT oid, typarray FROM pg_type\b')
+
+
+def sql_shape(sql):
+    """The SQL with parameters and literals collapsed, so the same query with other values has the same shape."""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return _IN_LIST.sub('%s, ...', sql)
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts queries, their time and their shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self._lock = threading.Lock() # Queries of one request may run in several threads
+
+    def __call__(self, execute, sql, params, many, context):
+        if _SETUP_QUERY.match(sql):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self._lock:
+                self.duration += time.perf_counter() - start
+                self.count += 1
+                self.shapes[sql_shape(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """[(shape, times), ...] for the shapes run at least `threshold` times, most frequent first."""
+        threshold = get_config()['REPEAT_THRESHOLD'] if threshold is None else threshold
+        return [(shape, times) for shape, times in self.shapes.most_common() if times >= threshold]
+
+    def report(self, limit=5):
+        lines = [f'{self.count} queries in {self.duration * 1000:.1f} ms']
+        for shape, times in self.repeated()[:limit]:
+            lines.append(f'  {times}x {shape[:300]}')
+        return '\n'.join(lines)
+
+
+# The active recorders live in a context variable rather than on the connections, which
+# are per thread: asgiref's sync_to_async/async_to_sync carry it into the threads a
+# request hands queries to, so those are counted as well.
+_recorders = contextvars.ContextVar('query_recorders', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    for recorder in _recorders.get():
+        execute = functools.partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+@receiver(connection_created)
+def install_on_new_connection(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def record_queries():
+    """Count the queries run inside the block, on every database (including from threads it hands work to)."""
+    recorder = QueryRecorder()
+    for connection in connections.all():
+        install(connection) # Already open before this module was imported
+    token = _recorders.set((*_recorders.get(), recorder))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+# --- Per-endpoint statistics ---
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record_stats(endpoint, recorder, budget):
+    repeated = bool(recorder.repeated())
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'query_time_ms': 0.0,
+            'repeated_requests': 0, 'over_budget_requests': 0, 'budget': budget,
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.count
+        stats['max_queries'] = max(stats['max_queries'], recorder.count)
+        stats['query_time_ms'] += recorder.duration * 1000
+        stats['repeated_requests'] += repeated
+        stats['over_budget_requests'] += budget is not None and recorder.count > budget
+        stats['budget'] = budget
+
+
+def get_stats():
+    """Endpoint (URL name) -> request count, average/max queries, and requests with repeated shapes or over budget."""
+    with _stats_lock:
+        snapshot = {endpoint: dict(stats) for endpoint, stats in _stats.items()}
+    for stats in snapshot.values():
+        stats['avg_queries'] = round(stats['queries'] / stats['requests'], 2)
+        stats['avg_query_time_ms'] = round(stats.pop('query_time_ms') / stats['requests'], 2)
+    return dict(sorted(snapshot.items(), key=lambda item: str(item[0])))
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# --- Middleware ---
+
+def view_budget(view_func):
+    """The `query_budget` declared by the class of a class-based view, or None."""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    return getattr(view_class, 'query_budget', None)
+
+
+class QueryBudgetMiddleware:
+    """
+    Put it first in MIDDLEWARE so the queries of the other middleware count too.
+    Works under WSGI and ASGI (without a thread hop for async views). Queries run
+    while a streaming response is iterated (after the view returns) are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+
+        request.query_budget = None
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, config)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+
+        request.query_budget = None
+        with record_queries() as recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, config)
+
+    def finish(self, request, response, recorder, config):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.view_name if match else None
+        budget = request.query_budget
+        if endpoint:
+            record_stats(endpoint, recorder, budget)
+        if budget is not None and recorder.count > budget:
+            logger.warning('%s %s went over its query budget of %d: %s', request.method, request.path, budget, recorder.report())
+        elif recorder.repeated():
+            logger.info('%s %s ran repeated queries: %s', request.method, request.path, recorder.report())
+
+        if config['HEADERS']:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+            response['X-Query-Repeated'] = str(sum(times for shape, times in recorder.repeated()))
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Budgets cover reads; writes run signal handlers (rollups, search, cache) on purpose.
+        if request.method in ('GET', 'HEAD'):
+            request.query_budget = view_budget(view_func)
@@ -0,0 +1,142 @@
+# projects/readers.py
+
+"""
+Fast read path for project lists.
+
+ProjectSerializer(many=True) instantiates and walks every field of every
+row, plus the nested country/lead org unit/theme/donor serializers. For a
+page of projects, ProjectListReader builds the same dicts from one values()
+query and one query per requested M2M, already grouped by project. The
+values are formatted with the serializer's own field objects, so the JSON
+is byte-identical. `manage.py benchmark_project_lists` compares the two.
+
+Writes (and single-object reads) keep using ProjectSerializer.
+"""
+
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .serializers import ProjectSerializer
+
+# Field types whose to_representation returns database values unchanged
+_PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.ChoiceField, serializers.BooleanField)
+
+
+class _Row:
+    """Attribute access to a values() row, for evaluating model properties on it."""
+
+    def __init__(self, row):
+        self.__dict__.update(row)
+
+
+class ProjectListReader:
+    """
+    Output of `serializer_class(many=True)` for a queryset of projects, limited
+    to `fieldset` (the names of the readable fields, see projects/fieldsets.py).
+    Use values_queryset() for the rows (paginate them as usual) and
+    represent() for the output.
+    """
+
+    def __init__(self, fieldset=None, serializer_class=ProjectSerializer):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        fields = {name: field for name, field in serializer_class().fields.items() if not field.write_only}
+        self.output = [(name, fields[name]) for name in fields if fieldset is None or name in fieldset]
+        self.plan = [self.plan_field(name, field) for name, field in self.output]
+
+    def plan_field(self, name, field):
+        """(name, kind, details) describing how to produce the value of one output field."""
+        source = field.source
+        if isinstance(field, serializers.ListSerializer):
+            return name, 'many', (source, list(field.child.Meta.fields))
+        if isinstance(field, serializers.Serializer):
+            return name, 'nested', (source, list(field.Meta.fields))
+        if isinstance(getattr(self.model, source, None), property):
+            return name, 'property', (getattr(self.model, source).fget, field)
+        if isinstance(field, _PASSTHROUGH_FIELDS):
+            return name, 'value', (source, None)
+        return name, 'value', (source, field)
+
+    # --- Rows ---
+
+    def columns(self, queryset):
+        columns = ['id']
+        for name, kind, details in self.plan:
+            if kind == 'value':
+                columns.append(details[0])
+            elif kind == 'nested':
+                source, nested_fields = details
+                columns.extend(f'{source}__{nested}' for nested in nested_fields)
+            elif kind == 'property':
+                columns.extend(self.serializer_class.fieldset_sources.get(name, []))
+        # Keyset pagination reads the ordering fields from the rows
+        for term in queryset.query.order_by:
+            if isinstance(term, str) and term.lstrip('-') not in ('pk', 'id'):
+                path = term.lstrip('-')
+                if path in queryset.query.annotations or path.split('__')[0] in {field.name for field in self.model._meta.get_fields()}:
+                    columns.append(path)
+        return list(dict.fromkeys(columns))
+
+    def values_queryset(self, queryset):
+        return queryset.prefetch_related(None).values(*self.columns(queryset))
+
+    # --- Output ---
+
+    def many_maps(self, project_ids):
+        """source -> {project id: [related dicts]} for the requested M2M fields, one query each."""
+        maps = {}
+        for name, kind, details in self.plan:
+            if kind != 'many':
+                continue
+            source, related_fields = details
+            related_model = self.model._meta.get_field(source).related_model
+            reverse_name = self.model._meta.get_field(source).related_query_name()
+            grouped = {project_id: [] for project_id in project_ids}
+            # Same query shape as prefetch_related(source), so the related rows come back in the same order
+            rows = related_model.objects.filter(**{f'{reverse_name}__in': project_ids}).values_list(reverse_name, *related_fields)
+            for project_id, *values in rows:
+                grouped[project_id].append(dict(zip(related_fields, values)))
+            maps[source] = grouped
+        return maps
+
+    def represent(self, rows):
+        rows = list(rows)
+        maps = self.many_maps([row['id'] for row in rows])
+        return [self.represent_row(row, maps) for row in rows]
+
+    def represent_row(self, row, maps):
+        data = {}
+        for name, kind, details in self.plan:
+            if kind == 'value':
+                source, field = details
+                value = row[source]
+                data[name] = value if value is None or field is None else field.to_representation(value)
+            elif kind == 'nested':
+                source, nested_fields = details
+                if row[f'{source}__id'] is None:
+                    data[name] = None
+                else:
+                    data[name] = {nested: row[f'{source}__{nested}'] for nested in nested_fields}
+            elif kind == 'many':
+                data[name] = maps[details[0]][row['id']]
+            else:
+                getter, field = details
+                value = getter(_Row(row))
+                data[name] = None if value is None else field.to_representation(value)
+        return data
+
+
+class FastProjectListMixin:
+    """
+    list() through ProjectListReader instead of the serializer. Goes after
+    SparseFieldsetMixin/ConditionalGetMixin and before the generic view.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fieldset = self.get_fieldset() if hasattr(self, 'get_fieldset') else None
+        reader = ProjectListReader(fieldset, self.get_serializer_class())
+        queryset = reader.values_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.represent(page))
+        return Response(reader.represent(queryset))
@@ -0,0 +1,273 @@
+# projects/rollups.py
+
+"""
+Incremental maintenance of the dashboard rollup tables (CountryRollup,
+LeadOrgUnitRollup, ThemeRollup and the single PortfolioRollup row).
+
+Every Project save/delete and every change to `Project.themes` applies the
+difference it makes to the affected rollup rows with F() updates, so the
+dashboard reads a few rows instead of aggregating the Project table.
+Writes that don't send signals (bulk_create, QuerySet.update, raw SQL) run
+inside `suspended()` and are followed by `rebuild_rollups()`.
+"""
+
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Project, CountryRollup, LeadOrgUnitRollup, ThemeRollup, PortfolioRollup
+
+AMOUNT_FIELDS = ['pag_value', 'total_expenditure', 'total_contribution']
+ROLLUP_FIELDS = ['project_count', 'pag_value_count'] + AMOUNT_FIELDS
+
+_state = threading.local()
+
+
+@contextmanager
+def suspended():
+    """Turn the signal handlers off in this thread, e.g. around a bulk import that rebuilds afterwards."""
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+# --- Deltas ---
+# A delta is a dict of ROLLUP_FIELDS -> the amount a rollup row changes by.
+
+def project_delta(values, sign=1):
+    """What one project (a dict with the AMOUNT_FIELDS) contributes to a rollup row, times `sign`."""
+    delta = {
+        'project_count': sign,
+        'pag_value_count': sign if values['pag_value'] is not None else 0,
+    }
+    for field in AMOUNT_FIELDS:
+        delta[field] = sign * (values[field] or Decimal(0))
+    return delta
+
+
+def add_deltas(*deltas):
+    return {field: sum(delta[field] for delta in deltas) for field in ROLLUP_FIELDS}
+
+
+def apply_delta(model, pk, delta):
+    """Add `delta` to the rollup row `pk` of `model`, creating the row on first use."""
+    if pk is None or not any(delta.values()):
+        return
+    model.objects.get_or_create(pk=pk)
+    model.objects.filter(pk=pk).update(**{field: F(field) + value for field, value in delta.items()})
+
+
+def _stored_values(project_ids, lock=False):
+    """
+    project id -> {field: value} as currently stored, for the fields the rollups depend on.
+    With `lock`, the rows stay locked until the surrounding transaction ends, so a concurrent
+    write of the same projects waits and then reads the values this one leaves behind.
+    """
+    projects = Project.objects.filter(id__in=project_ids).order_by('id') # Lock in id order: no deadlocks
+    if lock:
+        projects = projects.select_for_update()
+    return {row['id']: row for row in projects.values('id', 'country_id', 'lead_org_unit_id', *AMOUNT_FIELDS)}
+
+
+def _theme_ids(project_id):
+    return list(Project.themes.through.objects.filter(project_id=project_id).values_list('theme_id', flat=True))
+
+
+# --- Project save/delete ---
+
+@receiver(pre_save, sender=Project)
+def remember_stored_project(sender, instance, raw=False, **kwargs):
+    """
+    Keep the stored version of the project, so post_save can apply the difference.
+    Project.save() runs in a transaction, which keeps the row locked until post_save is done:
+    two saves that both move a project would otherwise both remove it from its old rollup rows.
+    """
+    if is_suspended() or raw:
+        return
+    instance._rollup_old = _stored_values([instance.pk], lock=True).get(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Project)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if is_suspended() or raw:
+        return
+    old = getattr(instance, '_rollup_old', None)
+    new = {'country_id': instance.country_id, 'lead_org_unit_id': instance.lead_org_unit_id}
+    new.update({field: getattr(instance, field) for field in AMOUNT_FIELDS})
+    added = project_delta(new)
+    removed = project_delta(old, -1) if old else None
+
+    with transaction.atomic():
+        for model, key in ((CountryRollup, 'country_id'), (LeadOrgUnitRollup, 'lead_org_unit_id')):
+            if old and old[key] == new[key]:
+                apply_delta(model, new[key], add_deltas(added, removed))
+            else:
+                if old:
+                    apply_delta(model, old[key], removed)
+                apply_delta(model, new[key], added)
+        apply_delta(PortfolioRollup, PortfolioRollup.GLOBAL_PK, add_deltas(added, removed) if old else added)
+        # Theme membership doesn't change on save (m2m_changed covers that), only the amounts.
+        if old:
+            for theme_id in _theme_ids(instance.pk):
+                apply_delta(ThemeRollup, theme_id, add_deltas(added, removed))
+    instance._rollup_old = None
+
+
+@receiver(pre_delete, sender=Project)
+def remember_deleted_project(sender, instance, **kwargs):
+    """The through rows are deleted without m2m_changed, so remember the themes here."""
+    if is_suspended():
+        return
+    # Sent inside the deletion's transaction, which keeps the row locked (see remember_stored_project)
+    instance._rollup_old = _stored_values([instance.pk], lock=True).get(instance.pk)
+    instance._rollup_theme_ids = _theme_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Project)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_rollup_old', None)
+    if is_suspended() or not old:
+        return
+    removed = project_delta(old, -1)
+    with transaction.atomic():
+        apply_delta(CountryRollup, old['country_id'], removed)
+        apply_delta(LeadOrgUnitRollup, old['lead_org_unit_id'], removed)
+        apply_delta(PortfolioRollup, PortfolioRollup.GLOBAL_PK, removed)
+        for theme_id in instance._rollup_theme_ids:
+            apply_delta(ThemeRollup, theme_id, removed)
+
+
+# --- Project.themes changes ---
+
+@receiver(m2m_changed, sender=Project.themes.through)
+def update_rollups_on_themes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Works from both sides: project.themes.add(...) (pk_set are theme ids) and
+    theme.projects.add(...) (pk_set are project ids). For 'add', Django already
+    leaves out existing links; for 'remove'/'clear' the links that really exist
+    are looked up before they are deleted.
+    """
+    if is_suspended():
+        return
+    side, other_side = ('theme_id', 'project_id') if reverse else ('project_id', 'theme_id')
+
+    if action in ('pre_remove', 'pre_clear'):
+        links = sender.objects.filter(**{side: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other_side}__in': pk_set})
+        instance._rollup_removed_links = list(links.values_list('project_id', 'theme_id'))
+        return
+
+    if action == 'post_add':
+        links = [(instance.pk, pk) if not reverse else (pk, instance.pk) for pk in pk_set]
+        sign = 1
+    elif action in ('post_remove', 'post_clear'):
+        links = getattr(instance, '_rollup_removed_links', [])
+        instance._rollup_removed_links = []
+        sign = -1
+    else:
+        return
+
+    # The related manager sends these inside its transaction: lock the projects against a concurrent
+    # save, which would otherwise apply its amount change to the themes without the new link.
+    projects = _stored_values({project_id for project_id, _ in links}, lock=True)
+    deltas = {}
+    for project_id, theme_id in links:
+        delta = project_delta(projects[project_id], sign)
+        deltas[theme_id] = add_deltas(deltas[theme_id], delta) if theme_id in deltas else delta
+    with transaction.atomic():
+        for theme_id, delta in deltas.items():
+            apply_delta(ThemeRollup, theme_id, delta)
+
+
+# --- Bulk writes ---
+# Bulk writes run inside suspended(); they snapshot the affected projects before and
+# after the write and apply the difference in one pass.
+
+def project_states(project_ids):
+    """project id -> the stored values the rollups depend on, including 'theme_ids'."""
+    states = _stored_values(project_ids)
+    for values in states.values():
+        values['theme_ids'] = []
+    links = Project.themes.through.objects.filter(project_id__in=list(states)).values_list('project_id', 'theme_id')
+    for project_id, theme_id in links:
+        states[project_id]['theme_ids'].append(theme_id)
+    return states
+
+
+def apply_project_changes(before, after):
+    """
+    Apply the difference between two project_states() snapshots of the same projects
+    (a project missing from one side was created or deleted in between). Each
+    affected rollup row gets a single F() update.
+    """
+    deltas = {}
+    for states, sign in ((before, -1), (after, 1)):
+        for values in states.values():
+            delta = project_delta(values, sign)
+            keys = [
+                (CountryRollup, values['country_id']),
+                (LeadOrgUnitRollup, values['lead_org_unit_id']),
+                (PortfolioRollup, PortfolioRollup.GLOBAL_PK),
+            ] + [(ThemeRollup, theme_id) for theme_id in values['theme_ids']]
+            for key in keys:
+                deltas[key] = add_deltas(deltas[key], delta) if key in deltas else delta
+    with transaction.atomic():
+        for (model, pk), delta in deltas.items():
+            apply_delta(model, pk, delta)
+
+
+# --- Full recomputation ---
+
+def _aggregates(prefix=''):
+    return {
+        'project_count': Count(f'{prefix}id'),
+        'pag_value_count': Count(f'{prefix}pag_value'),
+        **{field: Sum(f'{prefix}{field}') for field in AMOUNT_FIELDS},
+    }
+
+
+def _rollup(model, key, row):
+    return model(**{key: row[key]}, **{field: row[field] or 0 for field in ROLLUP_FIELDS})
+
+
+@transaction.atomic
+def rebuild_rollups():
+    """
+    Recompute every rollup row from the Project table with one GROUP BY query per
+    table. Returns the number of rows written per rollup model.
+    """
+    for model in (CountryRollup, LeadOrgUnitRollup, ThemeRollup, PortfolioRollup):
+        model.objects.all().delete()
+
+    countries = CountryRollup.objects.bulk_create(
+        _rollup(CountryRollup, 'country_id', row)
+        for row in Project.objects.filter(country__isnull=False).values('country_id').annotate(**_aggregates()).order_by()
+    )
+    lead_org_units = LeadOrgUnitRollup.objects.bulk_create(
+        _rollup(LeadOrgUnitRollup, 'lead_org_unit_id', row)
+        for row in Project.objects.filter(lead_org_unit__isnull=False).values('lead_org_unit_id').annotate(**_aggregates()).order_by()
+    )
+    themes = ThemeRollup.objects.bulk_create(
+        _rollup(ThemeRollup, 'theme_id', row)
+        for row in Project.themes.through.objects.values('theme_id').annotate(**_aggregates('project__')).order_by()
+    )
+    totals = Project.objects.aggregate(**_aggregates())
+    PortfolioRollup.objects.create(pk=PortfolioRollup.GLOBAL_PK, **{field: totals[field] or 0 for field in ROLLUP_FIELDS})
+    return {
+        'countries': len(countries),
+        'lead_org_units': len(lead_org_units),
+        'themes': len(themes),
+    }
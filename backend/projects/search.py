@@ -0,0 +1,240 @@
+# projects/search.py
+
+"""
+Full-text search over projects.
+
+Each project stores a `search_document` tsvector (GIN-indexed) built from its
+own text fields and the names of its country, lead org unit, themes and donors.
+The signal handlers below rebuild the documents affected by a write, including
+lookup renames; import_projects refreshes the documents of each chunk itself.
+
+`?search=` keeps the SearchFilter syntax (terms split on spaces/commas, all terms
+must match) but each term now matches word prefixes through the index instead
+of running `icontains` over nine columns, and results are ranked.
+
+The lookup viewsets get typeahead suggestions (`/api/<lookup>/suggest/?q=`)
+from SuggestMixin, backed by pg_trgm GIN indexes on the lookup names.
+"""
+
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Upper
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.response import Response
+
+from . import rollups
+from .models import Project, Country, LeadOrgUnit, Theme, Donor
+
+# 'simple' keeps IDs, codes and names as they are (no stemming or stop words).
+SEARCH_CONFIG = 'simple'
+
+# Project relation of each lookup model whose names are part of the document
+LOOKUP_RELATIONS = {Country: 'country', LeadOrgUnit: 'lead_org_unit', Theme: 'themes', Donor: 'donors'}
+
+
+def _lookup_name(model, field):
+    return Subquery(model.objects.filter(pk=OuterRef(field)).values('name')[:1])
+
+
+def _m2m_names(relation, name_field):
+    through = getattr(Project, relation).through
+    return Subquery(
+        through.objects.filter(project_id=OuterRef('pk')).order_by().values('project_id').annotate(
+            names=StringAgg(f'{name_field}__name', ' ')
+        ).values('names')
+    )
+
+
+def search_document():
+    """Expression that computes Project.search_document, usable in QuerySet.update()."""
+    return (
+        SearchVector('title', 'project_id_excel', 'paas_code', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            _lookup_name(Country, 'country_id'), _lookup_name(LeadOrgUnit, 'lead_org_unit_id'),
+            _m2m_names('themes', 'theme'), _m2m_names('donors', 'donor'),
+            weight='B', config=SEARCH_CONFIG,
+        )
+        + SearchVector('fund', 'status', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_documents(queryset):
+    """Rebuild the search documents of the projects in `queryset` with a single UPDATE."""
+    return queryset.order_by().update(search_document=search_document())
+
+
+def build_query(terms):
+    """
+    Prefix tsquery requiring every term, e.g. ['urban', 'P0'] -> 'urban':* & 'p0':*.
+    Returns None when no term contains a word character.
+    """
+    lexemes = []
+    for term in terms:
+        if re.search(r'\w', term):
+            quoted = term.replace('\\', '\\\\').replace("'", "''")
+            lexemes.append(f"'{quoted}':*")
+    if not lexemes:
+        return None
+    return SearchQuery(' & '.join(lexemes), search_type='raw', config=SEARCH_CONFIG)
+
+
+class ProjectSearchFilter(SearchFilter):
+    """
+    `?search=` backed by the search_document GIN index. Results are ordered by
+    rank unless `?ordering=` is given; list it after OrderingFilter in
+    filter_backends so the rank ordering isn't replaced by the default ordering.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        query = build_query(terms)
+        if query is None:
+            return queryset.none()
+        queryset = queryset.filter(search_document=query)
+        if request.query_params.get(OrderingFilter.ordering_param):
+            return queryset
+        return queryset.annotate(
+            # ts_rank() is a float4; as float8 the value read back compares equal in keyset cursors (projects/pagination.py)
+            search_rank=Cast(SearchRank(F('search_document'), query), FloatField())
+        ).order_by('-search_rank', *queryset.query.order_by)
+
+
+# --- Typeahead suggestions ---
+
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+
+_trigram_available = {}
+
+
+def trigram_available(using='default'):
+    """Whether pg_trgm is installed in the database (checked once per process)."""
+    if using not in _trigram_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[using] = cursor.fetchone() is not None
+    return _trigram_available[using]
+
+
+def suggest(queryset, q, limit=SUGGEST_DEFAULT_LIMIT):
+    """
+    Up to `limit` lookups of `queryset` whose name contains `q` or is similar to a
+    word of it, best first, as dicts with id, name, similarity and project_count.
+
+    Substring and word-similarity (`<%`) matches both use the trigram index on
+    the name. Without pg_trgm (e.g. a bare local Postgres) only substring matches
+    are returned and similarity is None.
+    """
+    # Names starting with the text first: that is what a typeahead user means.
+    starts_with = Case(When(name__istartswith=q, then=Value(1)), default=Value(0), output_field=IntegerField())
+    queryset = queryset.annotate(starts_with=starts_with)
+    if trigram_available(queryset.db):
+        # icontains compiles to UPPER(name) LIKE ..., so the index is on UPPER(name) and the
+        # similarity match uses the same expression (trigrams ignore case anyway).
+        queryset = queryset.alias(upper_name=Upper('name')).annotate(
+            similarity=TrigramWordSimilarity(q, 'name')
+        ).filter(
+            Q(name__icontains=q) | Q(upper_name__trigram_word_similar=q)
+        ).order_by('-starts_with', '-similarity', 'name')
+    else:
+        queryset = queryset.annotate(similarity=Value(None, output_field=IntegerField())).filter(
+            name__icontains=q
+        ).order_by('-starts_with', 'name')
+    rows = list(queryset.values('id', 'name', 'similarity')[:limit])
+
+    # Counted for the k suggestions only, not for every match
+    relation = LOOKUP_RELATIONS[queryset.model]
+    counts = dict(
+        Project.objects.filter(**{f'{relation}__in': [row['id'] for row in rows]})
+        .values_list(relation).annotate(count=Count('pk')).order_by()
+    )
+    for row in rows:
+        if row['similarity'] is not None:
+            row['similarity'] = round(row['similarity'], 3)
+        row['project_count'] = counts.get(row['id'], 0)
+    return rows
+
+
+class SuggestMixin:
+    """
+    Adds `GET <lookup>/suggest/?q=<text>&limit=<k>` to a lookup viewset: the
+    top-k names matching the text with their project counts, so forms don't
+    have to download the whole table. Filters of the viewset's get_queryset()
+    (e.g. `?classification=` on countries) apply. An empty `q` returns an empty list.
+    """
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        q = request.query_params.get('q', '').strip()
+        try:
+            limit = int(request.query_params.get('limit', SUGGEST_DEFAULT_LIMIT))
+        except ValueError:
+            raise ParseError("'limit' must be a whole number.")
+        limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+        if not q:
+            return Response([])
+        return Response(suggest(self.get_queryset(), q, limit))
+
+
+# --- Keeping the documents current ---
+
+@receiver(post_save, sender=Project)
+def refresh_saved_project(sender, instance, raw=False, **kwargs):
+    if not raw and not rollups.is_suspended():
+        refresh_search_documents(Project.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Project.themes.through)
+@receiver(m2m_changed, sender=Project.donors.through)
+def refresh_projects_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if rollups.is_suspended():
+        return
+    if action == 'pre_clear' and reverse:
+        # theme.projects.clear(): the affected projects are only known before the clear
+        instance._search_cleared_ids = list(instance.projects.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            project_ids = [instance.pk]
+        elif action == 'post_clear':
+            project_ids = getattr(instance, '_search_cleared_ids', [])
+        else:
+            project_ids = pk_set
+        refresh_search_documents(Project.objects.filter(pk__in=project_ids))
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=LeadOrgUnit)
+@receiver(post_save, sender=Theme)
+@receiver(post_save, sender=Donor)
+def refresh_projects_on_lookup_rename(sender, instance, created=False, raw=False, **kwargs):
+    # A new lookup has no projects yet; a saved one may have been renamed.
+    if not created and not raw:
+        refresh_search_documents(Project.objects.filter(**{LOOKUP_RELATIONS[sender]: instance.pk}))
+
+
+@receiver(pre_delete, sender=Country)
+@receiver(pre_delete, sender=LeadOrgUnit)
+@receiver(pre_delete, sender=Theme)
+@receiver(pre_delete, sender=Donor)
+def remember_projects_of_deleted_lookup(sender, instance, **kwargs):
+    instance._search_project_ids = list(
+        Project.objects.filter(**{LOOKUP_RELATIONS[sender]: instance.pk}).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=LeadOrgUnit)
+@receiver(post_delete, sender=Theme)
+@receiver(post_delete, sender=Donor)
+def refresh_projects_of_deleted_lookup(sender, instance, **kwargs):
+    refresh_search_documents(Project.objects.filter(pk__in=getattr(instance, '_search_project_ids', [])))
@@ -2,13 +2,15 @@
 
 from rest_framework import serializers
 from django.db import transaction
+from .fieldsets import SparseFieldsetSerializerMixin
+from .lookups import resolve_name, resolve_names
 from .models import Project, Country, LeadOrgUnit, Theme, Donor
 
 # Serializers for related models (used for read-only representation in ProjectSerializer output)
 class CountrySerializer(serializers.ModelSerializer):
     class Meta:
         model = Country
-        fields = ['id', 'name'] # Explicitly list fields, good practice
+        fields = ['id', 'name', 'classification'] # Explicitly list fields, good practice (classification is read-only, derived from the name)
 
 class LeadOrgUnitSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,7 +28,7 @@ class DonorSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 # Main Project Serializer
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     # --- Read-only nested serializers for output ---
     # These provide detailed object representations when reading a project.
     # The `source` attribute points to the actual model field.
@@ -61,6 +63,11 @@ class ProjectSerializer(serializers.ModelSerializer):
         max_digits=19, decimal_places=2, read_only=True, allow_null=True
     )
 
+    # Model fields read by the property above, for `?fields=` (see projects/fieldsets.py)
+    fieldset_sources = {
+        'total_contribution_expenditure_diff': ['total_contribution', 'total_expenditure'],
+    }
+
     class Meta:
         model = Project
         fields = [
@@ -125,29 +132,23 @@ class ProjectSerializer(serializers.ModelSerializer):
 
     def _handle_foreign_key(self, validated_data, input_field_name, model_field_name, related_model_class):
         """
-        Helper to get or create a related object for a ForeignKey relationship.
-        Pops the input_field_name from validated_data and sets the model_field_name.
+        Helper to find or create a related object for a ForeignKey relationship by name.
+        Pops the input_field_name from validated_data and sets the model_field_name's id.
         Handles cases where the input is None or an empty string.
         """
         name_input = validated_data.pop(input_field_name, None)
 
         # Only process if the input field was actually provided in the request
         if name_input is not None:
-            if name_input.strip():
-                obj, created = related_model_class.objects.get_or_create(
-                    name__iexact=name_input.strip(),
-                    defaults={'name': name_input.strip()}
-                )
-                validated_data[model_field_name] = obj
-            else: # Handle empty string input by setting the ForeignKey to None
-                 validated_data[model_field_name] = None
+            # Blank input sets the ForeignKey to None
+            validated_data[f'{model_field_name}_id'] = resolve_name(related_model_class, name_input)
         # If name_input is None, it means the field wasn't in the request data (e.g., PATCH),
         # so we don't touch the existing instance's ForeignKey.
 
 
     def _handle_many_to_many(self, instance, validated_data, input_field_name, m2m_field_name, related_model_class):
         """
-        Helper to get or create and set related objects for a ManyToMany relationship.
+        Helper to find or create and set related objects for a ManyToMany relationship.
         Uses `validated_data.pop` to ensure it only runs if the input field was provided.
         Handles clearing the relation if an empty string is provided.
         """
@@ -164,14 +165,12 @@ class ProjectSerializer(serializers.ModelSerializer):
             return
 
         name_list = [name.strip() for name in names_string.split(',') if name.strip()]
-        obj_list = []
-        for name in name_list:
-            obj, _ = related_model_class.objects.get_or_create(
-                name__iexact=name,
-                defaults={'name': name}
-            )
-            obj_list.append(obj)
-        m2m_manager.set(obj_list)
+        # All names in one go (see projects/lookups.py), however many there are
+        ids = resolve_names(related_model_class, name_list)
+        unresolved = [name for name in name_list if name.lower() not in ids]
+        if unresolved:
+            raise serializers.ValidationError({input_field_name: [f"Couldn't resolve: {', '.join(unresolved)}."]})
+        m2m_manager.set(list(dict.fromkeys(ids[name.lower()] for name in name_list)))
 
 
     @transaction.atomic
@@ -225,6 +224,8 @@ class ProjectSerializer(serializers.ModelSerializer):
                  print(f"Warning: Attempted to set unknown attribute '{attr}' on Project instance.")
 
 
+        # The project no longer matches its imported source row; let the next import rewrite it.
+        instance.source_fingerprint = None
         instance.save() # Save the instance with updated standard fields
 
         return instance
@@ -0,0 +1,45 @@
+# projects/testing.py
+
+"""
+Test helpers for the query budgets declared on the views (see projects/querybudget.py).
+
+    from projects.testing import assert_query_budget
+
+    def test_project_list_budget(client):
+        assert_query_budget(client, '/api/projects/?page_size=100')
+"""
+
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.urls import resolve
+
+from .querybudget import record_queries, view_budget
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def max_queries(budget, label='block'):
+    """Fail with the repeated query shapes if the block runs more than `budget` queries."""
+    with record_queries() as recorder:
+        yield recorder
+    if recorder.count > budget:
+        raise QueryBudgetExceeded(f'{label} went over its budget of {budget} queries: {recorder.report()}')
+
+
+def assert_query_budget(client, url, budget=None, method='get', **extra):
+    """
+    Request `url` with a Django/DRF test client and fail if it runs more than
+    `budget` queries (default: the `query_budget` of the view the URL resolves
+    to). Returns the response.
+    """
+    if budget is None:
+        budget = view_budget(resolve(urlsplit(url).path).func)
+        if budget is None:
+            raise AssertionError(f'{url} resolves to a view without a query_budget; pass budget=')
+    with max_queries(budget, label=f'{method.upper()} {url}'):
+        response = getattr(client, method)(url, **extra)
+    return response
@@ -1,3 +1,1377 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import DataError, connection, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from . import async_views, caching, importing, insights, rollups, search
+from .importing import HEADER_MAPPING, BulkProjectWriter, CopyProjectWriter, parse_row
+from .models import (
+    Project, Country, LeadOrgUnit, Theme, Donor, ImportCheckpoint,
+    CountryRollup, LeadOrgUnitRollup, ThemeRollup, PortfolioRollup,
+)
+from .insights import StubBackend
+from .fieldsets import load_fieldset, readable_fields
+from .lookups import resolve_names
+from .readers import ProjectListReader
+from .serializers import ProjectSerializer
+from .testing import QueryBudgetExceeded, assert_query_budget
+from .views import ProjectViewSet, project_list_queryset
+
+
+def create_portfolio(size=12):
+    """A few lookups and `size` projects spread over them, with themes and donors."""
+    countries = [Country.objects.create(name=name) for name in ('Kenya', 'Somalia', 'Regional Arab States')]
+    org_units = [LeadOrgUnit.objects.create(name=name) for name in ('Urban Planning', 'Housing Policy')]
+    themes = [Theme.objects.create(name=name) for name in ('Water', 'Climate', 'Housing')]
+    donors = [Donor.objects.create(name=name) for name in ('Donor A', 'Donor B')]
+    projects = []
+    for index in range(size):
+        project = Project.objects.create(
+            title=f'Project {index}', project_id_excel=f'P{index:04d}', status='Approved',
+            country=countries[index % len(countries)], lead_org_unit=org_units[index % len(org_units)],
+            pag_value=Decimal(1000 * (index + 1)), total_expenditure=Decimal(100 * index), total_contribution=Decimal(500),
+        )
+        project.themes.set(themes[:index % len(themes) + 1])
+        project.donors.set(donors[:index % len(donors) + 1])
+        projects.append(project)
+    return projects
+
+
+# --- Query budgets ---
+
+class QueryBudgetTests(TestCase):
+    """The list, detail and dashboard endpoints stay within the query_budget of their views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio()
+
+    def setUp(self):
+        caching.get_cache().clear() # Cached responses would skip the queries
+
+    def assert_budget(self, url):
+        response = assert_query_budget(self.client, url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_project_list(self):
+        response = self.assert_budget('/api/projects/?page_size=100')
+        self.assertEqual(response.json()['count'], len(self.projects))
+
+    def test_project_list_with_cursor_and_search(self):
+        self.assert_budget('/api/projects/?pagination=cursor&page_size=5')
+        self.assert_budget('/api/projects/?search=project')
+
+    def test_project_detail(self):
+        self.assert_budget(f'/api/projects/{self.projects[0].pk}/')
+
+    def test_lookup_lists(self):
+        for url in ('/api/countries/', '/api/lead-org-units/', '/api/themes/', '/api/donors/'):
+            self.assert_budget(url)
+
+    def test_summary_views(self):
+        for url in (
+            '/api/projects/summary/by_country/', '/api/projects/summary/by_org_unit/',
+            '/api/projects/summary/by_theme/', '/api/projects/summary/world_map_data/',
+        ):
+            self.assert_budget(url)
+
+    def test_dashboard_views(self):
+        for url in (
+            '/api/dashboard/kpis/', '/api/dashboard/value-by-country/',
+            '/api/dashboard/value-by-lead-org/', '/api/dashboard/value-by-theme/', '/api/dashboard/bundle/',
+        ):
+            self.assert_budget(url)
+
+    def test_budget_does_not_grow_with_rows(self):
+        extra = [
+            Project.objects.create(title=f'Extra {index}', status='Approved', country=self.projects[0].country)
+            for index in range(20)
+        ]
+        for project in extra:
+            project.themes.set(self.projects[-1].themes.all())
+        self.assert_budget('/api/projects/?page_size=100')
+        self.assert_budget('/api/dashboard/bundle/')
+
+    def test_helper_fails_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            assert_query_budget(self.client, '/api/projects/?page_size=100', budget=1)
+
+
+# --- Dashboard ---
+
+DASHBOARD_SECTIONS = {
+    'kpis': '/api/dashboard/kpis/',
+    'value_by_country': '/api/dashboard/value-by-country/',
+    'value_by_lead_org': '/api/dashboard/value-by-lead-org/',
+    'value_by_theme': '/api/dashboard/value-by-theme/',
+}
+
+
+class DashboardBundleTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        projects = create_portfolio()
+        projects[0].delete() # Leaves rollup rows that went back to zero
+        Project.objects.create(title='No amounts', status='Approved', country=projects[1].country)
+
+    def setUp(self):
+        caching.get_cache().clear()
+
+    def test_bundle_equals_the_individual_endpoints(self):
+        bundle = self.client.get('/api/dashboard/bundle/').json()
+        self.assertEqual(set(bundle), set(DASHBOARD_SECTIONS))
+        for section, url in DASHBOARD_SECTIONS.items():
+            with self.subTest(section=section):
+                self.assertEqual(bundle[section], self.client.get(url).json())
+
+    def test_sections(self):
+        for sections in (['value_by_theme'], ['kpis', 'value_by_country']):
+            with self.subTest(sections=sections):
+                bundle = self.client.get(f'/api/dashboard/bundle/?sections={",".join(sections)}').json()
+                self.assertEqual(bundle, {section: self.client.get(DASHBOARD_SECTIONS[section]).json() for section in sections})
+        self.assertEqual(self.client.get('/api/dashboard/bundle/?sections=kpis,charts').status_code, 400)
+
+
+# --- Response cache ---
+
+@override_settings(RESPONSE_CACHE={'STALE_WHILE_REVALIDATE': 0})
+class ResponseCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio()
+
+    def setUp(self):
+        caching.get_cache().clear()
+
+    def get(self, url):
+        response = self.client.get(url)
+        return response['X-Cache'], response.json()
+
+    def assertInvalidatedBy(self, write, url='/api/dashboard/bundle/'):
+        self.get(url)
+        self.assertEqual(self.get(url)[0], 'HIT')
+        # The generation is bumped on commit, which TestCase only simulates
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        outcome, data = self.get(url)
+        self.assertEqual(outcome, 'MISS')
+        caching.get_cache().clear()
+        self.assertEqual(data, self.get(url)[1])
+
+    def test_reads_are_cached_per_query_string(self):
+        outcome, data = self.get('/api/dashboard/bundle/')
+        self.assertEqual(outcome, 'MISS')
+        self.client.get('/api/projects/')
+        self.assertEqual(self.get('/api/dashboard/bundle/'), ('HIT', data))
+        self.assertEqual(self.get('/api/dashboard/bundle/?sections=kpis')[0], 'MISS')
+
+    def test_project_writes_invalidate(self):
+        project, other = self.projects[:2]
+        self.assertInvalidatedBy(lambda: self.client.patch(
+            f'/api/projects/{project.pk}/', {'pag_value': '12345.00'}, content_type='application/json',
+        ))
+        self.assertInvalidatedBy(lambda: Project.objects.create(
+            title='New', status='Approved', country=project.country, pag_value=Decimal('1.00'),
+        ))
+        self.assertInvalidatedBy(lambda: self.client.delete(f'/api/projects/{other.pk}/'))
+
+    def test_lookup_and_m2m_writes_invalidate(self):
+        project = self.projects[0]
+        country, theme = project.country, Theme.objects.get(name='Housing')
+
+        def rename(instance, name):
+            instance.name = name
+            instance.save()
+
+        self.assertInvalidatedBy(lambda: rename(country, 'Kenya (renamed)'))
+        self.assertInvalidatedBy(lambda: project.themes.remove(theme))
+        self.assertInvalidatedBy(lambda: project.themes.add(theme))
+        self.assertInvalidatedBy(lambda: project.donors.clear())
+        self.assertInvalidatedBy(lambda: rename(theme, 'Housing (renamed)'))
+        self.assertInvalidatedBy(lambda: Donor.objects.create(name='New donor'))
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio()
+
+    def assertRevalidated(self, url, **filters):
+        response = self.client.get(url, filters)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        not_modified = self.client.get(url, filters, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b''))
+        self.assertEqual(not_modified['ETag'], etag)
+        return etag
+
+    def write(self, function):
+        # The generation is bumped on commit, which TestCase only simulates
+        with self.captureOnCommitCallbacks(execute=True):
+            function()
+
+    def test_not_modified(self):
+        project = self.projects[0]
+        for url in ('/api/projects/', f'/api/projects/{project.pk}/', '/api/countries/', f'/api/themes/{project.themes.first().pk}/'):
+            with self.subTest(url=url):
+                self.assertRevalidated(url)
+        other = self.assertRevalidated('/api/projects/', search='Project 1')
+        self.assertNotEqual(other, self.assertRevalidated('/api/projects/'))
+
+    def test_etags_change_after_writes(self):
+        project = self.projects[0]
+        urls = ['/api/projects/', f'/api/projects/{project.pk}/', '/api/countries/']
+        etags = [self.assertRevalidated(url) for url in urls]
+
+        def rename_country():
+            project.country.name = 'Kenya (renamed)'
+            project.country.save()
+
+        writes = [
+            lambda: self.client.patch(f'/api/projects/{project.pk}/', {'title': 'Renamed'}, content_type='application/json'),
+            rename_country, # Only changes the nested names of the projects
+            lambda: project.donors.clear(),
+        ]
+        for write in writes:
+            self.write(write)
+            for url, etag in zip(urls, etags):
+                with self.subTest(url=url):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotEqual(response['ETag'], etag)
+            etags = [self.assertRevalidated(url) for url in urls]
+
+    def test_last_modified_only_on_retrieve(self):
+        project = self.projects[0]
+        response = self.client.get(f'/api/projects/{project.pk}/')
+        self.assertEqual(response['Last-Modified'], http_date(int(project.updated_at.timestamp())))
+        self.assertEqual(self.client.get(f'/api/projects/{project.pk}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertNotIn('Last-Modified', self.client.get('/api/projects/'))
+        self.assertNotIn('Last-Modified', self.client.get(f'/api/countries/{project.country_id}/'))
+
+    def test_missing_and_invalid_ids(self):
+        for url in ('/api/projects/abc/', '/api/projects/999999/', '/api/countries/abc/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn('ETag', response)
+
+
+# --- Sparse fieldsets ---
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio()
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return data['results'] if 'results' in data else data
+
+    def test_selected_fields_match_the_full_output(self):
+        detail = f'/api/projects/{self.projects[0].pk}/'
+        full_list, full_detail = self.get('/api/projects/'), self.get(detail)
+        cases = [
+            ({'fields': 'title,id'}, ['id', 'title']), # Serializer order
+            ({'fields': 'themes_detail, country_detail,total_contribution_expenditure_diff'},
+             ['country_detail', 'themes_detail', 'total_contribution_expenditure_diff']),
+            ({'fields': 'id,title,status', 'exclude': 'status'}, ['id', 'title']),
+        ]
+        for params, names in cases:
+            with self.subTest(params=params):
+                self.assertEqual(self.get('/api/projects/', **params), [{name: row[name] for name in names} for row in full_list])
+                self.assertEqual(self.get(detail, **params), {name: full_detail[name] for name in names})
+        excluded = self.get('/api/projects/', exclude='themes_detail,donors_detail')
+        self.assertEqual(excluded, [
+            {name: value for name, value in row.items() if name not in ('themes_detail', 'donors_detail')} for row in full_list
+        ])
+
+    def test_fewer_queries(self):
+        with CaptureQueriesContext(connection) as full:
+            self.get('/api/projects/')
+        with CaptureQueriesContext(connection) as sparse:
+            self.get('/api/projects/', fields='id,title')
+        self.assertLess(len(sparse), len(full))
+        self.assertNotIn('JOIN', sparse.captured_queries[-1]['sql'])
+
+    def test_unknown_fields_are_rejected(self):
+        for params in ({'fields': 'id,nope'}, {'exclude': 'country_name_input'}, {'fields': 'id', 'exclude': 'title,bogus'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/projects/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Unknown field(s)', response.json()['detail'])
+                self.assertEqual(self.client.get(f'/api/projects/{self.projects[0].pk}/', params).status_code, 400)
+
+    def test_writes_ignore_the_parameters(self):
+        response = self.client.post('/api/projects/?fields=nope', {'title': 'New', 'status': 'Approved'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn('country_detail', response.json())
+
+
+# --- Fast list reader ---
+
+class ProjectListReaderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_portfolio()
+        Project.objects.create(title='Nothing set', status='Pipeline') # No lookups, amounts or dates
+        Project.objects.create(
+            title='Only expenditure', status='Approved', total_expenditure=Decimal('0.10'),
+            pag_value=Decimal('9999999999999.99'),
+        )
+
+    def assertSameJSON(self, queryset, fieldset=None):
+        renderer = JSONRenderer()
+        if fieldset is not None:
+            queryset = load_fieldset(queryset, ProjectSerializer, fieldset)
+        reader = ProjectListReader(fieldset)
+        self.assertEqual(
+            renderer.render(reader.represent(reader.values_queryset(queryset))),
+            renderer.render(ProjectSerializer(queryset, many=True, context={'fieldset': fieldset}).data),
+        )
+
+    def test_same_json_as_the_serializer(self):
+        queryset = project_list_queryset().order_by('-created_at', '-id')
+        fieldsets = [
+            None, ['id', 'title'], ['country_detail', 'donors_detail', 'total_contribution_expenditure_diff'],
+            [name for name in readable_fields(ProjectSerializer) if name != 'themes_detail'],
+        ]
+        for fieldset in fieldsets:
+            with self.subTest(fieldset=fieldset):
+                self.assertSameJSON(queryset, fieldset)
+        self.assertSameJSON(project_list_queryset().filter(title__startswith='Project 1').order_by('title'))
+
+    def test_list_endpoint(self):
+        # Titles are unique, so the ordering is total
+        for params, queryset, fieldset in [
+            ({'ordering': 'title'}, Project.objects.order_by('title'), None),
+            ({'ordering': '-title', 'fields': 'id,title,themes_detail'}, Project.objects.order_by('-title'), ['id', 'title', 'themes_detail']),
+            ({'ordering': 'title', 'search': 'Kenya'}, Project.objects.filter(country__name='Kenya').order_by('title'), None),
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/projects/', {**params, 'page_size': 100})
+                expected = ProjectSerializer(queryset, many=True, context={'fieldset': fieldset}).data
+                self.assertEqual(response.json()['results'], json.loads(JSONRenderer().render(expected)))
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_project_lists', '--page-size', '5', '--pages', '3', '--rounds', '1', stdout=out)
+        self.assertIn('Identical JSON', out.getvalue())
+        call_command('benchmark_project_lists', '--page-size', '5', '--pages', '3', '--rounds', '1', '--fields', 'id,donors_detail', stdout=out)
+        self.assertEqual(out.getvalue().count('Identical JSON'), 2)
+
+
+# --- Export ---
+
+class ProjectExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        projects = create_portfolio(size=25)
+        projects[0].title = 'Roads, "phase 2"\nand bridges'
+        projects[0].save()
+        projects[0].donors.add(Donor.objects.create(name='Fund, Inc.'))
+
+    def export(self, export_format, params):
+        # A small chunk size, so the export spans several chunks
+        with mock.patch.object(ProjectViewSet, 'export_chunk_size', 4):
+            response = self.client.get('/api/projects/export/', {**params, 'format': export_format})
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content).decode('utf-8'), response
+
+    def listed(self, params):
+        return self.client.get('/api/projects/', {**params, 'page_size': 100}).json()['results']
+
+    # Titles are unique, so each ordering is total and the list and the export agree on it
+    PARAMS = [
+        {'ordering': 'title'},
+        {'ordering': '-title', 'search': 'Kenya'},
+        {'ordering': 'country__name,-title', 'fields': 'id,title,country_detail,donors_detail'},
+        {'ordering': 'title', 'search': 'Fund', 'exclude': 'themes_detail'},
+    ]
+
+    def test_ndjson_matches_the_list(self):
+        for params in self.PARAMS:
+            with self.subTest(params=params):
+                body, response = self.export('ndjson', params)
+                self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+                self.assertTrue(body.endswith('\n'))
+                self.assertEqual([json.loads(line) for line in body.splitlines()], self.listed(params))
+
+    def test_csv_matches_the_list(self):
+        for params in self.PARAMS:
+            with self.subTest(params=params):
+                body, response = self.export('csv', params)
+                self.assertIn('attachment; filename="projects-', response['Content-Disposition'])
+                listed = self.listed(params)
+                names = list(listed[0])
+                rows = list(csv.reader(io.StringIO(body)))
+                self.assertEqual(rows[0], names)
+                self.assertEqual(rows[1:], [
+                    [
+                        '' if value is None else value['name'] if isinstance(value, dict)
+                        else '; '.join(item['name'] for item in value) if isinstance(value, list) else str(value)
+                        for value in row.values()
+                    ]
+                    for row in listed
+                ])
+
+    def test_empty_export(self):
+        self.assertEqual(self.export('ndjson', {'search': 'nothing matches'})[0], '')
+        self.assertEqual(self.export('csv', {'search': 'nothing matches', 'fields': 'id,title'})[0], 'id,title\r\n')
+
+    def test_invalid_fields(self):
+        response = self.client.get('/api/projects/export/', {'format': 'csv', 'fields': 'id,nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown field(s)', json.loads(response.content)['detail']) # JSON, whatever the format
+
+
+# --- Async views ---
+
+ASYNC_VIEWS = {
+    '/api/projects/summary/by_country/': async_views.AsyncProjectCountByCountryView,
+    '/api/projects/summary/by_org_unit/': async_views.AsyncProjectCountByLeadOrgUnitView,
+    '/api/projects/summary/by_theme/': async_views.AsyncProjectCountByThemeView,
+    '/api/projects/summary/world_map_data/': async_views.AsyncWorldMapProjectDataView,
+    '/api/dashboard/kpis/': async_views.AsyncDashboardKPIsView,
+    '/api/dashboard/value-by-country/': async_views.AsyncValueByCountryView,
+    '/api/dashboard/value-by-lead-org/': async_views.AsyncValueByLeadOrgView,
+    '/api/dashboard/value-by-theme/': async_views.AsyncValueByThemeView,
+    '/api/dashboard/bundle/': async_views.AsyncDashboardBundleView,
+}
+
+
+# A TransactionTestCase: with persistent connections the queries run on other connections,
+# which wouldn't see a TestCase's uncommitted rows.
+class AsyncViewTests(TransactionTestCase):
+
+    def setUp(self):
+        create_portfolio()
+        caching.get_cache().clear()
+
+    async def get(self, url, query=''):
+        # urls.py picks the sync or async views at import time, so the async ones are called directly
+        response = await ASYNC_VIEWS[url].as_view()(AsyncRequestFactory().get(f'{url}?{query}'))
+        return response.status_code, response.content
+
+    async def assertSameAsSync(self, query=''):
+        for url in ASYNC_VIEWS:
+            with self.subTest(url=url, query=query):
+                caching.get_cache().clear()
+                sync = await self.async_client.get(f'{url}?{query}')
+                caching.get_cache().clear()
+                self.assertEqual(await self.get(url, query), (sync.status_code, sync.content))
+
+    async def test_same_json_as_the_sync_views(self):
+        await self.assertSameAsSync()
+        await self.assertSameAsSync('sections=value_by_theme,kpis')
+
+    async def test_same_json_with_concurrent_queries(self):
+        with mock.patch.object(async_views, 'connections_persist', return_value=True):
+            await self.assertSameAsSync()
+
+    async def test_errors(self):
+        sync = await self.async_client.get('/api/dashboard/bundle/?sections=charts')
+        self.assertEqual(await self.get('/api/dashboard/bundle/', 'sections=charts'), (400, sync.content))
+
+    async def test_cache(self):
+        view = async_views.AsyncDashboardKPIsView.as_view()
+        outcomes = [(await view(AsyncRequestFactory().get('/api/dashboard/kpis/')))['X-Cache'] for _ in range(2)]
+        self.assertEqual(outcomes, ['MISS', 'HIT'])
+
+
+# --- Cursor pagination ---
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': int(reverse)})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio()
+
+    def setUp(self):
+        caching.get_cache().clear()
+
+    def ids(self, response):
+        return [project['id'] for project in response.json()['results']]
+
+    def walk(self, url):
+        """Ids of every row, following the next links of cursor pages."""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += self.ids(response)
+            url = response.json()['next']
+        return ids
+
+    def test_cursor_pages_match_page_numbers(self):
+        for query in ('', '&search=project', '&search=project&ordering=title'):
+            with self.subTest(query=query):
+                expected = self.ids(self.client.get(f'/api/projects/?page_size=100{query}'))
+                self.assertEqual(self.walk(f'/api/projects/?pagination=cursor&page_size=5{query}'), expected)
+
+    def test_ties_are_ordered_by_pk(self):
+        for ordering in ('-status', 'country__name'):
+            with self.subTest(ordering=ordering):
+                pk = '-id' if ordering.startswith('-') else 'id'
+                expected = list(Project.objects.order_by(ordering, pk).values_list('id', flat=True))
+                self.assertEqual(self.walk(f'/api/projects/?pagination=cursor&page_size=5&ordering={ordering}'), expected)
+
+    def test_previous_links_walk_back(self):
+        first = self.client.get('/api/projects/?pagination=cursor&page_size=5').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+    def test_tampered_cursors_are_not_found(self):
+        for values in (['notadate', 5], [{'a': 1}, 5], ['2024-01-01T00:00:00', 'x'], [[1], 5], [1, 2, 3], 'x'):
+            with self.subTest(values=values):
+                response = self.client.get(f'/api/projects/?cursor={encode_cursor(values)}')
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/projects/?cursor=not-base64').status_code, 404)
+        response = self.client.get(f'/api/projects/?ordering=title&cursor={encode_cursor([5, 5])}')
+        self.assertEqual(response.status_code, 200) # A number is a valid title
+
+
+# --- Lookup names ---
+
+class LookupResolutionTests(TestCase):
+
+    def test_case_insensitive_match(self):
+        theme = Theme.objects.create(name='Water')
+        self.assertEqual(resolve_names(Theme, ['WATER', 'water']), {'water': theme.pk})
+
+    def test_names_lowered_differently_by_the_database(self):
+        # str.lower() gives 'i̇stanbul' (with a combining dot); PostgreSQL's LOWER() may not
+        first = resolve_names(Theme, ['İstanbul'])
+        second = resolve_names(Theme, ['İstanbul'])
+        self.assertEqual(list(first), ['İstanbul'.lower()])
+        self.assertEqual(first, second)
+        self.assertEqual(Theme.objects.filter(name='İstanbul').count(), 1)
+
+    def test_project_write_with_such_names(self):
+        for _ in range(2):
+            response = self.client.post(
+                '/api/projects/', {'title': 'Bridge', 'status': 'Approved', 'themes_input': 'İstanbul, Water'},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(sorted(theme['name'] for theme in response.json()['themes_detail']), ['Water', 'İstanbul'])
+
+
+# --- AI insights ---
+
+class CountingStubBackend(StubBackend):
+    """The offline stub backend, recording its generations."""
+    name = 'counting-stub'
+    generations = []
+
+    def generate(self, prompt):
+        self.generations.append(prompt)
+        return super().generate(prompt)
+
+
+@override_settings(AI_INSIGHTS={'BACKEND': 'projects.tests.CountingStubBackend', 'STUB_DELAY': 0.2})
+class AIInsightTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_portfolio(5)
+
+    def setUp(self):
+        caching.get_cache().clear()
+        CountingStubBackend.generations.clear()
+
+    def wait_for_insight(self, previous=None):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stored = insights.stored_insight()
+            if stored is not None and stored != previous and caching.get_cache().get(insights._key('lock')) is None:
+                return stored
+            time.sleep(0.02)
+        self.fail('No insight was generated')
+
+    def test_first_request_is_accepted_then_the_stored_insight_is_served(self):
+        response = self.client.get('/api/projects/insights/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertIsNone(response.json()['insight'])
+
+        self.wait_for_insight()
+        for _ in range(3):
+            response = self.client.get('/api/projects/insights/')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertTrue(data['insight'].startswith('The portfolio has 5 projects'))
+            self.assertEqual((data['backend'], data['stale'], data['refreshing']), ('counting-stub', False, False))
+        self.assertEqual(len(CountingStubBackend.generations), 1)
+
+    def test_stale_insight_is_served_while_it_is_regenerated(self):
+        self.client.get('/api/projects/insights/')
+        stored = self.wait_for_insight()
+        Project.objects.create(title='New project', status='Approved', pag_value=Decimal(1))
+
+        data = self.client.get('/api/projects/insights/').json()
+        self.assertEqual((data['insight'], data['stale'], data['refreshing']), (stored['insight'], True, True))
+        self.wait_for_insight(previous=stored)
+        data = self.client.get('/api/projects/insights/').json()
+        self.assertTrue(data['insight'].startswith('The portfolio has 6 projects'))
+        self.assertFalse(data['stale'])
+        self.assertEqual(len(CountingStubBackend.generations), 2)
+
+    def test_concurrent_generations_run_once(self):
+        backend = insights.get_backend()
+        prompt = insights.build_prompt(insights.insight_inputs())
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(insights.generate_insight(prompt, backend)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+        self.assertEqual(len(CountingStubBackend.generations), 1)
+        self.assertEqual(insights.stored_insight()['fingerprint'], insights.fingerprint(prompt, backend))
+
+    def test_lock_is_released_only_by_its_holder(self):
+        expired = insights.acquire_lock()
+        self.assertIsNone(insights.acquire_lock())
+        caching.get_cache().delete(insights._key('lock')) # As if LOCK_TIMEOUT passed
+        current = insights.acquire_lock()
+        insights.release_lock(expired)
+        self.assertIsNone(insights.acquire_lock())
+        insights.release_lock(current)
+        self.assertIsNotNone(insights.acquire_lock())
+
+
+# --- AI insight stream ---
+
+class TrackingStubBackend(StubBackend):
+    """The offline stub backend, recording when a stream of it is closed."""
+    name = 'tracking-stub'
+    closed = []
+
+    def stream(self, prompt):
+        try:
+            yield from super().stream(prompt)
+        finally:
+            self.closed.append(prompt)
+
+
+def parse_events(body):
+    """[(event, data), ...] of a text/event-stream body."""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@override_settings(AI_INSIGHTS={'BACKEND': 'projects.tests.TrackingStubBackend', 'STUB_DELAY': 0})
+class AIInsightStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_portfolio(5)
+
+    def setUp(self):
+        caching.get_cache().clear()
+        TrackingStubBackend.closed.clear()
+
+    async def stream(self, url='/api/projects/insights/stream/'):
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = ''.join([part.decode() async for part in response.streaming_content])
+        return parse_events(body)
+
+    async def test_chunks_then_done(self):
+        events = await self.stream()
+        names = [name for name, data in events]
+        self.assertGreater(len(names), 2)
+        self.assertEqual(names, ['chunk'] * (len(names) - 1) + ['done'])
+        text = ''.join(data['text'] for name, data in events[:-1])
+        self.assertTrue(text.startswith('The portfolio has 5 projects'))
+        self.assertEqual(events[-1][1]['insight'], text)
+
+        # Stored: the next stream sends it whole, as does the insights endpoint
+        self.assertEqual(await self.stream(), [('chunk', {'text': text}), ('done', events[-1][1])])
+        response = await self.async_client.get('/api/projects/insights/')
+        self.assertEqual(response.json()['insight'], text)
+
+    @override_settings(AI_INSIGHTS={'BACKEND': 'projects.tests.TrackingStubBackend', 'STUB_DELAY': 5})
+    async def test_timeout(self):
+        events = await self.stream('/api/projects/insights/stream/?timeout=0.3')
+        self.assertEqual(events[-1][0], 'error')
+        self.assertIn('0.3 seconds', events[-1][1]['error'])
+        self.assertTrue(all(name == 'chunk' for name, data in events[:-1]))
+        self.assertIsNone(insights.stored_insight())
+        self.assertIsNone(caching.get_cache().get(insights._key('lock')))
+
+    async def test_invalid_timeout(self):
+        for timeout in ('abc', '0', '-1'):
+            response = await self.async_client.get(f'/api/projects/insights/stream/?timeout={timeout}')
+            self.assertEqual(response.status_code, 400, timeout)
+
+    async def test_cancellation_closes_the_upstream_stream(self):
+        backend = insights.get_backend()
+        events = insights.stream_insight('Overall Project Count: 5\nTotal PAG Value: 10', backend)
+        self.assertTrue((await anext(events)).startswith('event: chunk'))
+        await events.aclose() # What cancelling the response does when the client disconnects
+        deadline = time.monotonic() + 5
+        while not TrackingStubBackend.closed and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        self.assertEqual(len(TrackingStubBackend.closed), 1)
+        self.assertIsNone(caching.get_cache().get(insights._key('lock')))
+        self.assertIsNone(insights.stored_insight())
+
+    def test_stub_backend_without_the_expected_figures(self):
+        text = StubBackend({'STUB_DELAY': 0}).generate('Summarize the portfolio.')
+        self.assertEqual(text, 'The portfolio totals could not be read from the prompt.')
+
+
+# --- COPY import ---
+
+def import_record(**cells):
+    """A parsed import record from source cells given by model field name."""
+    record, errors = parse_row({HEADER_MAPPING[field]: value for field, value in cells.items()})
+    assert record is not None and not errors, errors
+    return record
+
+
+class CopyProjectWriterTests(TestCase):
+
+    def staged_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT project_id_excel FROM {CopyProjectWriter.STAGING_TABLE} ORDER BY row_no')
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_insert_then_merge(self):
+        writer = CopyProjectWriter()
+        counts = writer.write([
+            import_record(title='Water works', project_id_excel='P1', country='Kenya', themes='Water, Climate', pag_value='1,000'),
+            import_record(title='Housing', project_id_excel='P2', country='Somalia', donors='Donor A'),
+            import_record(title='No excel id', country='Kenya'),
+        ])
+        self.assertEqual(counts, {'inserted': 3, 'updated': 0, 'unchanged': 0})
+        self.assertEqual(writer.created_lookups, {'country': 2, 'lead_org_unit': 0, 'themes': 2, 'donors': 1})
+        project = Project.objects.get(project_id_excel='P1')
+        self.assertEqual((project.country.name, project.pag_value), ('Kenya', Decimal('1000.00')))
+        self.assertEqual(sorted(project.themes.values_list('name', flat=True)), ['Climate', 'Water'])
+        self.assertEqual(Project.objects.filter(search_document__isnull=True).count(), 0)
+
+        counts = writer.write([
+            import_record(title='Water works II', project_id_excel='P1', country='Kenya', themes='Water'),
+            import_record(title='Housing', project_id_excel='P2', country='Somalia', donors='Donor A'),
+            import_record(title='First P3', project_id_excel='P3'),
+            import_record(title='Last P3', project_id_excel='P3', country='Regional Arab States'),
+        ])
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1})
+        project = Project.objects.get(project_id_excel='P1')
+        self.assertEqual(project.title, 'Water works II')
+        self.assertEqual(list(project.themes.values_list('name', flat=True)), ['Water'])
+        # Rows sharing a project_id_excel collapse to the last one
+        project = Project.objects.get(project_id_excel='P3')
+        self.assertEqual((project.title, project.country.classification), ('Last P3', Country.COMBINED))
+        self.assertEqual(Project.objects.count(), 4)
+
+    def test_staging_table_is_temporary_and_holds_one_batch(self):
+        writer = CopyProjectWriter()
+        writer.write([import_record(title=f'Project {index}', project_id_excel=f'P{index}') for index in range(3)])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT relpersistence FROM pg_class WHERE relname = %s', [CopyProjectWriter.STAGING_TABLE])
+            self.assertEqual(cursor.fetchone(), ('t',)) # Session-private, dropped with the connection
+
+        # The next batch starts from an empty table; its unchanged row is dropped before the merge
+        writer.write([import_record(title='Project 0', project_id_excel='P0'), import_record(title='Project 9', project_id_excel='P9')])
+        self.assertEqual(self.staged_rows(), ['P9'])
+
+
+# --- Import command ---
+
+def write_source(path, rows):
+    """A CSV source file with every mapped header; `rows` are dicts of cells by model field name."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER_MAPPING.values())
+        for row in rows:
+            writer.writerow([row.get(field, '') for field in HEADER_MAPPING])
+
+
+def read_rejects(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+class ImportCommandTestCase(TransactionTestCase):
+    """
+    Runs import_projects on temporary files. A TransactionTestCase, since --workers
+    closes the database connections before forking.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        caching.get_cache().clear()
+
+    def source(self, rows, name='projects.csv'):
+        path = os.path.join(self.directory, name)
+        write_source(path, rows)
+        return path
+
+    def run_import(self, path, *args):
+        call_command('import_projects', path, *args, stdout=io.StringIO())
+        return read_rejects(f'{path}.rejects.csv')
+
+    def import_fresh(self, path, *options):
+        """(imported_state(), [(row, error), ...]) of an import into an empty project table."""
+        Project.objects.all().delete()
+        ImportCheckpoint.objects.all().delete()
+        rejects = self.run_import(path, '--chunk-size', '4', *options)
+        return imported_state(), [(reject['Row'], reject['Error']) for reject in rejects]
+
+
+def refusing(writer_class, title):
+    """Patches a writer so the database "rejects" any batch holding a record with this title."""
+    original = writer_class.write
+
+    def write(self, records):
+        if any(record['title'] == title for record in records):
+            raise DataError(f'{title} refused')
+        return original(self, records)
+    return mock.patch.object(writer_class, 'write', write)
+
+
+def sample_rows(count=30):
+    """Source rows covering the lookups, dates, amounts, defaults and the usual row errors."""
+    rows = []
+    for index in range(1, count + 1):
+        rows.append({
+            'title': f'Project {index}', 'project_id_excel': f'P{index:03d}', 'paas_code': f'PAAS-{index}',
+            'status': ['Approved', 'Completed', ''][index % 3], 'fund': 'Fund A' if index % 2 else '',
+            'country': ['Kenya', 'Somalia', 'Regional Arab States', 'Kenya, Uganda'][index % 4],
+            'lead_org_unit': ['Urban Planning', 'Housing Policy'][index % 2],
+            'themes': 'Water, Climate' if index % 3 else 'Housing', 'donors': 'Donor A, Donor B' if index % 5 else '',
+            'start_date': f'2020-01-{index % 28 + 1:02d}', 'end_date': '2024-12-31',
+            'pag_value': f'${index * 1000:,}.50', 'total_expenditure': str(index * 10), 'total_contribution': '1e3',
+        })
+    rows[4]['title'] = '' # Skipped
+    rows[7]['start_date'] = '31/01/2020' # Imported without the date
+    rows[9]['pag_value'] = 'abc'
+    rows[12]['project_id_excel'] = 'P001' # The later row wins
+    rows[15]['project_id_excel'] = '' # Inserted without a key
+    rows[20]['pag_value'] = '1234567890.125' # Rounded half up
+    return rows
+
+
+def imported_state():
+    """Everything an import writes that doesn't depend on the order of the inserts."""
+    projects = [
+        (
+            project.project_id_excel, project.title, project.paas_code, project.status, project.fund,
+            project.country and project.country.name, project.lead_org_unit and project.lead_org_unit.name,
+            sorted(theme.name for theme in project.themes.all()), sorted(donor.name for donor in project.donors.all()),
+            project.start_date, project.end_date,
+            project.pag_value, project.total_expenditure, project.total_contribution, project.total_psc,
+            project.search_document is not None,
+        )
+        for project in Project.objects.select_related('country', 'lead_org_unit').prefetch_related('themes', 'donors')
+    ]
+    return sorted(projects, key=repr), rollup_snapshot()
+
+
+class ImportModeTests(ImportCommandTestCase):
+
+    def test_every_mode_imports_the_same(self):
+        path = self.source(sample_rows())
+        expected = self.import_fresh(path)
+        (projects, _), rejects = expected
+        self.assertEqual(len(projects), 28)
+        self.assertEqual([row for row, error in rejects], ['5', '8', '10'])
+
+        # Small shards, so each worker gets several
+        small_shards = mock.patch(
+            'projects.management.commands.import_projects.shard_offsets',
+            lambda path, data_start: importing.shard_offsets(path, data_start, shard_bytes=512),
+        )
+        with small_shards:
+            self.assertEqual(self.import_fresh(path, '--workers', '3'), expected)
+        self.assertEqual(self.import_fresh(path, '--columnar'), expected)
+        self.assertEqual(self.import_fresh(path, '--copy'), expected)
+
+    def test_resumed_import_finishes_like_a_single_run(self):
+        path = self.source(sample_rows())
+        expected = self.import_fresh(path)
+        for options in ([], ['--workers', '2'], ['--columnar'], ['--copy']):
+            with self.subTest(options=options):
+                self.import_fresh(path, '--sample-rows', '10', *options)
+                self.assertEqual(ImportCheckpoint.objects.get().last_row, 10)
+                rejects = self.run_import(path, '--chunk-size', '4', '--resume', *options)
+                self.assertEqual((imported_state(), [(reject['Row'], reject['Error']) for reject in rejects]), expected)
+                self.assertTrue(ImportCheckpoint.objects.get().completed)
+
+
+def typed_cell(field, value):
+    """A CSV cell as Excel or Parquet would hold it: dates and amounts typed where they parse, None for blanks."""
+    if value == '':
+        return None
+    if field in dict(importing.DATE_FIELDS):
+        try:
+            return importing.parse_date_cell(value)
+        except ValueError:
+            return value
+    if field in dict(importing.DECIMAL_FIELDS):
+        try:
+            return float(importing.parse_decimal(value))
+        except ValueError:
+            return value
+    return value
+
+
+class ImportFormatTests(ImportCommandTestCase):
+    """Excel and Parquet/Arrow sources import like the CSV with the same cells."""
+
+    def setUp(self):
+        super().setUp()
+        rows = sample_rows()
+        self.expected = self.import_fresh(self.source(rows))
+        self.headers = list(HEADER_MAPPING.values())
+        self.rows = [[typed_cell(field, row.get(field, '')) for field in HEADER_MAPPING] for row in rows]
+
+    def test_excel(self):
+        import openpyxl
+
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(self.headers)
+        for values in self.rows:
+            sheet.append(values)
+        path = os.path.join(self.directory, 'projects.xlsx')
+        workbook.save(path)
+        self.assertEqual(self.import_fresh(path), self.expected)
+
+    def test_parquet_and_arrow(self):
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+
+        columns = list(zip(*self.rows))
+        # Typed columns where every cell parsed, strings where some didn't
+        table = pyarrow.table({
+            header: pyarrow.array(
+                column if len({type(value) for value in column if value is not None}) <= 1
+                else [None if value is None else str(value) for value in column]
+            )
+            for header, column in zip(self.headers, columns)
+        })
+        self.assertEqual(table.schema.field('Start Date').type, pyarrow.string()) # Holds '31/01/2020'
+        self.assertEqual(table.schema.field('End Date').type, pyarrow.date32())
+        self.assertEqual(table.schema.field('Total Expenditure').type, pyarrow.float64())
+
+        parquet_path = os.path.join(self.directory, 'projects.parquet')
+        pyarrow.parquet.write_table(table, parquet_path, row_group_size=7)
+        self.assertEqual(self.import_fresh(parquet_path), self.expected)
+        arrow_path = os.path.join(self.directory, 'projects.arrow')
+        pyarrow.feather.write_feather(table, arrow_path, chunksize=7)
+        self.assertEqual(self.import_fresh(arrow_path), self.expected)
+
+    def test_csv_only_options(self):
+        path = os.path.join(self.directory, 'projects.parquet')
+        with self.assertRaisesMessage(CommandError, 'only apply to CSV files'):
+            call_command('import_projects', path, '--columnar', stdout=io.StringIO())
+
+
+class ImportRejectTests(ImportCommandTestCase):
+
+    def test_values_that_do_not_fit_their_column_are_rejected(self):
+        rows = [{'title': f'Project {index}', 'project_id_excel': f'P{index}', 'country': 'Kenya'} for index in range(1, 9)]
+        rows[2]['country'] = 'K' * 120 # Country.name is varchar(100) in the database
+        rows[3]['themes'] = 'Water, ' + 'T' * 200 # Theme.name is varchar(150)
+        rows[4]['title'] = 'T' * 300 # varchar(255)
+        rows[5]['pag_value'] = '12345678901234' # numeric(15, 2)
+        path = self.source(rows)
+        for options in ([], ['--columnar'], ['--workers', '2'], ['--copy']):
+            with self.subTest(options=options):
+                Project.objects.all().delete()
+                rejects = self.run_import(path, '--chunk-size', '10', *options)
+                self.assertEqual([reject['Row'] for reject in rejects], ['3', '4', '5', '6'])
+                self.assertIn('country is longer than 100 characters', rejects[0]['Error'])
+                self.assertIn('a name in themes is longer than 150 characters', rejects[1]['Error'])
+                self.assertIn('title is longer than 255 characters', rejects[2]['Error'])
+                self.assertIn('PAG value has more than 13 digits', rejects[3]['Error'])
+                self.assertEqual(
+                    sorted(Project.objects.values_list('project_id_excel', flat=True)), ['P1', 'P2', 'P7', 'P8'],
+                )
+
+    def test_rows_with_extra_cells_are_rejected_in_every_mode(self):
+        path = self.source([{'title': 'First', 'project_id_excel': 'P1'}])
+        header_count = len(HEADER_MAPPING)
+        with open(path, 'a', encoding='utf-8', newline='') as f:
+            f.write(','.join(['Shifted', 'P2'] + [''] * header_count) + '\n') # An unquoted comma too many, and more
+            f.write('Short,P3,,Completed\n') # The missing cells read as empty
+            f.write('\n')
+            f.write('Last,P4\n')
+        for options in ([], ['--columnar'], ['--workers', '2']):
+            with self.subTest(options=options):
+                Project.objects.all().delete()
+                rejects = self.run_import(path, '--chunk-size', '2', *options)
+                self.assertEqual(
+                    [(reject['Row'], reject['Error'], reject['Project Title']) for reject in rejects],
+                    [('2', f'Row 2: Expected {header_count} cells, found {header_count + 2}.', 'Shifted')],
+                )
+                self.assertEqual(
+                    sorted(Project.objects.values_list('project_id_excel', 'status')),
+                    [('P1', 'Approved'), ('P3', 'Completed'), ('P4', 'Approved')],
+                )
+                self.assertEqual(ImportCheckpoint.objects.get().last_row, 4)
+
+    def test_rows_the_database_rejects_fail_alone(self):
+        rows = [{'title': f'Project {index}', 'project_id_excel': f'P{index}'} for index in range(1, 11)]
+        rows[3].update(title='Refused', country='Atlantis')
+        rows[8].update(title='Refused', themes='Refused theme')
+        path = self.source(rows)
+        for writer_class, options in ((BulkProjectWriter, []), (CopyProjectWriter, ['--copy'])):
+            with self.subTest(writer=writer_class.__name__), refusing(writer_class, 'Refused'):
+                Project.objects.all().delete()
+                rejects = self.run_import(path, '--chunk-size', '10', *options)
+                self.assertEqual([reject['Row'] for reject in rejects], ['4', '9'])
+                self.assertEqual(rejects[0]['Error'], 'Row 4: Rejected by the database - Refused refused')
+                self.assertEqual(rejects[0]['Project Title'], 'Refused')
+                self.assertEqual(Project.objects.count(), 8)
+                # The lookups of the refused rows were rolled back with them
+                self.assertFalse(Country.objects.filter(name='Atlantis').exists())
+                self.assertFalse(Theme.objects.filter(name='Refused theme').exists())
+                checkpoint = ImportCheckpoint.objects.get()
+                self.assertEqual((checkpoint.last_row, checkpoint.imported_count, checkpoint.skipped_count), (10, 8, 2))
+
+
+class ImportProfileTests(ImportCommandTestCase):
+
+    def test_report(self):
+        path = self.source(sample_rows())
+        report_path = os.path.join(self.directory, 'profile.json')
+        output = io.StringIO()
+        call_command('import_projects', path, '--chunk-size', '4', f'--profile={report_path}', stdout=output)
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['rows'], 30)
+        self.assertEqual(report['options']['chunk_size'], 4)
+        self.assertTrue({'read', 'parse', 'compare', 'lookups', 'projects', 'm2m', 'checkpoint', 'rollups'} <= set(report['phases']))
+        self.assertEqual(report['queries'], sum(phase['queries'] for phase in report['phases'].values()))
+        self.assertGreater(report['phases']['projects']['queries'], 0)
+        self.assertAlmostEqual(sum(phase['share'] for phase in report['phases'].values()), 1, delta=0.01)
+        self.assertGreater(report['peak_memory_bytes'], 0)
+        self.assertNotIn('estimated_total_seconds', report)
+        self.assertIn('--- Import Profile ---', output.getvalue())
+
+    def test_sample_estimate(self):
+        path = self.source(sample_rows())
+        report_path = os.path.join(self.directory, 'profile.json')
+        call_command('import_projects', path, '--sample-rows', '10', f'--profile={report_path}', stdout=io.StringIO())
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual((report['rows'], report['estimated_total_rows']), (10, 30))
+        self.assertIsNotNone(report['estimated_total_seconds'])
+        self.assertEqual(ImportCheckpoint.objects.get().last_row, 10)
+
+    def test_profiler_stops_when_the_import_fails(self):
+        path = os.path.join(self.directory, 'no-headers.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('Title\nProject\n')
+        wrappers = list(connection.execute_wrappers)
+        with self.assertRaisesMessage(CommandError, 'Missing required headers'):
+            self.run_import(path, '--profile')
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+
+@override_settings(RESPONSE_CACHE={'STALE_WHILE_REVALIDATE': 0})
+class ImportInvalidationTests(ImportCommandTestCase):
+
+    def test_unchanged_reimport_keeps_cached_responses(self):
+        rows = [{'title': f'Project {index}', 'project_id_excel': f'P{index}', 'pag_value': '100'} for index in range(5)]
+        path = self.source(rows)
+        self.run_import(path, '--chunk-size', '2')
+        generation = caching.get_generation()
+        self.client.get('/api/dashboard/kpis/')
+        etag = self.client.get('/api/projects/')['ETag']
+
+        self.run_import(path, '--chunk-size', '2')
+        self.assertEqual(caching.get_generation(), generation)
+        self.assertEqual(self.client.get('/api/dashboard/kpis/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        rows[3]['pag_value'] = '250'
+        self.run_import(self.source(rows), '--chunk-size', '2')
+        self.assertNotEqual(caching.get_generation(), generation)
+        response = self.client.get('/api/dashboard/kpis/')
+        self.assertEqual((response['X-Cache'], response.json()['total_pag_value']), ('MISS', 650.0))
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# --- Dashboard rollups ---
+
+def rollup_snapshot():
+    """Every non-empty rollup row, as {model name: [(pk, values...), ...]}."""
+    snapshot = {}
+    for model in (CountryRollup, LeadOrgUnitRollup, ThemeRollup, PortfolioRollup):
+        rows = model.objects.order_by('pk').values_list('pk', *rollups.ROLLUP_FIELDS)
+        snapshot[model.__name__] = [row for row in rows if any(row[1:])]
+    return snapshot
+
+
+class RollupTestMixin:
+
+    def assertRollupsRebuilt(self):
+        """The incrementally maintained rollups equal a rebuild from the Project table."""
+        incremental = rollup_snapshot()
+        rollups.rebuild_rollups()
+        self.assertEqual(incremental, rollup_snapshot())
+
+
+class RollupTests(RollupTestMixin, TestCase):
+    """Every kind of write leaves the rollups equal to a rebuild."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio(6)
+
+    def test_api_writes(self):
+        project = self.projects[0]
+        steps = [
+            ('post', '/api/projects/', {
+                'title': 'New', 'status': 'Approved', 'pag_value': '123.45', 'total_expenditure': '10.00',
+                'country_name_input': 'Kenya', 'lead_org_unit_name_input': 'New unit', 'themes_input': 'Water, Energy',
+            }),
+            ('patch', f'/api/projects/{project.pk}/', {'pag_value': '999.99', 'total_contribution': None}),
+            ('patch', f'/api/projects/{project.pk}/', {'country_name_input': 'Uganda', 'lead_org_unit_name_input': ''}),
+            ('patch', f'/api/projects/{project.pk}/', {'themes_input': 'Climate, Energy'}),
+            ('patch', f'/api/projects/{project.pk}/', {'themes_input': '', 'pag_value': None}),
+            ('delete', f'/api/projects/{self.projects[1].pk}/', None),
+        ]
+        for method, url, data in steps:
+            with self.subTest(method=method, url=url, data=data):
+                response = getattr(self.client, method)(url, data, content_type='application/json')
+                self.assertLess(response.status_code, 300, response.content)
+                self.assertRollupsRebuilt()
+
+    def test_orm_writes(self):
+        water, climate = Theme.objects.get(name='Water'), Theme.objects.get(name='Climate')
+        project = self.projects[3]
+        for write in (
+            lambda: project.themes.add(climate),
+            lambda: project.themes.remove(water),
+            lambda: water.projects.add(*self.projects[:4]), # From the theme side
+            lambda: water.projects.remove(self.projects[0]),
+            lambda: project.themes.clear(),
+            lambda: Project.objects.filter(pk=self.projects[4].pk).first().delete(),
+            lambda: Project.objects.create(title='Bare', status='Approved'),
+            lambda: Country.objects.get(name='Somalia').delete(), # Its projects' country is set to NULL
+            lambda: climate.delete(),
+        ):
+            write()
+            self.assertRollupsRebuilt()
+
+
+class RollupConcurrencyTests(RollupTestMixin, TransactionTestCase):
+
+    def test_concurrent_saves_moving_a_project(self):
+        kenya, somalia, uganda = (Country.objects.create(name=name) for name in ('Kenya', 'Somalia', 'Uganda'))
+        project = Project.objects.create(title='Moving', status='Approved', country=kenya, pag_value=Decimal(100))
+        first_saved = threading.Event()
+
+        def move(country, hold):
+            try:
+                with transaction.atomic():
+                    moved = Project.objects.get(pk=project.pk)
+                    moved.country = country
+                    moved.save()
+                    if hold: # Keep the first transaction open while the second save starts
+                        first_saved.set()
+                        time.sleep(0.3)
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=move, args=(somalia, True))
+        first.start()
+        first_saved.wait(5)
+        second = threading.Thread(target=move, args=(uganda, False))
+        second.start()
+        first.join()
+        second.join()
+
+        self.assertEqual(Project.objects.get().country, uganda)
+        self.assertEqual(rollup_snapshot()['CountryRollup'], [(uganda.pk, 1, 1, Decimal(100), Decimal(0), Decimal(0))])
+        self.assertRollupsRebuilt()
+
+
+# --- Bulk endpoint ---
+
+class BulkProjectTests(RollupTestMixin, TestCase):
+    url = '/api/projects/bulk/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = create_portfolio(3)
+
+    def send(self, method, data):
+        return getattr(self.client, method)(self.url, data, content_type='application/json')
+
+    def statuses(self, response):
+        return [result['status'] for result in response.json()['results']]
+
+    def test_create(self):
+        response = self.send('post', [
+            {'title': 'Bulk A', 'status': 'Approved', 'country_name_input': 'Kenya', 'themes_input': 'Water, Energy'},
+            {'title': 'Bulk B', 'status': 'Approved', 'project_id_excel': 'B1', 'pag_value': '250.00'},
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        results = response.json()['results']
+        self.assertEqual([(result['index'], result['status']) for result in results], [(0, 'created'), (1, 'created')])
+        created = Project.objects.get(pk=results[0]['id'])
+        self.assertEqual((created.title, created.country.name), ('Bulk A', 'Kenya'))
+        self.assertEqual(sorted(created.themes.values_list('name', flat=True)), ['Energy', 'Water'])
+        self.assertEqual(Project.objects.filter(search_document__isnull=True).count(), 0)
+        self.assertRollupsRebuilt()
+
+    def test_one_invalid_item_writes_nothing(self):
+        response = self.send('post', [
+            {'title': 'Fine', 'status': 'Approved', 'themes_input': 'Brand new theme'},
+            {'status': 'Approved'},
+            {'title': 'Taken id', 'status': 'Approved', 'project_id_excel': 'P0000'},
+            {'title': 'Twice', 'status': 'Approved', 'project_id_excel': 'X1'},
+            {'title': 'Twice', 'status': 'Approved', 'project_id_excel': 'X1'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses(response), ['valid', 'invalid', 'invalid', 'invalid', 'invalid'])
+        results = response.json()['results']
+        self.assertIn('title', results[1]['errors'])
+        self.assertIn('already exists', results[2]['errors']['project_id_excel'][0])
+        self.assertEqual(results[3]['errors'], {'project_id_excel': ['Repeated in this batch.']})
+        self.assertEqual(Project.objects.count(), 3)
+        self.assertFalse(Theme.objects.filter(name='Brand new theme').exists())
+
+    def test_update(self):
+        first, second, third = self.projects
+        response = self.send('patch', [
+            {'id': first.pk, 'pag_value': '42.00', 'country_name_input': 'Uganda'},
+            {'id': second.pk, 'themes_input': 'Climate'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.statuses(response), ['updated', 'updated'])
+        first.refresh_from_db()
+        self.assertEqual((first.pag_value, first.country.name, first.title), (Decimal('42.00'), 'Uganda', 'Project 0'))
+        self.assertEqual(list(second.themes.values_list('name', flat=True)), ['Climate'])
+        self.assertRollupsRebuilt()
+
+    def test_update_of_a_missing_project_writes_nothing(self):
+        response = self.send('patch', [{'id': self.projects[0].pk, 'title': 'Renamed'}, {'id': 999999, 'title': 'Gone'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses(response), ['valid', 'not_found'])
+        self.assertEqual(Project.objects.get(pk=self.projects[0].pk).title, 'Project 0')
+
+    def test_swapping_excel_ids_conflicts(self):
+        first, second = self.projects[:2]
+        response = self.send('patch', [
+            {'id': first.pk, 'project_id_excel': second.project_id_excel},
+            {'id': second.pk, 'project_id_excel': first.project_id_excel},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            list(Project.objects.filter(pk__in=[first.pk, second.pk]).order_by('pk').values_list('project_id_excel', flat=True)),
+            [first.project_id_excel, second.project_id_excel],
+        )
+
+    def test_delete(self):
+        response = self.send('delete', {'ids': [self.projects[2].pk, 999999]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), ['deleted', 'not_found'])
+        self.assertFalse(Project.objects.filter(pk=self.projects[2].pk).exists())
+        self.assertRollupsRebuilt()
+
+    def test_malformed_requests(self):
+        for method, data in (
+            ('post', ['x']),
+            ('post', [{'title': 'Fine', 'status': 'Approved'}, 5]),
+            ('post', {'title': 'Not a list'}),
+            ('patch', [{'id': True, 'title': 'Boolean id'}]),
+            ('patch', [{'id': str(self.projects[0].pk), 'title': 'String id'}]),
+            ('patch', ['x']),
+            ('delete', {'ids': [True]}),
+            ('delete', {'ids': 'all'}),
+        ):
+            with self.subTest(method=method, data=data):
+                self.assertEqual(self.send(method, data).status_code, 400)
+        self.assertEqual(sorted(Project.objects.values_list('title', flat=True)), ['Project 0', 'Project 1', 'Project 2'])
+
+
+# --- Suggestions ---
+
+class SuggestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Kenya', 'Kenya, Uganda', 'South Kenya', 'Somalia', 'Tanzania'):
+            Country.objects.create(name=name)
+        kenya = Country.objects.get(name='Kenya')
+        for index in range(3):
+            Project.objects.create(title=f'Project {index}', status='Approved', country=kenya)
+
+    def names(self, rows):
+        return [row['name'] for row in rows]
+
+    def test_trigram_ranking(self):
+        if not search.trigram_available():
+            self.skipTest('pg_trgm is not installed')
+        rows = search.suggest(Country.objects.all(), 'kenya')
+        # Names starting with the text first, then by similarity
+        self.assertEqual(self.names(rows)[:3], ['Kenya', 'Kenya, Uganda', 'South Kenya'])
+        self.assertTrue(all(isinstance(row['similarity'], float) for row in rows))
+        self.assertEqual(rows[0]['project_count'], 3)
+        # A typo still finds the name through word similarity
+        self.assertIn('Somalia', self.names(search.suggest(Country.objects.all(), 'Somlia')))
+
+    def test_icontains_fallback_without_pg_trgm(self):
+        with mock.patch.dict(search._trigram_available, {connection.alias: False}):
+            rows = search.suggest(Country.objects.all(), 'ken')
+            self.assertEqual(self.names(rows), ['Kenya', 'Kenya, Uganda', 'South Kenya'])
+            self.assertEqual([row['similarity'] for row in rows], [None] * 3)
+            self.assertEqual([row['project_count'] for row in rows], [3, 0, 0])
+            self.assertEqual(search.suggest(Country.objects.all(), 'Somlia'), [])
+
+    def test_endpoint(self):
+        response = self.client.get('/api/countries/suggest/?q=ken&limit=2')
+        self.assertEqual(self.names(response.json()), ['Kenya', 'Kenya, Uganda'])
+        self.assertEqual(self.client.get('/api/countries/suggest/?q=').json(), [])
+        self.assertEqual(self.client.get('/api/countries/suggest/?q=ken&limit=x').status_code, 400)
@@ -1,5 +1,6 @@
 # projects/urls.py
 
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -21,8 +22,28 @@ from .views import (
     ValueByCountryView,
     ValueByLeadOrgView,
     ValueByThemeView,
+    DashboardBundleView,
+    ResponseCacheStatsView,
+    QueryStatsView,
 )
 
+from .async_views import AIInsightStreamView
+
+# Under ASGI (ASYNC_VIEWS, turned on by asgi.py) the summary and dashboard views
+# are served by their async versions, which run independent queries concurrently.
+if settings.ASYNC_VIEWS:
+    from .async_views import (
+        AsyncProjectCountByCountryView as ProjectCountByCountryView,
+        AsyncProjectCountByLeadOrgUnitView as ProjectCountByLeadOrgUnitView,
+        AsyncProjectCountByThemeView as ProjectCountByThemeView,
+        AsyncWorldMapProjectDataView as WorldMapProjectDataView,
+        AsyncDashboardKPIsView as DashboardKPIsView,
+        AsyncValueByCountryView as ValueByCountryView,
+        AsyncValueByLeadOrgView as ValueByLeadOrgView,
+        AsyncValueByThemeView as ValueByThemeView,
+        AsyncDashboardBundleView as DashboardBundleView,
+    )
+
 # Create a router and register viewsets
 router = DefaultRouter()
 # Register the ProjectViewSet
@@ -53,12 +74,19 @@ urlpatterns = [
 
     # --- URL for AI Insights ---
     path('projects/insights/', AIInsightView.as_view(), name='ai-insights'),
+    # Server-sent events while the insight is generated (streams under ASGI)
+    path('projects/insights/stream/', AIInsightStreamView.as_view(), name='ai-insights-stream'),
 
     # --- NEW URLs for Dashboard ---
     path('dashboard/kpis/', DashboardKPIsView.as_view(), name='dashboard-kpis'),
     path('dashboard/value-by-country/', ValueByCountryView.as_view(), name='dashboard-value-by-country'),
     path('dashboard/value-by-lead-org/', ValueByLeadOrgView.as_view(), name='dashboard-value-by-lead-org'),
     path('dashboard/value-by-theme/', ValueByThemeView.as_view(), name='dashboard-value-by-theme'),
+    # Everything above in one request (optionally narrowed with ?sections=)
+    path('dashboard/bundle/', DashboardBundleView.as_view(), name='dashboard-bundle'),
+    path('dashboard/cache-stats/', ResponseCacheStatsView.as_view(), name='dashboard-cache-stats'),
+    # Query counts per endpoint (projects/querybudget.py)
+    path('query-stats/', QueryStatsView.as_view(), name='query-stats'),
 
 
     # --- General Router Include (Must come AFTER more specific paths) ---
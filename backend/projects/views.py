@@ -1,20 +1,29 @@
 # projects/views.py
 
-import os
-import re # Import the regular expression module
-from dotenv import load_dotenv
-
-from django.db.models import Count, Q, Sum # Import Sum for aggregations
+from django.contrib.postgres.aggregates import JSONBAgg
+from django.db.models import Count, F, FloatField, Q, Value
+from django.db.models.functions import Cast, JSONObject
 from django.shortcuts import get_object_or_404
 
 from rest_framework import viewsets, generics, status, filters
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import ParseError
-from rest_framework.pagination import PageNumberPagination
 
+from .bulk import BulkProjectMixin
+from .exporting import ProjectExportMixin
+from .fieldsets import SparseFieldsetMixin
+from .insights import InsightUnavailable, current_insight
+from .pagination import ProjectPagination
+from .readers import FastProjectListMixin
+from .search import ProjectSearchFilter, SuggestMixin
+from .caching import ConditionalGetMixin, cache_response, get_stats as get_cache_stats
+from .querybudget import get_stats as get_query_stats
 # Import your models and serializers
-from .models import Project, Country, LeadOrgUnit, Theme, Donor
+from .models import (
+    Project, Country, LeadOrgUnit, Theme, Donor,
+    CountryRollup, LeadOrgUnitRollup, ThemeRollup, PortfolioRollup,
+)
 from .serializers import (
     ProjectSerializer,
     CountrySerializer,
@@ -28,40 +37,32 @@ from .serializers import (
     # For now, we'll use simple dictionaries or existing serializers if applicable
 )
 
-# --- Environment Variable Loading & AI Configuration ---
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
-    print("Warning: 'google-generativeai' library not found. AI insights will not be available.")
-
-if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found. AI insights will not be available.")
-elif genai:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-    except Exception as e:
-        print(f"Error configuring Gemini API: {e}. AI insights will not be available.")
-        GEMINI_API_KEY = None
-else:
-    print("Warning: GEMINI_API_KEY is set, but 'google-generativeai' library is missing. AI insights cannot be initialized.")
-    GEMINI_API_KEY = None
-
-# --- Standard Pagination Configuration ---
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+def project_list_queryset():
+    """
+    Projects with everything ProjectSerializer reads loaded up front: a fixed number of queries per page.
+    The search document is never serialized, so it isn't loaded either.
+    """
+    return Project.objects.select_related(
+        'country', 'lead_org_unit'
+    ).prefetch_related(
+        'themes', 'donors'
+    ).defer('search_document')
 
 # --- Project ViewSet with Pagination and Filtering ---
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(BulkProjectMixin, ProjectExportMixin, SparseFieldsetMixin, ConditionalGetMixin, FastProjectListMixin, viewsets.ModelViewSet):
+    """
+    Projects; reads take `?fields=` / `?exclude=` to return (and load) only some fields.
+    Batches of creates, partial updates and deletes go to `bulk/` (see projects/bulk.py),
+    full downloads to `export/?format=csv|ndjson` (see projects/exporting.py).
+    """
     serializer_class = ProjectSerializer
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # ETag aggregate, count, page, themes, donors (see projects/querybudget.py)
+    query_budget = 5
+    pagination_class = ProjectPagination # Page numbers, or cursors with ?pagination=cursor
+    # ProjectSearchFilter comes last so it can order by rank when no ?ordering= is given
+    filter_backends = [filters.OrderingFilter, ProjectSearchFilter]
 
+    # Fields covered by Project.search_document (see projects/search.py)
     search_fields = [
         'title',
         'project_id_excel',
@@ -77,171 +78,252 @@ class ProjectViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
 
     def get_queryset(self):
-        return Project.objects.all().select_related(
-            'country', 'lead_org_unit'
-        ).prefetch_related(
-            'themes', 'donors'
-        ).order_by('-created_at')
+        return project_list_queryset().order_by('-created_at')
 
 # --- ViewSets for Related Models ---
 
-class CountryViewSet(viewsets.ReadOnlyModelViewSet):
+class CountryViewSet(SuggestMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Country data.
-    Provides list and retrieve operations.
+    Provides list and retrieve operations, and typeahead suggestions at `suggest/?q=`.
+    Filter with `?classification=single` or `?classification=combined`.
     """
+    query_budget = 3 # ETag aggregate and the list, or the suggestions and their project counts (+1 pg_trgm check per process)
     queryset = Country.objects.all().order_by('name')
     serializer_class = CountrySerializer
 
-class LeadOrgUnitViewSet(viewsets.ReadOnlyModelViewSet):
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        classification = self.request.query_params.get('classification')
+        if classification:
+            valid_classifications = [key for key, value in Country.CLASSIFICATION_CHOICES]
+            if classification not in valid_classifications:
+                raise ParseError(f"Invalid classification: '{classification}'. Valid options are: {', '.join(valid_classifications)}")
+            queryset = queryset.filter(classification=classification)
+        return queryset
+
+class LeadOrgUnitViewSet(SuggestMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Lead Organization Unit data.
-    Provides list and retrieve operations.
+    Provides list and retrieve operations, and typeahead suggestions at `suggest/?q=`.
     """
+    query_budget = 3
     queryset = LeadOrgUnit.objects.all().order_by('name')
     serializer_class = LeadOrgUnitSerializer
 
-class ThemeViewSet(viewsets.ReadOnlyModelViewSet):
+class ThemeViewSet(SuggestMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Theme data.
-    Provides list and retrieve operations.
+    Provides list and retrieve operations, and typeahead suggestions at `suggest/?q=`.
     """
+    query_budget = 3
     queryset = Theme.objects.all().order_by('name')
     serializer_class = ThemeSerializer
 
-class DonorViewSet(viewsets.ReadOnlyModelViewSet):
+class DonorViewSet(SuggestMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Donor data.
-    Provides list and retrieve operations.
+    Provides list and retrieve operations, and typeahead suggestions at `suggest/?q=`.
     """
+    query_budget = 3
     queryset = Donor.objects.all().order_by('name')
     serializer_class = DonorSerializer
 
 
 # --- Custom Filtered List Views (Keep if still needed) ---
-class ProjectsByCountryView(generics.ListAPIView):
+class ProjectsByCountryView(SparseFieldsetMixin, FastProjectListMixin, generics.ListAPIView):
     serializer_class = ProjectSerializer
-    pagination_class = StandardResultsSetPagination
+    query_budget = 5 # Country, count, page, themes, donors
+    pagination_class = ProjectPagination # Page numbers, or cursors with ?pagination=cursor
 
     def get_queryset(self):
         country_name = self.kwargs['country_name']
         country = get_object_or_404(Country, name__iexact=country_name)
-        return Project.objects.filter(country=country).order_by('-created_at')
+        return project_list_queryset().filter(country=country).order_by('-created_at')
 
-class ProjectsByStatusView(generics.ListAPIView):
+class ProjectsByStatusView(SparseFieldsetMixin, FastProjectListMixin, generics.ListAPIView):
     serializer_class = ProjectSerializer
-    pagination_class = StandardResultsSetPagination
+    query_budget = 4 # Count, page, themes, donors
+    pagination_class = ProjectPagination # Page numbers, or cursors with ?pagination=cursor
 
     def get_queryset(self):
         status_key = self.kwargs['status_key']
         valid_status_keys = [key for key, value in Project.STATUS_CHOICES]
         if status_key not in valid_status_keys:
             raise ParseError(f"Invalid status key: '{status_key}'. Valid options are: {', '.join(valid_status_keys)}")
-        return Project.objects.filter(status=status_key).order_by('-created_at')
+        return project_list_queryset().filter(status=status_key).order_by('-created_at')
 
 # --- Dashboard Aggregation Views (Existing and New) ---
+# Each view's queries live in functions of their own, shared with the async
+# versions of these views (projects/async_views.py), which run them concurrently.
+
+def country_project_counts(ordering=('-project_count', 'country__name')):
+    """Project count per country, serialized."""
+    country_counts = Project.objects.filter(
+        country__isnull=False
+    ).values(
+        'country__name'
+    ).annotate(
+        project_count=Count('id')
+    ).order_by(*ordering)
+
+    formatted_data = [
+        {'country_name': item['country__name'], 'project_count': item['project_count']}
+        for item in country_counts
+    ]
+    # Using existing serializer, might need a dedicated one if structure changes
+    return CountryProjectCountSerializer(formatted_data, many=True).data
+
+def lead_org_unit_project_counts():
+    """Project count per lead organization unit, serialized."""
+    org_unit_counts = Project.objects.filter(
+        lead_org_unit__isnull=False
+    ).values(
+        'lead_org_unit__name'
+    ).annotate(
+        project_count=Count('id')
+    ).order_by('-project_count', 'lead_org_unit__name')
+
+    formatted_data = [
+        {'org_unit_name': item['lead_org_unit__name'], 'project_count': item['project_count']}
+        for item in org_unit_counts
+    ]
+    # Using existing serializer
+    return LeadOrgUnitProjectCountSerializer(formatted_data, many=True).data
+
+def theme_project_counts():
+    """Project count per theme, serialized."""
+    theme_counts = Theme.objects.filter(
+        projects__isnull=False
+    ).annotate(
+        project_count=Count('projects')
+    ).values(
+        'name', 'project_count'
+    ).order_by('-project_count', 'name')
+
+    # Using existing serializer
+    return ThemeProjectCountSerializer(theme_counts, many=True).data
 
 class ProjectCountByCountryView(APIView):
     """Aggregates project counts by country."""
+    query_budget = 1
+    @cache_response
     def get(self, request, *args, **kwargs):
-        country_counts = Project.objects.filter(
-            country__isnull=False
-        ).values(
-            'country__name'
-        ).annotate(
-            project_count=Count('id')
-        ).order_by('-project_count', 'country__name')
-
-        formatted_data = [
-            {'country_name': item['country__name'], 'project_count': item['project_count']}
-            for item in country_counts
-        ]
-        # Using existing serializer, might need a dedicated one if structure changes
-        serializer = CountryProjectCountSerializer(formatted_data, many=True)
-        return Response(serializer.data)
+        return Response(country_project_counts())
 
 class ProjectCountByLeadOrgUnitView(APIView):
     """Aggregates project counts by lead organization unit."""
+    query_budget = 1
+    @cache_response
     def get(self, request, *args, **kwargs):
-        org_unit_counts = Project.objects.filter(
-            lead_org_unit__isnull=False
-        ).values(
-            'lead_org_unit__name'
-        ).annotate(
-            project_count=Count('id')
-        ).order_by('-project_count', 'lead_org_unit__name')
-
-        formatted_data = [
-            {'org_unit_name': item['lead_org_unit__name'], 'project_count': item['project_count']}
-            for item in org_unit_counts
-        ]
-        # Using existing serializer
-        serializer = LeadOrgUnitProjectCountSerializer(formatted_data, many=True)
-        return Response(serializer.data)
+        return Response(lead_org_unit_project_counts())
 
 class ProjectCountByThemeView(APIView):
     """Aggregates project counts by theme."""
+    query_budget = 1
+    @cache_response
     def get(self, request, *args, **kwargs):
-        theme_counts = Theme.objects.filter(
-            projects__isnull=False
-        ).annotate(
-            project_count=Count('projects')
-        ).values(
-            'name', 'project_count'
-        ).order_by('-project_count', 'name')
-
-        # Using existing serializer
-        serializer = ThemeProjectCountSerializer(theme_counts, many=True)
-        return Response(serializer.data)
+        return Response(theme_project_counts())
 
 class WorldMapProjectDataView(APIView):
      """Provides data for the world map (project count by country)."""
+     query_budget = 1
      # This view is similar to ProjectCountByCountryView, keeping for clarity
+     @cache_response
      def get(self, request, *args, **kwargs):
-         country_counts = Project.objects.filter(
-             country__isnull=False
-         ).values(
-             'country__name'
-         ).annotate(
-             project_count=Count('id')
-         ).order_by('country__name')
-
-         formatted_data = [
-             {'country_name': item['country__name'], 'project_count': item['project_count']}
-             for item in country_counts
-         ]
-         # Using existing serializer
-         serializer = CountryProjectCountSerializer(formatted_data, many=True)
-         return Response(serializer.data)
+         return Response(country_project_counts(ordering=('country__name',)))
+
+# --- Dashboard payload helpers (shared by the single views, the bundle and the async views) ---
+
+# Rollup tables behind the three KPI unique counts, in kpis_payload() order
+KPI_COUNT_ROLLUPS = [CountryRollup, LeadOrgUnitRollup, ThemeRollup]
+
+def portfolio_totals():
+    """Totals over all projects (the row is missing until the first project or rebuild_rollups)."""
+    return PortfolioRollup.objects.filter(pk=PortfolioRollup.GLOBAL_PK).first() or PortfolioRollup()
+
+def active_count(rollup_model):
+    """Rows of a rollup table with at least one project, e.g. the countries with active projects."""
+    return rollup_model.objects.filter(project_count__gt=0).count()
+
+def kpis_payload(totals, unique_countries_count, unique_lead_org_units_count, unique_themes_count):
+    """KPI dictionary from the PortfolioRollup row and the unique counts."""
+    return {
+        'total_projects_count': totals.project_count,
+        'total_pag_value': float(totals.pag_value), # Ensure float for JSON serialization
+        'total_expenditure': float(totals.total_expenditure), # Ensure float
+        'total_contribution': float(totals.total_contribution), # Ensure float
+        # Calculate financial health (Total Contribution - Total Expenditure)
+        'overall_financial_health': float(totals.total_contribution - totals.total_expenditure), # Ensure float
+        'unique_countries_count': unique_countries_count,
+        'unique_lead_org_units_count': unique_lead_org_units_count,
+        'unique_themes_count': unique_themes_count,
+    }
+
+def country_values_payload(values_by_classification):
+    """Both country lists of the value-by-country response, from {classification: [{'name', 'value'}, ...]}."""
+    # Return an object containing both lists
+    return {
+        'single_countries_data': values_by_classification.get(Country.SINGLE, []),
+        'combined_data': values_by_classification.get(Country.COMBINED, []),
+    }
+
+def value_by_country_data():
+    # Countries with at least one project that has a PAG value, from the rollup table, one row
+    # (and one JSON list) per stored classification (single vs combined/regional/global)
+    country_values = CountryRollup.objects.filter(
+        pag_value_count__gt=0
+    ).values(
+        'country__classification'
+    ).annotate(
+        # Use 'name' and 'value' keys for consistency with charting components
+        items=JSONBAgg(
+            JSONObject(name='country__name', value=Cast('pag_value', FloatField())),
+            ordering=('-pag_value', 'country__name'),
+        )
+    ).order_by()
+
+    return country_values_payload(
+        {row['country__classification']: row['items'] for row in country_values}
+    )
+
+def value_by_lead_org_data():
+    org_unit_values = LeadOrgUnitRollup.objects.filter(
+        pag_value_count__gt=0
+    ).values(
+        'lead_org_unit__name', total_pag_value=F('pag_value')
+    ).order_by('-total_pag_value', 'lead_org_unit__name')
+
+    return [
+        {'name': item['lead_org_unit__name'], 'value': float(item['total_pag_value'] or 0)} # Use 'name' and 'value' for consistency, ensure 0 if sum is None
+        for item in org_unit_values
+    ]
+
+def value_by_theme_data():
+    theme_values = ThemeRollup.objects.filter(
+         pag_value_count__gt=0 # Themes linked to projects with PAG value
+    ).values(
+         name=F('theme__name'), total_pag_value=F('pag_value')
+    ).order_by('-total_pag_value', 'name')
+
+    # Format data for response
+    return [
+         {'name': item['name'], 'value': float(item['total_pag_value'] or 0)} # Use 'name' and 'value' for consistency, ensure 0 if sum is None
+         for item in theme_values
+    ]
 
 # --- NEW Dashboard KPI View ---
 class DashboardKPIsView(APIView):
-    """Provides key performance indicators for the dashboard."""
+    """Provides key performance indicators for the dashboard, read from the rollup tables."""
+    query_budget = 4 # Rollup totals and the three unique counts
+    @cache_response
     def get(self, request, *args, **kwargs):
-        # Calculate total counts and sums
-        total_projects_count = Project.objects.count()
-        total_pag_value = Project.objects.aggregate(Sum('pag_value'))['pag_value__sum'] or 0
-        total_expenditure = Project.objects.aggregate(Sum('total_expenditure'))['total_expenditure__sum'] or 0
-        total_contribution = Project.objects.aggregate(Sum('total_contribution'))['total_contribution__sum'] or 0 # Assuming total_contribution exists
-        # Calculate financial health (Total Contribution - Total Expenditure)
-        overall_financial_health = total_contribution - total_expenditure
+        totals = portfolio_totals()
 
         # Calculate unique counts for related models with active projects
-        unique_countries_count = Project.objects.filter(country__isnull=False).values('country').distinct().count()
-        unique_lead_org_units_count = Project.objects.filter(lead_org_unit__isnull=False).values('lead_org_unit').distinct().count()
-        unique_themes_count = Project.objects.filter(themes__isnull=False).values('themes').distinct().count()
-
-
-        kpis_data = {
-            'total_projects_count': total_projects_count,
-            'total_pag_value': float(total_pag_value), # Ensure float for JSON serialization
-            'total_expenditure': float(total_expenditure), # Ensure float
-            'total_contribution': float(total_contribution), # Ensure float
-            'overall_financial_health': float(overall_financial_health), # Ensure float
-            'unique_countries_count': unique_countries_count,
-            'unique_lead_org_units_count': unique_lead_org_units_count,
-            'unique_themes_count': unique_themes_count,
-        }
+        unique_counts = [active_count(rollup_model) for rollup_model in KPI_COUNT_ROLLUPS]
+
+        kpis_data = kpis_payload(totals, *unique_counts)
 
         # No specific serializer needed for this simple dictionary response
         return Response(kpis_data, status=status.HTTP_200_OK)
@@ -249,157 +331,149 @@ class DashboardKPIsView(APIView):
 # --- NEW Dashboard Value Aggregation Views ---
 class ValueByCountryView(APIView):
     """Aggregates total PAG value by country and splits into single vs combined/regional."""
+    query_budget = 1
+    @cache_response
     def get(self, request, *args, **kwargs):
-        country_values = Project.objects.filter(
-            country__isnull=False,
-            pag_value__isnull=False
-        ).values(
-            'country__name'
-        ).annotate(
-            total_pag_value=Sum('pag_value')
-        ).order_by('-total_pag_value', 'country__name')
-
-        single_countries_data = []
-        combined_data = []
-
-        # Define patterns to identify combined/regional/global entries (case-insensitive)
-        # Added a pattern for "United Nations Organization" as it's also a non-geographic entity
-        combined_patterns = [
-            r'GLOBAL',
-            r'Regional',
-            r',', # Assuming entries with commas are multi-country
-            r'United Nations Organization' # Added pattern for this specific entry
-        ]
-
-        for item in country_values:
-            country_name = item['country__name']
-            total_pag_value = float(item['total_pag_value'] or 0) # Ensure 0 if sum is None
-
-            # Check if the country name matches any combined pattern using re.search
-            is_combined = any(re.search(pattern, country_name, re.IGNORECASE) for pattern in combined_patterns)
-
-            if is_combined:
-                # Use 'name' and 'value' keys for consistency with charting components
-                combined_data.append({'name': country_name, 'value': total_pag_value})
-            else:
-                # Use 'name' and 'value' keys for consistency with charting components
-                single_countries_data.append({'name': country_name, 'value': total_pag_value})
-
-        # Return an object containing both lists
-        return Response({
-            'single_countries_data': single_countries_data,
-            'combined_data': combined_data
-        }, status=status.HTTP_200_OK)
+        return Response(value_by_country_data(), status=status.HTTP_200_OK)
 
 
 class ValueByLeadOrgView(APIView):
     """Aggregates total PAG value by lead organization unit."""
+    query_budget = 1
+    @cache_response
     def get(self, request, *args, **kwargs):
-        org_unit_values = Project.objects.filter(
-            lead_org_unit__isnull=False,
-            pag_value__isnull=False
-        ).values(
-            'lead_org_unit__name'
-        ).annotate(
-            total_pag_value=Sum('pag_value')
-        ).order_by('-total_pag_value', 'lead_org_unit__name')
-
-        formatted_data = [
-            {'name': item['lead_org_unit__name'], 'value': float(item['total_pag_value'] or 0)} # Use 'name' and 'value' for consistency, ensure 0 if sum is None
-            for item in org_unit_values
-        ]
-        return Response(formatted_data, status=status.HTTP_200_OK)
+        return Response(value_by_lead_org_data(), status=status.HTTP_200_OK)
 
 class ValueByThemeView(APIView):
     """Aggregates total PAG value by theme."""
+    query_budget = 1
+    @cache_response
+    def get(self, request, *args, **kwargs):
+        return Response(value_by_theme_data(), status=status.HTTP_200_OK)
+
+
+# --- Dashboard Bundle View ---
+class DashboardBundleView(APIView):
+    """
+    Everything the dashboard's first paint needs in one response:
+    the KPIs and the three value series, optionally narrowed with
+    `?sections=kpis,value_by_country,value_by_lead_org,value_by_theme`.
+
+    Two queries at most: the PortfolioRollup row for the KPI totals, and one
+    UNION over the country/lead org/theme rollups that feeds both the unique
+    counts and the chart series.
+    """
+    query_budget = 2 # Rollup UNION and the totals row
+    SECTIONS = ['kpis', 'value_by_country', 'value_by_lead_org', 'value_by_theme']
+    # Rollup table, name field and section for each dimension of the UNION query
+    DIMENSIONS = {
+        'country': (CountryRollup, 'country__name', 'value_by_country'),
+        'lead_org_unit': (LeadOrgUnitRollup, 'lead_org_unit__name', 'value_by_lead_org'),
+        'theme': (ThemeRollup, 'theme__name', 'value_by_theme'),
+    }
+
+    @cache_response
     def get(self, request, *args, **kwargs):
-        theme_values = Theme.objects.filter(
-             projects__pag_value__isnull=False # Filter themes linked to projects with PAG value
-        ).annotate(
-             total_pag_value=Sum('projects__pag_value')
-        ).values(
-             'name', 'total_pag_value'
-        ).order_by('-total_pag_value', 'name')
-
-        # Format data for response
-        formatted_data = [
-             {'name': item['name'], 'value': float(item['total_pag_value'] or 0)} # Use 'name' and 'value' for consistency, ensure 0 if sum is None
-             for item in theme_values
+        sections = self.get_sections(request)
+        dimensions = self.get_dimensions(sections)
+        rows = list(self.rollup_rows(dimensions))
+        totals = portfolio_totals() if 'kpis' in sections else None
+        return Response(self.build(sections, dimensions, rows, totals), status=status.HTTP_200_OK)
+
+    def get_sections(self, request):
+        """Sections named in `?sections=` (comma-separated), or all of them."""
+        param = request.query_params.get('sections')
+        if not param:
+            return set(self.SECTIONS)
+        sections = {section.strip() for section in param.split(',') if section.strip()}
+        invalid = sections - set(self.SECTIONS)
+        if invalid:
+            raise ParseError(f"Invalid sections: {', '.join(sorted(invalid))}. Valid options are: {', '.join(self.SECTIONS)}")
+        return sections
+
+    def get_dimensions(self, sections):
+        # The KPI unique counts need all three dimensions, each chart only its own.
+        return [
+            dimension for dimension, (_, _, section) in self.DIMENSIONS.items()
+            if 'kpis' in sections or section in sections
         ]
-        return Response(formatted_data, status=status.HTTP_200_OK)
+
+    def rollup_rows(self, dimensions):
+        """Rollup rows with at least one project for the given dimensions, in a single query."""
+        querysets = [
+            model.objects.filter(project_count__gt=0).values(
+                'project_count', 'pag_value_count', 'pag_value',
+                dimension=Value(dimension), name=F(name_field),
+                # Only countries are classified
+                classification=F('country__classification') if dimension == 'country' else Value(''),
+            )
+            for dimension, (model, name_field, _) in self.DIMENSIONS.items() if dimension in dimensions
+        ]
+        if not querysets:
+            return []
+        queryset = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+        return queryset.order_by('dimension', '-pag_value', 'name')
+
+    def build(self, sections, dimensions, rollup_rows, totals):
+        """The response data from the rollup rows and (for the KPIs) the totals row."""
+        rows = {dimension: [] for dimension in dimensions}
+        for row in rollup_rows:
+            rows[row['dimension']].append(row)
+
+        def series(dimension):
+            # Same filter and order as the single ValueBy* views
+            return [
+                {'name': row['name'], 'value': float(row['pag_value'])}
+                for row in rows[dimension] if row['pag_value_count'] > 0
+            ]
+
+        data = {}
+        if 'kpis' in sections:
+            data['kpis'] = kpis_payload(totals, *(
+                sum(1 for row in rows[dimension] if row['project_count'] > 0)
+                for dimension in ('country', 'lead_org_unit', 'theme')
+            ))
+        if 'value_by_country' in sections:
+            by_classification = {}
+            for row in rows['country']:
+                if row['pag_value_count'] > 0:
+                    by_classification.setdefault(row['classification'], []).append(
+                        {'name': row['name'], 'value': float(row['pag_value'])}
+                    )
+            data['value_by_country'] = country_values_payload(by_classification)
+        if 'value_by_lead_org' in sections:
+            data['value_by_lead_org'] = series('lead_org_unit')
+        if 'value_by_theme' in sections:
+            data['value_by_theme'] = series('theme')
+        return data
+
+
+class ResponseCacheStatsView(APIView):
+    """Hit/miss counters of the summary and dashboard response cache."""
+    def get(self, request, *args, **kwargs):
+        return Response(get_cache_stats(), status=status.HTTP_200_OK)
+
+
+class QueryStatsView(APIView):
+    """Per-endpoint query counts of this process (see projects/querybudget.py)."""
+    def get(self, request, *args, **kwargs):
+        return Response(get_query_stats(), status=status.HTTP_200_OK)
 
 
 # --- AI Insights View ---
 class AIInsightView(APIView):
-    """Provides AI-generated insights based on project data."""
+    """
+    Provides AI-generated insights based on project data. The stored insight is served
+    right away and regenerated in the background when the figures change or it expires
+    (see projects/insights.py); while the first one is generated the response is a 202.
+    """
+    query_budget = 3 # Portfolio totals, top countries, top themes
     def get(self, request, *args, **kwargs):
-        if not GEMINI_API_KEY or not genai:
-            return Response(
-                {"error": "AI service is not configured or unavailable."},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
-            )
-
         try:
-            # Fetch data for AI prompt
-            country_counts = Project.objects.filter(country__isnull=False).values('country__name').annotate(project_count=Count('id')).order_by('-project_count')[:10]
-            theme_counts = Theme.objects.filter(projects__isnull=False).annotate(project_count=Count('projects')).values('name', 'project_count').order_by('-project_count')[:10]
-            total_projects_count = Project.objects.count()
-            total_pag_value = Project.objects.aggregate(Sum('pag_value'))['pag_value__sum'] or 0
-
-
-            country_list_str = "\n".join([f"- {item['country__name']}: {item['project_count']} projects" for item in country_counts]) if country_counts else "No data available for top countries."
-            theme_list_str = "\n".join([f"- {item['name']}: {item['project_count']} projects" for item in theme_counts]) if theme_counts else "No data available for top themes."
-
-            prompt_text = f"""
-Analyze the following project data from UN-Habitat and provide a concise summary of key insights and trends.
-
-Overall Project Count: {total_projects_count}
-Total PAG Value: {total_pag_value}
-
-Top 10 Countries by Project Count:
-{country_list_str}
-
-Top 10 Themes by Project Count:
-{theme_list_str}
-
-Based on this data, highlight:
-- The overall scale of the project portfolio and total value.
-- Key geographic areas of focus.
-- Dominant thematic areas.
-- Any notable patterns or observations.
-
-Keep the summary concise and easy to understand, suitable for a dashboard display.
-"""
-            model_name = 'gemini-1.5-flash'
-            try:
-                # Optional: Verify model availability (can be slow, often removed in production)
-                # list(genai.list_models()) # This line is commented out for performance
-                pass
-            except Exception as list_model_err:
-                print(f"Could not list models to verify {model_name}: {list_model_err}")
-
-
-            model = genai.GenerativeModel(model_name)
-            # Use generate_content directly
-            response = model.generate_content(prompt_text)
-
-
-            if response and hasattr(response, 'text') and response.text:
-                ai_insight = response.text
-            elif response and response.candidates and response.candidates[0].content.parts[0].text:
-                ai_insight = response.candidates[0].content.parts[0].text
-            else:
-                print("Gemini API returned an empty or improperly structured response.")
-                return Response(
-                    {"error": "AI service returned no insight. Content may be blocked or response structure unexpected."},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-
-            return Response({"insight": ai_insight}, status=status.HTTP_200_OK)
-
-        except Exception as e:
-            print(f"An error occurred in AIInsightView: {e}")
-            return Response(
-                {"error": f"An error occurred while processing AI insights: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            data, status_code = current_insight()
+        except InsightUnavailable as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response = Response(data, status=status_code)
+        if status_code == status.HTTP_202_ACCEPTED:
+            response['Retry-After'] = '5'
+        return response
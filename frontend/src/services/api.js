@@ -39,6 +39,16 @@ export default {
     deleteProject(id) {
         return apiClient.delete(`/projects/${id}/`);
     },
+    // Batches: all-or-nothing, one result per item ({ index, status, id?, errors? })
+    bulkCreateProjects(items) {
+        return apiClient.post('/projects/bulk/', items);
+    },
+    bulkUpdateProjects(items) { // Each item: { id, ...fields to change }
+        return apiClient.patch('/projects/bulk/', items);
+    },
+    bulkDeleteProjects(ids) {
+        return apiClient.delete('/projects/bulk/', { data: { ids } });
+    },
 
     // Endpoints for related data (for forms, filters, etc.)
     getCountries() {
@@ -54,6 +64,16 @@ export default {
         return apiClient.get('/donors/');
     },
 
+    /**
+     * Typeahead suggestions for a lookup table, best matches first.
+     * `lookup` is 'countries', 'lead-org-units', 'themes' or 'donors'.
+     * Resolves to [{ id, name, similarity, project_count }, ...] (at most `limit`).
+     */
+    async suggestLookup(lookup, q, limit = 10) {
+        const response = await apiClient.get(`/${lookup}/suggest/`, { params: { q, limit } });
+        return response.data;
+    },
+
     // Custom API endpoints from Django
     getProjectsByCountry(countryName, params = {}) {
         return apiClient.get(`/projects/country/${encodeURIComponent(countryName)}/`, { params });
@@ -64,6 +84,23 @@ export default {
 
     // --- Dashboard Specific Endpoints ---
 
+    /**
+     * Fetches the KPIs and all dashboard chart series in a single request.
+     * Corresponds to the /api/dashboard/bundle/ endpoint.
+     * Pass a list of section names (e.g. ['kpis', 'value_by_theme']) to fetch only those.
+     * Returns an object like { kpis: {}, value_by_country: {}, value_by_lead_org: [], value_by_theme: [] }
+     */
+    async getDashboardBundle(sections = null) {
+      try {
+        const params = sections ? { sections: sections.join(',') } : {};
+        const response = await apiClient.get('/dashboard/bundle/', { params });
+        return response.data;
+      } catch (error) {
+        console.error('Error fetching dashboard bundle:', error);
+        throw error;
+      }
+    },
+
     /**
      * Fetches Key Performance Indicators (KPIs) for the dashboard.
      * Corresponds to the /api/dashboard/kpis/ endpoint.
@@ -141,5 +178,29 @@ export default {
       }
     },
 
+    /**
+     * Streams the AI insight while it is generated (server-sent events).
+     * Corresponds to the /api/projects/insights/stream/ endpoint.
+     * onChunk(text) gets each piece of text, onDone(payload) the complete insight
+     * (as from getAIInsights) and onError(message) a failure.
+     * Returns the EventSource; call close() on it to cancel the generation.
+     */
+    streamAIInsights({ onChunk, onDone, onError } = {}) {
+      const source = new EventSource(`${apiClient.defaults.baseURL}/projects/insights/stream/`);
+      source.addEventListener('chunk', (event) => onChunk && onChunk(JSON.parse(event.data).text));
+      source.addEventListener('done', (event) => {
+        source.close();
+        if (onDone) onDone(JSON.parse(event.data));
+      });
+      source.addEventListener('error', (event) => {
+        // Server 'error' events carry data; connection errors don't
+        source.close();
+        const message = event.data ? JSON.parse(event.data).error : 'Connection to the AI insight stream failed.';
+        console.error('Error streaming AI insights:', message);
+        if (onError) onError(message);
+      });
+      return source;
+    },
+
     // Add other specific API calls as needed
 };